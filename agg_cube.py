@@ -0,0 +1,247 @@
+# agg_cube.py
+"""
+Materialized dropout cube in SQLite for slice-and-dice questions.
+
+cubo_abandono holds one row per combination of
+    semestre × plantel × alcaldia × colonia × sexo × beca × apoyo_tutoria
+with n, sum(abandono), sum(promedio), sum(asistencia_pct). Rates and means
+are sums / n, so any coarser slice is a SUM over cube rows. Missing
+dimension values are stored as '' (text) / -1 (flags) so the key never has
+NULLs.
+
+cubo_abandono_alc is the same cube rolled up over colonia (a few thousand
+cells); slices that neither filter nor group by colonia are answered from it.
+
+The cube is maintained incrementally: cubo_meta keeps the last
+inscripciones rowid already counted. update_cube() aggregates only newer
+rows and upserts them into both tables (ON CONFLICT … DO UPDATE adds to
+the cell). It rebuilds from scratch only when rows at or below the
+watermark changed (e.g. the generator recreated the table).
+
+    python agg_cube.py                                   # update + example
+    python agg_cube.py --slice semestre=2 sexo=F alcaldia=IZTAPALAPA beca=1
+    python agg_cube.py --slice sexo=F --by semestre
+"""
+import time, argparse
+import pandas as pd
+
+from db import get_connection
+
+DB_PATH = "unrc.db"
+CUBE = "cubo_abandono"
+META = "cubo_meta"
+
+DIMS = ["semestre","plantel","alcaldia","colonia","sexo","beca","apoyo_tutoria"]
+# materialized tables -> their dimensions (finest first)
+TABLES = {
+    CUBE: DIMS,
+    CUBE + "_alc": [d for d in DIMS if d != "colonia"],
+}
+TEXT_DIMS = {"plantel","alcaldia","colonia","sexo"}
+MEASURES = ["n","sum_abandono","sum_promedio","sum_asistencia"]
+
+# indexes for the usual slices (the primary key covers semestre-first lookups);
+# the measures ride along so a slice never has to visit the table itself.
+# Each sits on the table _query() answers that slice from: only colonia
+# slices read the full cube, everything else reads the rollup.
+INDEXES = {
+    "ix_cubo_colonia": (CUBE, ["colonia","alcaldia"]),
+    "ix_cubo_alc_alcaldia": (CUBE + "_alc", ["alcaldia","sexo","beca","semestre"]),
+    "ix_cubo_alc_plantel": (CUBE + "_alc", ["plantel","semestre"]),
+    "ix_cubo_alc_sexo": (CUBE + "_alc", ["sexo","beca","apoyo_tutoria"]),
+}
+# earlier releases built these on cubo_abandono, where no slice used them
+STALE_INDEXES = ["ix_cubo_alc", "ix_cubo_plantel", "ix_cubo_sexo"]
+
+
+def _columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _dim_exprs(conn):
+    """SELECT expressions for each dimension given the students_raw schema in this DB."""
+    s_cols = _columns(conn, "students_raw")
+    i_cols = _columns(conn, "inscripciones")
+
+    def text(*cands):
+        for c in cands:
+            if c in s_cols:
+                return f"COALESCE(s.{c}, '')"
+        return "''"
+
+    def flag(c):
+        return f"COALESCE(i.{c}, -1)" if c in i_cols else "-1"
+
+    return {
+        "semestre": "i.semestre",
+        "plantel": text("plantel"),
+        "alcaldia": text("alcaldia", "alcaldia_residencia"),
+        "colonia": text("colonia_residencia", "colonia"),
+        "sexo": text("sexo"),
+        "beca": flag("beca"),
+        "apoyo_tutoria": flag("apoyo_tutoria"),
+    }
+
+
+def create_cube(conn):
+    for table, dims in TABLES.items():
+        cols = ",\n    ".join(f"{d} {'TEXT' if d in TEXT_DIMS else 'INTEGER'} NOT NULL" for d in dims)
+        conn.execute(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    {cols},
+    n INTEGER NOT NULL,
+    sum_abandono INTEGER NOT NULL,
+    sum_promedio REAL NOT NULL,
+    sum_asistencia REAL NOT NULL,
+    PRIMARY KEY ({", ".join(dims)})
+) WITHOUT ROWID""")
+    conn.executescript(f"""
+CREATE TABLE IF NOT EXISTS {META} (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    max_rowid INTEGER NOT NULL,
+    n_rows INTEGER NOT NULL,
+    updated TEXT
+);
+""")
+    for name in STALE_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for name, (table, cols) in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(cols + MEASURES)})")
+
+
+def _watermark(conn):
+    row = conn.execute(f"SELECT max_rowid, n_rows FROM {META} WHERE id = 1").fetchone()
+    return row or (0, 0)
+
+
+def update_cube(conn, rebuild=False):
+    """Fold inscripciones rows past the watermark into the cube; returns rows added."""
+    create_cube(conn)
+    max_rowid, n_rows = _watermark(conn)
+    if not rebuild and max_rowid:
+        # rows already counted must still be there, unchanged in number
+        seen = conn.execute("SELECT COUNT(*) FROM inscripciones WHERE rowid <= ?", (max_rowid,)).fetchone()[0]
+        rebuild = seen != n_rows
+    if rebuild:
+        for table in TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        max_rowid, n_rows = 0, 0
+
+    new_max, new_n = conn.execute(
+        "SELECT COALESCE(MAX(rowid), 0), COUNT(*) FROM inscripciones WHERE rowid > ?", (max_rowid,)
+    ).fetchone()
+    if new_n == 0:
+        return 0
+
+    ex = _dim_exprs(conn)
+    conflict = ", ".join(f"{m} = {m} + excluded.{m}" for m in MEASURES)
+    with conn:
+        # new rows aggregated once at the finest grain, then upserted into every table
+        conn.execute("DROP TABLE IF EXISTS temp.cubo_delta")
+        conn.execute(f"""
+CREATE TEMP TABLE cubo_delta AS
+SELECT {", ".join(f"{ex[d]} AS {d}" for d in DIMS)},
+       COUNT(*) AS n, SUM(i.abandono) AS sum_abandono,
+       SUM(i.promedio) AS sum_promedio, SUM(i.asistencia_pct) AS sum_asistencia
+FROM inscripciones i
+LEFT JOIN students_raw s ON s.student_id = i.student_id
+WHERE i.rowid > ? AND i.rowid <= ?
+GROUP BY {", ".join(str(k + 1) for k in range(len(DIMS)))}
+""", (max_rowid, new_max))
+        for table, dims in TABLES.items():
+            conn.execute(f"""
+INSERT INTO {table} ({", ".join(dims + MEASURES)})
+SELECT {", ".join(dims)}, {", ".join(f"SUM({m})" for m in MEASURES)}
+FROM temp.cubo_delta
+GROUP BY {", ".join(dims)}
+ON CONFLICT ({", ".join(dims)}) DO UPDATE SET {conflict}
+""")
+        conn.execute("DROP TABLE temp.cubo_delta")
+        conn.execute(f"""
+INSERT INTO {META} (id, max_rowid, n_rows, updated) VALUES (1, ?, ?, datetime('now'))
+ON CONFLICT (id) DO UPDATE SET max_rowid = excluded.max_rowid,
+    n_rows = excluded.n_rows, updated = excluded.updated
+""", (new_max, n_rows + new_n))
+    # planner statistics, so slices pick the matching index; only the cube tables
+    # (a bare ANALYZE would rescan inscripciones and all its indexes on every delta)
+    for table in TABLES:
+        conn.execute(f"ANALYZE {table}")
+    return new_n
+
+
+def _query(conn, by, filters):
+    unknown = [c for c in list(by) + list(filters) if c not in DIMS]
+    if unknown:
+        raise KeyError(f"not cube dimensions: {unknown}")
+    used = set(by) | set(filters)
+    # coarsest table that still has every dimension the slice touches
+    table = [t for t, dims in TABLES.items() if used <= set(dims)][-1]
+    where, params = [], []
+    for col, v in filters.items():
+        if isinstance(v, (list, tuple, set)):
+            where.append(f"{col} IN ({', '.join('?' * len(v))})")
+            params += list(v)
+        else:
+            where.append(f"{col} = ?")
+            params.append(v)
+    sql = (f"SELECT {''.join(c + ', ' for c in by)}SUM(n), SUM(sum_abandono), "
+           f"SUM(sum_promedio), SUM(sum_asistencia) FROM {table}"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + (f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else ""))
+    return conn.execute(sql, params).fetchall()
+
+
+def slice_rate(conn, **filters):
+    """Single slice as a dict (no pandas), e.g. slice_rate(conn, semestre=2, sexo="F", beca=1)."""
+    n, s_ab, s_pr, s_as = _query(conn, [], filters)[0]
+    if not n:
+        return {"n": 0, "abandono": None, "promedio": None, "asistencia_pct": None}
+    return {"n": n, "abandono": s_ab / n, "promedio": s_pr / n, "asistencia_pct": s_as / n}
+
+
+def slice_cube(conn, by=(), **filters):
+    """
+    Dropout rate and means for a slice, e.g.
+        slice_cube(conn, semestre=2, sexo="F", alcaldia="IZTAPALAPA", beca=1)
+        slice_cube(conn, by=["semestre"], plantel="URC Sur")
+    Filters may be a value or a list of values.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    rows = _query(conn, by, filters)
+    df = pd.DataFrame(rows, columns=by + ["n","sum_abandono","sum_promedio","sum_asistencia"])
+    df["n"] = df["n"].fillna(0).astype(int)
+    nz = df["n"].where(df["n"] > 0)
+    df["abandono"] = df["sum_abandono"] / nz
+    df["promedio"] = df["sum_promedio"] / nz
+    df["asistencia_pct"] = df["sum_asistencia"] / nz
+    return df[by + ["n","abandono","promedio","asistencia_pct"]]
+
+
+def _parse_filters(items):
+    out = {}
+    for it in items or []:
+        k, v = it.split("=", 1)
+        out[k] = int(v) if k not in TEXT_DIMS else v
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--rebuild", action="store_true")
+    ap.add_argument("--slice", nargs="*", metavar="DIM=VALUE")
+    ap.add_argument("--by", nargs="*", default=[])
+    args = ap.parse_args()
+
+    conn = get_connection(args.db, readonly=False)     # the cube lives in the DB
+    t0 = time.perf_counter()
+    added = update_cube(conn, rebuild=args.rebuild)
+    n_cells = conn.execute(f"SELECT COUNT(*) FROM {CUBE}").fetchone()[0]
+    print(f"✅ {CUBE}: +{added:,} inscripciones in {time.perf_counter()-t0:.2f}s ({n_cells:,} cells)")
+
+    filters = _parse_filters(args.slice) if args.slice is not None else {"semestre": 2, "sexo": "F", "beca": 1}
+    t0 = time.perf_counter()
+    res = slice_cube(conn, by=args.by, **filters)
+    dt = time.perf_counter() - t0
+    print(f"{filters} by {args.by or '—'}  ({dt*1000:.2f} ms)")
+    print(res.round(4).to_string(index=False))
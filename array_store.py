@@ -0,0 +1,188 @@
+# array_store.py
+"""
+Binary store for the session-level attendance / evaluation matrices.
+
+gen_asist_eval1.py writes one xlsx per subject and group, and each one
+repeats the matrícula and name columns next to int64 DataFrames of 0/1 and
+5–10 values. The store keeps each measure once, as a dense int8 .npy opened
+memory-mapped:
+
+    asistencia.npy     int8  students × subjects × sessions     1/0, -1 = no data
+    evaluaciones.npy   int8  students × subjects × evaluations  5–10, -1 = no data
+    matricula.npy      int32 students
+    grupo.npy          int16 students (code into meta.json "groups")
+    inscrito.npy       bool  students × subjects
+    nombres.json       one name per student
+    meta.json          subjects, groups, shapes
+
+-1 marks a subject the student is not enrolled in, or a session or
+evaluation that has not happened yet (NaN in SessionCube). A 100k-student
+term with 6 subjects, 17 sessions and 10 evaluations is about 17 MB. Rows
+stay in generation order. Lookups by matrícula go through a sorted index,
+and student(), subject() and group() return views of the memmaps, so
+nothing is copied until an analysis asks for floats.
+
+    python array_store.py --from-xlsx asistencia_calificaciones --out asistencia_store
+    python array_store.py --out asistencia_store --matricula 264421512
+"""
+import os, json, argparse
+import numpy as np
+from numpy.lib.format import open_memmap
+
+STORE_DIR = "asistencia_store"
+MISSING = -1
+MEASURES = {"asistencia": "n_sessions", "evaluaciones": "n_evals"}
+
+
+class StoreWriter:
+    """Pre-sized memmaps filled one (group, subject) block at a time."""
+
+    def __init__(self, path, matriculas, grupo, names, subjects, groups, n_sessions, n_evals):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.subjects, self.groups = list(subjects), list(groups)
+        n, j = len(matriculas), len(self.subjects)
+        np.save(os.path.join(path, "matricula.npy"), np.asarray(matriculas, dtype=np.int32))
+        np.save(os.path.join(path, "grupo.npy"), np.asarray(grupo, dtype=np.int16))
+        with open(os.path.join(path, "nombres.json"), "w", encoding="utf-8") as f:
+            json.dump(list(names), f, ensure_ascii=False)
+        self.att = open_memmap(os.path.join(path, "asistencia.npy"), mode="w+",
+                               dtype=np.int8, shape=(n, j, n_sessions))
+        self.ev = open_memmap(os.path.join(path, "evaluaciones.npy"), mode="w+",
+                              dtype=np.int8, shape=(n, j, n_evals))
+        self.enrolled = open_memmap(os.path.join(path, "inscrito.npy"), mode="w+",
+                                    dtype=bool, shape=(n, j))
+        self.att[:] = MISSING
+        self.ev[:] = MISSING
+        self.meta = {"subjects": self.subjects, "groups": self.groups, "students": n,
+                     "n_sessions": n_sessions, "n_evals": n_evals, "missing": MISSING}
+
+    def write(self, rows, subject, attendance, evaluations):
+        """rows: student positions (slice or array); NaN in the blocks is stored as MISSING."""
+        j = self.subjects.index(subject)
+        for dst, src in ((self.att, attendance), (self.ev, evaluations)):
+            src = np.asarray(src, dtype=float)
+            dst[rows, j, :src.shape[1]] = np.where(np.isnan(src), MISSING, src).astype(np.int8)
+        self.enrolled[rows, j] = True
+
+    def close(self):
+        for a in (self.att, self.ev, self.enrolled):
+            a.flush()
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=1)
+        del self.att, self.ev, self.enrolled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrayStore:
+    """Read side: memmapped int8 arrays plus matrícula / group / subject indexes."""
+
+    def __init__(self, path=STORE_DIR, mode="r"):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+        self.attendance = load("asistencia")
+        self.evaluations = load("evaluaciones")
+        self.enrolled = load("inscrito")
+        self.matriculas = np.load(os.path.join(path, "matricula.npy"))
+        self.grupo = np.load(os.path.join(path, "grupo.npy"))
+        self.subjects, self.groups = self.meta["subjects"], self.meta["groups"]
+        self._order = np.argsort(self.matriculas, kind="stable")
+        self._sorted = self.matriculas[self._order]
+
+    def __len__(self):
+        return len(self.matriculas)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.attendance, self.evaluations, self.enrolled,
+                                      self.matriculas, self.grupo))
+
+    @property
+    def names(self):
+        with open(os.path.join(self.path, "nombres.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def rows(self, matriculas):
+        """Row position per matrícula (-1 if not in the store)."""
+        m = np.atleast_1d(np.asarray(matriculas))
+        pos = np.clip(np.searchsorted(self._sorted, m), 0, max(len(self) - 1, 0))
+        return np.where(self._sorted[pos] == m, self._order[pos], -1)
+
+    def student(self, matricula):
+        """(attendance subjects × sessions, evaluations subjects × evals) views of one student."""
+        i = int(self.rows(matricula)[0])
+        if i < 0:
+            raise KeyError(matricula)
+        return self.attendance[i], self.evaluations[i]
+
+    def subject(self, name):
+        """(attendance students × sessions, evaluations students × evals) views of one subject."""
+        j = self.subjects.index(name)
+        return self.attendance[:, j], self.evaluations[:, j]
+
+    def group(self, name):
+        """Row positions of one group (contiguous when written by gen_asist_eval1)."""
+        return np.flatnonzero(self.grupo == self.groups.index(name))
+
+    def to_cube(self, dtype=np.float64):
+        """SessionCube with NaN for MISSING (the one place the arrays are copied)."""
+        from session_features import SessionCube
+        as_float = lambda a: np.where(a == MISSING, np.nan, a).astype(dtype, copy=False)
+        return SessionCube(self.matriculas, self.subjects,
+                           as_float(self.attendance), as_float(self.evaluations))
+
+
+def from_workbooks(directory, path=STORE_DIR):
+    """Convert an asistencia_calificaciones/ directory of xlsx files into a store."""
+    import glob
+    import pandas as pd
+
+    blocks = []
+    for f in sorted(glob.glob(os.path.join(directory, "*.xlsx"))):
+        subject, group = os.path.splitext(os.path.basename(f))[0].rsplit("_", 1)
+        sheets = pd.read_excel(f, sheet_name=["Asistencia", "Evaluaciones"])
+        a = sheets["Asistencia"].set_index("Matricula")
+        e = sheets["Evaluaciones"].set_index("Matricula").drop(columns="Nombre").reindex(a.index)
+        blocks.append((group, subject, a.pop("Nombre"), a.to_numpy(dtype=float), e.to_numpy(dtype=float)))
+    if not blocks:
+        raise FileNotFoundError(f"no workbooks in {directory}/ (run gen_asist_eval1.create_groups)")
+
+    students = pd.concat([pd.DataFrame({"matricula": n.index, "nombre": n.to_numpy(), "grupo": g})
+                          for g, _, n, _, _ in blocks]).drop_duplicates("matricula").reset_index(drop=True)
+    groups = list(dict.fromkeys(students["grupo"]))
+    subjects = list(dict.fromkeys(s for _, s, _, _, _ in blocks))
+    pos = pd.Series(students.index, index=students["matricula"])
+    with StoreWriter(path, students["matricula"], pd.Index(groups).get_indexer(students["grupo"]),
+                     students["nombre"], subjects, groups,
+                     max(b[3].shape[1] for b in blocks), max(b[4].shape[1] for b in blocks)) as w:
+        for _, subject, n, att, ev in blocks:
+            w.write(pos[n.index].to_numpy(), subject, att, ev)
+    return path
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--out", default=STORE_DIR)
+    ap.add_argument("--from-xlsx", metavar="DIR", help="convert gen_asist_eval1 workbooks first")
+    ap.add_argument("--matricula", type=int, help="print one student's rows")
+    args = ap.parse_args()
+
+    if args.from_xlsx:
+        from_workbooks(args.from_xlsx, args.out)
+        print("✅ Saved:", args.out)
+    store = ArrayStore(args.out)
+    print(f"{len(store):,} students × {len(store.subjects)} subjects × "
+          f"{store.meta['n_sessions']} sessions / {store.meta['n_evals']} evaluations, "
+          f"{store.nbytes/1e6:.1f} MB, {len(store.groups)} groups")
+    if args.matricula is not None:
+        att, ev = store.student(args.matricula)
+        for j, s in enumerate(store.subjects):
+            if store.enrolled[store.rows(args.matricula)[0], j]:
+                print(f"{s:<25} asistencia {''.join(map(str, att[j]))}  evaluaciones {ev[j].tolist()}")
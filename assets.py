@@ -0,0 +1,164 @@
+# assets.py
+"""
+Geodata assets: one manifest, one cache, one download path for every script.
+
+Resolution order for an asset:
+  1. URC_ASSET_MIRROR (local mirror dir). When set, the network is never
+     touched: a file missing from the mirror is an error.
+  2. The repo dir and the current dir (files shipped with the repo / left
+     there by older runs).
+  3. The shared cache dir (URC_ASSET_CACHE, default ./data_cache).
+  4. Download into the cache: streamed to a temp file, checksum-verified,
+     then renamed into place, so readers never see a half-written file.
+
+Assets without a pinned sha256 are pinned on first download
+(data_cache/checksums.json) and verified against that afterwards.
+"""
+import os, json, hashlib, tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR  = os.environ.get("URC_ASSET_CACHE", "data_cache")
+MIRROR_DIR = os.environ.get("URC_ASSET_MIRROR")  # e.g. /mnt/urc-mirror for air-gapped runs
+TIMEOUT    = 90
+
+ASSETS = {
+    "colonias": {
+        "file": "catlogo-de-colonias.json",
+        "url": "https://datos.cdmx.gob.mx/dataset/02c6ce99-dbd8-47d8-aee1-ae885a12bb2f/resource/026b42d3-a609-44c7-a83d-22b2150caffc/download/catlogo-de-colonias.json",
+        "sha256": None,
+    },
+    "alcaldias": {
+        # upstream misspells the file name ("alcaldas"); we keep the shipped name
+        "file": "limite-de-las-alcaldias.json",
+        "url": "https://datos.cdmx.gob.mx/dataset/bae265a8-d1f6-4614-b399-4184bc93e027/resource/deb5c583-84e2-4e07-a706-1b3a0dbc99b0/download/limite-de-las-alcaldas.json",
+        "sha256": "c02e3bb3e42281cf874b8e26b68514a7f34189b6209af51e79f7d1a87b0f1285",
+    },
+}
+
+_verified = {}   # path -> (size, mtime) already hashed in this process
+
+
+class AssetError(RuntimeError):
+    pass
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _pins_path():
+    return os.path.join(CACHE_DIR, "checksums.json")
+
+
+def _expected(name):
+    pinned = ASSETS[name]["sha256"]
+    if pinned:
+        return pinned
+    if os.path.exists(_pins_path()):
+        with open(_pins_path()) as f:
+            return json.load(f).get(name)
+    return None
+
+
+def _pin(name, digest):
+    pins = {}
+    if os.path.exists(_pins_path()):
+        with open(_pins_path()) as f:
+            pins = json.load(f)
+    pins[name] = digest
+    _atomic_write(_pins_path(), json.dumps(pins, indent=2, sort_keys=True).encode())
+
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _ok(name, path):
+    """True if `path` exists and matches the expected checksum (if any)."""
+    if not os.path.exists(path):
+        return False
+    st = os.stat(path)
+    if _verified.get(path) == (st.st_size, st.st_mtime):
+        return True
+    expected = _expected(name)
+    if expected and _sha256(path) != expected:
+        print(f"⚠️ Checksum mismatch for {path}, ignoring it")
+        return False
+    _verified[path] = (st.st_size, st.st_mtime)
+    return True
+
+
+def _local(name):
+    """Already-available copy of an asset, or None."""
+    fname = ASSETS[name]["file"]
+    if MIRROR_DIR:
+        path = os.path.join(MIRROR_DIR, fname)
+        if _ok(name, path):
+            return path
+        raise AssetError(f"{fname} not in mirror {MIRROR_DIR} (network disabled while a mirror is set)")
+    for d in (BASE_DIR, os.getcwd(), CACHE_DIR):
+        path = os.path.join(d, fname)
+        if _ok(name, path):
+            return path
+    return None
+
+
+def _download(name):
+    import requests
+
+    spec = ASSETS[name]
+    path = os.path.join(CACHE_DIR, spec["file"])
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    print(f"⬇️ Downloading {spec['file']}")
+
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f, requests.get(spec["url"], timeout=TIMEOUT, stream=True) as r:
+            r.raise_for_status()
+            for block in r.iter_content(1 << 20):
+                h.update(block)
+                f.write(block)
+        digest = h.hexdigest()
+        expected = _expected(name)
+        if expected and digest != expected:
+            raise AssetError(f"{spec['file']}: sha256 {digest} != expected {expected}")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if not expected:
+        _pin(name, digest)
+    print(f"✅ Saved {path}")
+    return path
+
+
+def asset_path(name):
+    """Local path of asset `name`, downloading it into the cache if needed."""
+    return _local(name) or _download(name)
+
+
+def fetch(names=None, max_workers=4):
+    """Resolve several assets at once; missing ones are downloaded concurrently."""
+    names = list(ASSETS) if names is None else list(names)
+    paths = {n: _local(n) for n in names}
+    missing = [n for n, p in paths.items() if p is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+            paths.update(zip(missing, pool.map(_download, missing)))
+    return paths
+
+
+if __name__ == "__main__":
+    for n, p in fetch().items():
+        print(f"{n}: {p}")
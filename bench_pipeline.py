@@ -0,0 +1,202 @@
+# bench_pipeline.py
+"""
+Benchmark of the pipeline stages at several cohort sizes.
+
+Each size runs in a fresh process (so one size's memory does not leak into
+the next) and every stage records wall time, peak RSS and rows/sec. Records
+are appended to bench/results.jsonl keyed by git commit, so runs can be
+compared across commits.
+
+Stages: gen_colonias, gen_unrc (both generators), sqlite_write, sqlite_load,
+label (t+1 rule as in pipeline_aggregate_analyze), logit_fit, score_topk,
+map_colonias.
+
+    python bench_pipeline.py                            # 1k, 100k, 1M
+    python bench_pipeline.py --sizes 1000 100000 --repeat 3
+    python bench_pipeline.py --compare                  # last two commits
+    python bench_pipeline.py --compare abc1234 def5678
+"""
+import os, sys, json, time, socket, tempfile, threading, subprocess, argparse, platform
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join("bench", "results.jsonl")
+SIZES = [1_000, 100_000, 1_000_000]
+STAGES = ["gen_colonias","gen_unrc","sqlite_write","sqlite_load",
+          "label","logit_fit","score_topk","map_colonias"]
+
+
+# -------------------------
+# Measurement
+# -------------------------
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource   # no /proc: lifetime peak is the best we have
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb * (1 if sys.platform == "darwin" else 1024)
+
+
+class PeakRSS:
+    """Samples RSS in a background thread while the block runs."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, daemon=True)
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._t.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _timed(records, stage, n, fn, rows=len):
+    """Run fn(), append a record; `rows` maps the result to the rows processed."""
+    with PeakRSS() as mem:
+        t0 = time.perf_counter()
+        out = fn()
+        wall = time.perf_counter() - t0
+    r = rows(out) if callable(rows) else rows
+    records.append({"n_students": n, "stage": stage, "rows": int(r),
+                    "wall_s": round(wall, 4), "rows_per_s": round(r / wall, 1) if wall > 0 else None,
+                    "peak_rss_mb": round(mem.peak / 2**20, 1)})
+    print(f"  {stage:<13} n={n:>9,}  {wall:8.2f}s  {mem.peak/2**20:8.0f} MB", flush=True)
+    return out
+
+
+# -------------------------
+# One size (runs in its own process)
+# -------------------------
+def bench_size(n, seed=42, workdir=None):
+    import matplotlib
+    matplotlib.use("Agg")
+    import generate_colonias as gc
+    import generator_sqlite_unrc as gu
+    from labels import derive_events
+    from risk_model import load_panel, fit_logit, predict, top_k
+    from geo_layers import load_simplified
+    from map_colonias import colonia_dropout, plot_colonias_map, FIGSIZE, DPI
+
+    np.random.seed(seed)
+    rec = []
+    workdir = workdir or tempfile.mkdtemp(prefix="bench_")
+    db = os.path.join(workdir, f"bench_{n}.db")
+
+    def gen_colonias():
+        col_index, catalog = gc.load_colonias(verbose=False)
+        students = gc.generate_students(n, col_index, catalog)
+        return students, gc.simulate_inscripciones(students)
+    students, ins = _timed(rec, "gen_colonias", n, gen_colonias, rows=lambda o: len(o[1]))
+
+    def gen_unrc():
+        st = gu.generate_students(n)
+        return st, gu.simulate_inscripciones(st)
+    _, ins_u = _timed(rec, "gen_unrc", n, gen_unrc, rows=lambda o: len(o[1]))
+    del _, ins_u
+
+    conn = _timed(rec, "sqlite_write", n, lambda: gc.save_db(students, ins, db),
+                  rows=len(students) + len(ins))
+    del students, ins
+    merged = _timed(rec, "sqlite_load", n, lambda: load_panel(conn))
+
+    _timed(rec, "label", n, lambda: derive_events(merged[["student_id","semestre"]], "student_id"))
+    logit = _timed(rec, "logit_fit", n, lambda: fit_logit(merged), rows=len(merged))
+
+    def score_topk():
+        merged["abandono_prob"] = predict(logit, merged)
+        return top_k(merged, 10)
+    _timed(rec, "score_topk", n, score_topk, rows=len(merged))
+
+    gdf_col = load_simplified("colonias", figsize=FIGSIZE, dpi=DPI)   # cached levels, not timed
+    _timed(rec, "map_colonias", n,
+           lambda: plot_colonias_map(gdf_col, colonia_dropout(conn, gdf_col),
+                                     os.path.join(workdir, "map.png")),
+           rows=len(merged))
+    conn.close()
+    os.remove(db)
+    return rec
+
+
+# -------------------------
+# Results file
+# -------------------------
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_meta():
+    return {"commit": _git("rev-parse", "--short", "HEAD") or "unknown",
+            "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "host": socket.gethostname(), "python": platform.python_version()}
+
+
+def append_results(records, path=RESULTS):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+
+def compare(path=RESULTS, commits=None, metric="wall_s"):
+    """Median `metric` per stage × size for two commits (default: the last two recorded)."""
+    df = pd.read_json(path, lines=True)
+    if commits is None:
+        order = df.groupby("commit")["timestamp"].max().sort_values()
+        commits = order.index[-2:].tolist()
+    df = df[df["commit"].isin(commits)]
+    t = df.pivot_table(index=["stage","n_students"], columns="commit", values=metric, aggfunc="median")
+    t = t.reindex(columns=commits)
+    if len(commits) == 2:
+        t["ratio"] = t[commits[1]] / t[commits[0]]
+    order = {s: i for i, s in enumerate(STAGES)}
+    return t.sort_index(level=[0, 1], key=lambda s: s.map(order) if s.name == "stage" else s)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=RESULTS)
+    ap.add_argument("--compare", nargs="*", metavar="COMMIT",
+                    help="print a stage × size comparison instead of running")
+    args = ap.parse_args()
+
+    if args.compare is not None:
+        pd.set_option("display.width", 160)
+        print(compare(args.out, args.compare or None).round(3).to_string())
+        sys.exit()
+
+    meta = run_meta()
+    print(f"⏱️  commit {meta['commit']}{' (dirty)' if meta['dirty'] else ''} → {args.out}")
+    ctx = mp.get_context("spawn")
+    for rep in range(args.repeat):
+        for n in args.sizes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                records = pool.submit(bench_size, n, args.seed + rep).result()
+            append_results([{**meta, "repeat": rep, **r} for r in records], args.out)
+    print(f"✅ Saved: {args.out}")
@@ -0,0 +1,153 @@
+# commute.py
+"""
+Commute-time matrix: origin centroid (colonia or alcaldía) × plantel.
+
+Distances are great-circle (vectorized haversine over the whole grid at once),
+turned into minutes by a simple speed model:
+
+    minutes = overhead_min + dist_km * detour / kmh * 60
+
+The matrix is computed once per (layer, planteles, speed model) and cached in
+geo_cache/ as .npz; generators and analysis only index into it.
+Colonia rows follow the layer's feature order (same ids as join_index /
+spatial_index), alcaldía rows the order of limite-de-las-alcaldias.json.
+"""
+import os, json
+import numpy as np
+import pandas as pd
+
+from geo_layers import CACHE_DIR, LAYERS, layer_path, load_layer, name_column
+from join_index import fold_names
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Transit through CDMX: ~1.3× the straight line at ~18 km/h door to door,
+# plus walking/waiting at both ends
+SPEED_MODEL = {"detour": 1.3, "kmh": 18.0, "overhead_min": 12.0}
+
+# Campus coordinates used across the scripts (report/maps + generators).
+# Entries marked approx. have no coordinates elsewhere in the repo.
+PLANTELES = pd.DataFrame([
+    # generate_final_report_c.py / map_colonias.py
+    ("URC Norte",            19.5000, -99.1400),
+    ("URC Centro",           19.4300, -99.1000),
+    ("URC Sur",              19.2900, -99.1600),
+    # map_alcaldias.py
+    ("Cuautepec (GAM)",      19.5586, -99.1379),
+    ("Gustavo A. Madero",    19.4855, -99.1344),
+    ("Iztapalapa I",         19.3553, -99.0555),
+    ("Iztapalapa II",        19.3826, -99.0098),
+    ("Benito Juárez",        19.3731, -99.1835),
+    ("Azcapotzalco",         19.4822, -99.1764),
+    ("Coyoacán",             19.3019, -99.1465),
+    # generator_sqlite_unrc.py
+    ("Cuautepec",            19.5586, -99.1379),
+    ("San Lorenzo Tezonco",  19.3096, -99.0634),  # approx.
+    ("Justo Sierra",         19.4346, -99.1316),  # approx.
+    # pipeline_aggregate_analyze.py
+    ("GAM",                  19.4855, -99.1344),
+    ("Magdalena Contreras",  19.3066, -99.2412),  # approx.
+], columns=["plantel", "lat", "lon"])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; inputs broadcast against each other."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def travel_minutes(dist_km, model=SPEED_MODEL):
+    return model["overhead_min"] + dist_km * model["detour"] / model["kmh"] * 60.0
+
+
+def _centroids(gdf):
+    # centroids in a metric CRS (UTM 14N covers CDMX), back to lon/lat
+    pts = gdf.to_crs(32614).geometry.centroid.to_crs(4326)
+    return pts.y.to_numpy(), pts.x.to_numpy()
+
+
+class CommuteMatrix:
+    def __init__(self, origins, planteles, dist_km, minutes):
+        self.origins   = np.asarray(origins, dtype=object)
+        self.planteles = np.asarray(planteles, dtype=object)
+        self.dist_km   = dist_km
+        self.minutes   = minutes
+        self._origin_keys  = self._key_index(self.origins)
+        self._plantel_keys = self._key_index(self.planteles)
+
+    @staticmethod
+    def _key_index(names):
+        """Folded name -> first row (names can repeat, e.g. colonias across alcaldías)."""
+        keys = fold_names(names)
+        first = ~keys.duplicated().to_numpy()
+        return pd.Series(np.flatnonzero(first), index=pd.Index(keys[first]))
+
+    @staticmethod
+    def _index(key_index, names):
+        names = fold_names(names)
+        pos = key_index.index.get_indexer(names)
+        # e.g. "Cuajimalpa" for "Cuajimalpa de Morelos": unique prefix match
+        for i in np.flatnonzero(pos < 0):
+            if names.iat[i]:
+                hit = np.flatnonzero(key_index.index.str.startswith(names.iat[i]))
+                if len(hit) == 1:
+                    pos[i] = hit[0]
+        return np.where(pos >= 0, key_index.to_numpy()[pos], -1)
+
+    def origin_index(self, names):
+        """Row index per origin name (-1 if unknown)."""
+        return self._index(self._origin_keys, names)
+
+    def plantel_index(self, names):
+        """Column index per plantel name (-1 if unknown)."""
+        return self._index(self._plantel_keys, names)
+
+    def lookup(self, origin_idx, plantel_idx):
+        """Minutes for paired index arrays; NaN where either index is -1."""
+        origin_idx = np.asarray(origin_idx)
+        plantel_idx = np.asarray(plantel_idx)
+        ok = (origin_idx >= 0) & (plantel_idx >= 0)
+        out = np.full(origin_idx.shape, np.nan)
+        out[ok] = self.minutes[origin_idx[ok], plantel_idx[ok]]
+        return out
+
+
+def build_commute_matrix(layer="colonias", planteles=PLANTELES, model=SPEED_MODEL, gdf=None):
+    if gdf is None:
+        gdf = load_layer(layer)
+    lat, lon = _centroids(gdf)
+    dist = haversine_km(lat[:, None], lon[:, None],
+                        planteles["lat"].to_numpy()[None, :], planteles["lon"].to_numpy()[None, :])
+    return CommuteMatrix(gdf[name_column(gdf, layer)].astype(str).to_numpy(), planteles["plantel"].to_numpy(),
+                         dist.astype(np.float32), travel_minutes(dist, model).astype(np.float32))
+
+
+def load_commute_matrix(layer="colonias", planteles=PLANTELES, model=SPEED_MODEL):
+    """Cached matrix for `layer`; recomputed when the layer, campuses or model change."""
+    path = os.path.join(CACHE_DIR, f"commute_{layer}.npz")
+    meta = json.dumps({"model": model,
+                       "planteles": planteles.round(6).values.tolist(),
+                       "source_mtime": os.path.getmtime(layer_path(layer))},
+                      sort_keys=True)
+
+    if os.path.exists(path):
+        with np.load(path, allow_pickle=True) as z:
+            if str(z["meta"]) == meta:
+                return CommuteMatrix(z["origins"], z["planteles"], z["dist_km"], z["minutes"])
+
+    cm = build_commute_matrix(layer, planteles, model)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = path.replace(".npz", ".tmp.npz")
+    np.savez(tmp, meta=np.array(meta), origins=cm.origins, planteles=cm.planteles,
+             dist_km=cm.dist_km, minutes=cm.minutes)
+    os.replace(tmp, path)
+    return cm
+
+
+if __name__ == "__main__":
+    for layer in LAYERS:
+        cm = load_commute_matrix(layer)
+        print(f"✅ {layer}: {cm.minutes.shape[0]} origins × {cm.minutes.shape[1]} planteles, "
+              f"{np.nanmin(cm.minutes):.0f}–{np.nanmax(cm.minutes):.0f} min")
@@ -0,0 +1,181 @@
+# db.py
+"""
+Shared SQLite access for the generators, reports and maps.
+
+  * WAL journal: set once by the generators (enable_wal). WAL is
+    persistent in the file, so a writer (generator, ingest, agg_cube
+    refresh) and any number of readers then proceed without blocking
+    each other.
+  * Readers open the file read-only by URI (file:...?mode=ro). A report
+    cannot take a write lock by accident, and a missing DB is an error
+    instead of a new empty file.
+  * One connection per (process, thread, path, mode), cached. Process
+    pools and repeated calls inside a job reuse it, and a forked child
+    never inherits its parent's handle.
+  * Projected, filtered, chunked reads instead of SELECT *:
+
+        read_table(conn, "inscripciones", ["student_id","semestre","abandono"],
+                   where={"semestre": (">=", 2), "plantel": ["URC Sur","URC Norte"]})
+        for chunk in iter_table(conn, "inscripciones", where={"student_id": ((">=", lo), ("<", hi))}): ...
+
+    Column names come from the table schema, never from user strings; values
+    are bound parameters. A column the table lacks is a KeyError at the read,
+    unless the caller lists it in optional= (schemas differ between the
+    generators, e.g. alcaldia vs alcaldia_residencia).
+
+The agg cube refresh uses get_connection(readonly=False). The join index
+and colonia lookup take whatever connection the job has and write through
+writer(conn) only when they are missing or stale, so report and map jobs
+stay read-only once the generator has built them. Writers share the WAL file
+with the readers.
+"""
+import os, sqlite3, atexit, threading
+import pandas as pd
+
+DB_PATH = "unrc.db"
+BUSY_TIMEOUT_S = 30          # wait this long for a lock instead of failing at once
+CHUNK_ROWS = 250_000
+OPS = {"=", "!=", "<", "<=", ">", ">="}
+
+_conns = {}
+
+
+class ReadOnlyConnection(sqlite3.Connection):
+    """Connection opened with mode=ro (see writer())."""
+    readonly = True
+
+
+def _configure(conn, readonly):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_S * 1000}")
+    if not readonly:
+        conn.execute("PRAGMA synchronous = NORMAL")       # safe with WAL, far fewer fsyncs
+    return conn
+
+
+def connect(path=DB_PATH, readonly=True):
+    """New connection (read-only by URI unless readonly=False)."""
+    if readonly:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True,
+                               timeout=BUSY_TIMEOUT_S, factory=ReadOnlyConnection)
+    else:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S)
+    return _configure(conn, readonly)
+
+
+def _alive(conn):
+    try:
+        conn.execute("SELECT 1")
+        return True
+    except sqlite3.ProgrammingError:                      # closed by a caller
+        return False
+
+
+def get_connection(path=DB_PATH, readonly=True):
+    """Cached connection for this process/thread; reopened if it was closed."""
+    key = (os.getpid(), threading.get_ident(), os.path.abspath(path), readonly)
+    conn = _conns.get(key)
+    if conn is None or not _alive(conn):
+        conn = _conns[key] = connect(path, readonly)
+    return conn
+
+
+def close_all():
+    pid = os.getpid()
+    for key in [k for k in _conns if k[0] == pid]:
+        _conns.pop(key).close()
+
+
+atexit.register(close_all)
+
+
+def writer(conn):
+    """`conn` itself unless it was opened read-only, else the cached writer on the same file."""
+    if not getattr(conn, "readonly", False):
+        return conn
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return get_connection(path, readonly=False)
+
+
+def enable_wal(conn):
+    """Switch the DB file to WAL (persistent; call from the writer that creates it)."""
+    mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    _configure(conn, readonly=False)
+    return mode
+
+
+# -------------------------
+# Projected / filtered reads
+# -------------------------
+def _q(name):
+    return f'"{name}"'
+
+
+def _py(v):
+    return v.item() if hasattr(v, "item") else v      # numpy scalars -> bindable Python values
+
+
+def table_columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _check_columns(table, have, names, what):
+    unknown = [c for c in names if c not in have]
+    if unknown:
+        raise KeyError(f"{table} has no {what} column(s) {unknown}")
+
+
+def select_sql(conn, table, columns=None, where=None, order_by=None, optional=()):
+    """
+    SELECT for `table`. columns: names to keep, None = all; names in `optional`
+    are skipped when the table lacks them, any other unknown name is a KeyError.
+    where: {col: value} (=), {col: [values]} (IN), {col: (op, value)} with op in OPS,
+    {col: ((op, value), (op, value))} for ranges.
+    Returns (sql, params).
+    """
+    have = table_columns(conn, table)
+    if not have:
+        raise sqlite3.OperationalError(f"no such table: {table}")
+    if columns is not None:
+        _check_columns(table, have, [c for c in columns if c not in optional], "projected")
+    cols = have if columns is None else [c for c in columns if c in have]
+    clauses, params = [], []
+    _check_columns(table, have, list(where or {}), "where")
+    for col, cond in (where or {}).items():
+        if isinstance(cond, tuple):
+            for op, value in (cond if cond and isinstance(cond[0], tuple) else (cond,)):
+                if op not in OPS:
+                    raise ValueError(f"unsupported operator {op!r}")
+                clauses.append(f"{_q(col)} {op} ?")
+                params.append(_py(value))
+        elif isinstance(cond, (list, set, frozenset, pd.Index, pd.Series)) or hasattr(cond, "dtype"):
+            values = [_py(v) for v in cond]
+            clauses.append(f"{_q(col)} IN ({','.join('?' * len(values))})" if values else "0")
+            params += values
+        else:
+            clauses.append(f"{_q(col)} = ?")
+            params.append(_py(cond))
+    sql = f"SELECT {', '.join(map(_q, cols))} FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if order_by:
+        order_by = [order_by] if isinstance(order_by, str) else order_by
+        _check_columns(table, have, order_by, "order_by")
+        sql += " ORDER BY " + ", ".join(map(_q, order_by))
+    return sql, params
+
+
+def iter_table(conn, table, columns=None, where=None, chunksize=CHUNK_ROWS, order_by=None, optional=()):
+    """DataFrame chunks of a projected/filtered read."""
+    sql, params = select_sql(conn, table, columns, where, order_by, optional)
+    yield from pd.read_sql_query(sql, conn, params=params, chunksize=chunksize)
+
+
+def read_table(conn, table, columns=None, where=None, chunksize=CHUNK_ROWS, order_by=None, optional=()):
+    """Projected/filtered read, fetched in chunks and concatenated once."""
+    chunks = list(iter_table(conn, table, columns, where, chunksize, order_by, optional))
+    if not chunks:
+        sql, params = select_sql(conn, table, columns, where, order_by, optional)
+        return pd.read_sql_query(sql + " LIMIT 0", conn, params=params)
+    return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,206 @@
+# export.py
+"""
+Chunked, compressed columnar exports for the large tables.
+
+Panels with millions of rows go to Parquet (zstd) instead of CSV. Parquet
+keeps the dtypes, is several times smaller and is written in row groups
+while the data is produced, so the whole text rendering never sits in
+memory:
+
+    with TableWriter("out_pipeline/panel_raw") as w:     # -> panel_raw.parquet
+        for chunk in chunks:
+            w.write(chunk)
+
+    write_table(panel, "out_pipeline/panel_with_events")   # a DataFrame, in row groups
+    export_query(conn, "SELECT * FROM inscripciones", "out_pipeline/inscripciones")
+    concat_tables(part_paths, "out_pipeline/panel_raw")   # reduce per-shard part files
+    df = read_table("out_pipeline/panel_raw")              # .parquet or .csv, whichever exists
+
+Without pyarrow (or with URC_EXPORT=csv) the same calls append to a .csv, so
+the scripts run either way. Small human-facing files (top-10 lists, logit
+parameters) stay plain CSV and do not go through this module.
+
+    python export.py --db unrc.db          # dump students_raw and inscripciones
+"""
+import os, argparse
+import pandas as pd
+
+OUT_DIR = "out_pipeline"
+FORMAT = os.environ.get("URC_EXPORT", "parquet")     # parquet | csv
+COMPRESSION = "zstd"
+ROW_GROUP = 250_000
+MAX_PENDING_ROWS = 1_000_000  # rows held back while a column is still all-NULL (type unknown)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        return pa, pq
+    except ImportError:
+        return None
+
+
+def resolve_format(fmt=None):
+    fmt = fmt or FORMAT
+    if fmt == "parquet" and _pyarrow() is None:
+        print("⚠️ pyarrow not installed: exporting CSV")
+        return "csv"
+    return fmt
+
+
+class TableWriter:
+    """
+    Append DataFrame chunks to <base>.parquet (one row group per chunk) or <base>.csv.
+
+    The Parquet schema is the union of the chunks' types (null -> int64, int64 ->
+    double, ...) and every chunk is cast to it. A column that is all NULL in the
+    first chunks (a query's leading rows, say) has no type yet, so those chunks are
+    held back until it gets one, up to MAX_PENDING_ROWS; a column still untyped
+    then (or at close) is written as string. Once the file is open the schema is
+    fixed: a later chunk whose type would widen a column (int64 -> double, say)
+    is a ValueError naming the column, not a lossy or failing cast.
+    """
+
+    def __init__(self, base, fmt=None, compression=COMPRESSION, row_group=ROW_GROUP):
+        self.fmt = resolve_format(fmt)
+        base = os.path.splitext(base)[0] if base.endswith((".parquet", ".csv")) else base
+        self.path = f"{base}.{self.fmt}"
+        self.compression, self.row_group = compression, row_group
+        self.rows = 0
+        self._writer = self._schema = None
+        self._pending = []
+        self._as_string = set()          # untyped when the schema was fixed
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self, df):
+        if df.empty and self.rows:
+            return
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a", header=self.rows == 0, index=False)
+        else:
+            pa, _ = _pyarrow()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is not None:
+                self._writer.write_table(self._cast(table), row_group_size=self.row_group)
+            else:
+                self._pending.append(table)
+                schema = self._unified()
+                if not _null_fields(schema) or sum(t.num_rows for t in self._pending) >= MAX_PENDING_ROWS:
+                    self._open(schema)
+        self.rows += len(df)
+
+    def _unified(self):
+        pa, _ = _pyarrow()
+        return pa.unify_schemas([t.schema for t in self._pending], promote_options="permissive")
+
+    def _cast(self, table):
+        for name, fixed, new in _widened(self._schema, table.schema):
+            if name not in self._as_string:
+                raise ValueError(f"{self.path}: column {name!r} was written as {fixed}, "
+                                 f"a later chunk has {new}; cast it in the source "
+                                 f"(e.g. CAST(... AS REAL)) so the first chunk has the final type")
+        return table.select(self._schema.names).cast(self._schema)
+
+    def _open(self, schema):
+        """Fix the schema (still-null columns -> string), start the file, flush held-back chunks."""
+        pa, pq = _pyarrow()
+        for name in _null_fields(schema):
+            schema = schema.set(schema.get_field_index(name), pa.field(name, pa.string()))
+            self._as_string.add(name)
+        self._schema = schema
+        self._writer = pq.ParquetWriter(self.path, schema, compression=self.compression)
+        for table in self._pending:
+            self._writer.write_table(self._cast(table), row_group_size=self.row_group)
+        self._pending = []
+
+    def close(self):
+        if self._pending:
+            self._open(self._unified())
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _null_fields(schema):
+    import pyarrow as pa
+    return [f.name for f in schema if f.type == pa.null()]
+
+
+def _widened(schema, chunk_schema):
+    """(column, fixed type, chunk type) where the chunk's type does not fit `schema`."""
+    import pyarrow as pa
+    out = []
+    for f in chunk_schema:
+        if f.name not in schema.names or f.type == pa.null():
+            continue
+        fixed = schema.field(f.name).type
+        if f.type == fixed:
+            continue
+        try:
+            merged = pa.unify_schemas([pa.schema([schema.field(f.name)]), pa.schema([f])],
+                                      promote_options="permissive").field(f.name).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            merged = None
+        if merged != fixed:
+            out.append((f.name, fixed, f.type))
+    return out
+
+
+def write_table(df, base, fmt=None, row_group=ROW_GROUP, **kw):
+    """Write a DataFrame in row-group slices; returns the path written."""
+    with TableWriter(base, fmt, row_group=row_group, **kw) as w:
+        for start in range(0, max(len(df), 1), row_group):
+            w.write(df.iloc[start:start + row_group])
+    return w.path
+
+
+def export_query(conn, sql, base, fmt=None, row_group=ROW_GROUP, params=None):
+    """Stream a query result to disk chunk by chunk (never the full result in memory)."""
+    with TableWriter(base, fmt, row_group=row_group) as w:
+        for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=row_group):
+            w.write(chunk)
+    return w.path, w.rows
+
+
+def concat_tables(paths, base, fmt=None):
+    """Concatenate part files (same format) into <base>, one part in memory at a time."""
+    with TableWriter(base, fmt) as w:
+        for p in paths:
+            w.write(read_table(p))
+    return w.path
+
+
+def read_table(base, columns=None):
+    """Read <base>.parquet, else <base>.csv."""
+    base = os.path.splitext(base)[0] if base.endswith((".parquet", ".csv")) else base
+    if os.path.exists(base + ".parquet"):
+        return pd.read_parquet(base + ".parquet", columns=columns)
+    return pd.read_csv(base + ".csv", usecols=columns)
+
+
+if __name__ == "__main__":
+    import time
+    from db import get_connection, select_sql
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db", default="unrc.db")
+    ap.add_argument("--format", choices=["parquet","csv"], default=None)
+    ap.add_argument("--tables", nargs="*", default=["students_raw","inscripciones"])
+    args = ap.parse_args()
+
+    conn = get_connection(args.db)
+    for t in args.tables:
+        t0 = time.perf_counter()
+        sql, params = select_sql(conn, t)
+        path, rows = export_query(conn, sql, os.path.join(OUT_DIR, t), args.format, params=params)
+        mb = os.path.getsize(path) / 1e6
+        print(f"✅ Saved: {path} ({rows:,} rows, {mb:.1f} MB, {time.perf_counter()-t0:.1f}s)")
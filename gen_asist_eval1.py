@@ -110,26 +110,41 @@ def generate_names(num_students):
         names.append(name)
     return names
 
-def create_groups(n_groups, n_lessons=17, n_evals=10, min_students=10, max_students=25):
-    
+def create_groups(n_groups, n_lessons=17, n_evals=10, min_students=10, max_students=25, output="xlsx"):
+    """output: "xlsx" (one workbook per subject/group), "store" (array_store.py int8 memmaps) or "both"."""
     groups = [f"Grupo{n}" for n in range(1, n_groups + 1)]
-    populations = np.random.randint(min_students, max_students, 6)
+    populations = np.random.randint(min_students, max_students, n_groups)
     total_students = sum(populations)
     matriculas = generate_matriculas(total_students)
     # Create directory
     directory_name = 'asistencia_calificaciones'
-    os.makedirs(directory_name, exist_ok=True)
+    if output in ("xlsx", "both"):
+        os.makedirs(directory_name, exist_ok=True)
     subjects = ["Calculo_Integral", "Bases_de_Datos", "Contabilidad_Financiera", "Estructuras_de_Datos", "Pensamiento_Complejo", "Probabilidad"]
     print("🎓 GENERANDO DATOS DE ESTUDIANTES POR GRUPO")
 
-    for group, population in zip(groups, populations):
-        count = 0
-        names = generate_names(population)
-        matriculas_group = matriculas[count:population]
+    names_by_group = [generate_names(population) for population in populations]
+    writer = None
+    if output in ("store", "both"):
+        from array_store import StoreWriter, STORE_DIR
+        writer = StoreWriter(STORE_DIR, matriculas, np.repeat(np.arange(n_groups), populations),
+                             [n for names in names_by_group for n in names], subjects, groups,
+                             n_lessons, n_evals)
+
+    count = 0
+    for group, population, names in zip(groups, populations, names_by_group):
+        matriculas_group = matriculas[count:count + population]
+        rows = slice(count, count + population)
         count += population
         for subject in subjects:
             attendance_data = generate_attendance(population, n_lessons)
             evaluation_data = generate_evals(population, n_evals)
             group_name = f"{subject}_{group}"
-            data_to_excel_pd(directory_name, group_name, matriculas_group, names, evaluation_data, attendance_data)
-
+            if output in ("xlsx", "both"):
+                data_to_excel_pd(directory_name, group_name, matriculas_group, names, evaluation_data, attendance_data)
+            if writer is not None:
+                writer.write(rows, subject, attendance_data, evaluation_data)
+
+    if writer is not None:
+        writer.close()
+        print(f"✅  {total_students} students to {writer.path}/")
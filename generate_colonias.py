@@ -1,9 +1,16 @@
 # generate_colonias.py
-import os, sqlite3, random, requests
+import os, sys, random
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 from faker import Faker
+from assets import ASSETS, asset_path
+from spatial_index import ColoniaIndex
+from geo_layers import colonia_columns
+from commute import load_commute_matrix
+from geo_lookup import load_colonia_lookup
+from db import connect, enable_wal
+from instrument import stage
 
 # -------------------------
 # Config
@@ -15,160 +22,209 @@ fake = Faker("es_MX")
 N_STUDENTS     = 1000
 SEMESTRES_MAX  = 8
 DB_PATH        = "unrc.db"
+PLANTELES      = ["URC Norte","URC Centro","URC Sur"]
 
-COLONIAS_FILE  = "catlogo-de-colonias.json"
-COLONIAS_URL   = "https://datos.cdmx.gob.mx/dataset/02c6ce99-dbd8-47d8-aee1-ae885a12bb2f/resource/026b42d3-a609-44c7-a83d-22b2150caffc/download/catlogo-de-colonias.json"
+COLONIAS_URL   = ASSETS["colonias"]["url"]
 
-# -------------------------
-# Download + load GeoJSON (always use GeoPandas)
-# -------------------------
-if not os.path.exists(COLONIAS_FILE):
-    print(f"⬇️ Downloading {COLONIAS_FILE}")
-    r = requests.get(COLONIAS_URL, timeout=90)
-    r.raise_for_status()
-    with open(COLONIAS_FILE, "wb") as f:
-        f.write(r.content)
-    print(f"✅ Saved {COLONIAS_FILE}")
-else:
-    print(f"Already have {COLONIAS_FILE}")
-
-# Always rea
-
-with open(COLONIAS_FILE, "rb") as f:
-    print(f.read(200))
-
-
-
-gdf_colonias = gpd.read_file(COLONIAS_FILE)
-# Expected columns typically include: ['cve_ent','entidad','cve_alc','alc','cve_col','colonia','clasif','geometry']
-cols = gdf_colonias.columns.str.lower().tolist()
+# stronger early-semester risk; later safer (calibration.py solves both for a target profile)
+INTERCEPT  = -1.90
+SEM_EFFECT = {1:0.85, 2:0.60, 3:0.30, 4:0.10, 5:-0.10, 6:-0.30, 7:-0.55, 8:-0.80}
+# true log-odds per unit, keyed by the inscripciones / students_raw column (param_sweep.py checks recovery)
+COEFS = {
+    "promedio": -0.95,            # strong protection by GPA (centred at 8.0)
+    "asistencia_pct": -0.025,     # modest protection by attendance (centred at 86)
+    "horas_trabajo": 0.045,
+    "traslado_min": 0.020,        # centred at 45
+    "marginacion_index": 0.40,
+    "beca": -0.40,                # supports reduce risk
+    "apoyo_tutoria": -0.30,
+}
 
-def pick_col(name_candidates):
-    for c in name_candidates:
-        if c in cols:
-            return c
-    return None
 
-col_colonia = pick_col(["colonia", "nomgeo", "nombre"])
-col_alc     = pick_col(["alc", "alcaldia", "municipio", "delegacion"])
-if col_colonia is None:
-    raise RuntimeError("Could not find the 'colonia' name column in GeoJSON.")
-if col_alc is None:
-    raise RuntimeError("Could not find the 'alcaldia' column in GeoJSON.")
-
-colonias_catalog = gdf_colonias[[col_colonia, col_alc]].drop_duplicates().rename(
-    columns={col_colonia: "colonia_residencia", col_alc: "alcaldia"}
-).reset_index(drop=True)
-
-# Assign a synthetic marginación index per colonia (-2 very low … +2 very high)
-marginacion_levels = [-2,-1,0,1,2]
-marginacion_probs  =  [0.22,0.28,0.26,0.16,0.08]  # skew to lower-middle, but with tail
-colonias_catalog["marginacion_index"] = np.random.choice(
-    marginacion_levels, size=len(colonias_catalog), p=marginacion_probs
-)
+# -------------------------
+# Resolve + load GeoJSON (mirror/cache/download via assets.py; always use GeoPandas)
+# -------------------------
+def load_colonias(verbose=True):
+    """Colonias layer + index + catalog with a synthetic marginación index per colonia."""
+    colonias_file = asset_path("colonias")
+    if verbose:
+        print(f"Using {colonias_file}")
+        with open(colonias_file, "rb") as f:
+            print(f.read(200))
+
+    gdf_colonias = gpd.read_file(colonias_file)
+    col_colonia, col_alc = colonia_columns(gdf_colonias)
+
+    colonias_catalog = gdf_colonias[[col_colonia, col_alc]].drop_duplicates().rename(
+        columns={col_colonia: "colonia_residencia", col_alc: "alcaldia"}
+    ).reset_index(drop=True)
+
+    # Assign a synthetic marginación index per colonia (-2 very low … +2 very high)
+    marginacion_levels = [-2,-1,0,1,2]
+    marginacion_probs  =  [0.22,0.28,0.26,0.16,0.08]  # skew to lower-middle, but with tail
+    colonias_catalog["marginacion_index"] = np.random.choice(
+        marginacion_levels, size=len(colonias_catalog), p=marginacion_probs
+    )
+    if verbose:
+        print(f"Catálogo de colonias: {len(colonias_catalog)} únicas.")
+
+    col_index = ColoniaIndex(gdf_colonias, col_colonia, col_alc)
+    return col_index, colonias_catalog
 
-print(f"Catálogo de colonias: {len(colonias_catalog)} únicas.")
 
 # -------------------------
 # Generate students
 # -------------------------
-students = pd.DataFrame({
-    "student_id": range(1, N_STUDENTS+1),
-    "sexo": np.random.choice(["M","F"], size=N_STUDENTS),
-    "fecha_nacimiento": [fake.date_of_birth(minimum_age=17, maximum_age=30) for _ in range(N_STUDENTS)],
-    "colonia_residencia": np.random.choice(colonias_catalog["colonia_residencia"], size=N_STUDENTS),
-    "alcaldia": np.random.choice(colonias_catalog["alcaldia"], size=N_STUDENTS),
-    "ingreso_familiar": np.random.choice([3000,6000,9000,12000,15000,20000], size=N_STUDENTS, p=[0.10,0.20,0.28,0.22,0.15,0.05]),
-    "personas_hogar": np.random.randint(1,7, size=N_STUDENTS),
-    "horas_trabajo": np.random.choice([0,10,20,30,40], size=N_STUDENTS, p=[0.48,0.20,0.17,0.10,0.05]),
-    "traslado_min": np.random.choice([15,30,45,60,75,90], size=N_STUDENTS, p=[0.10,0.25,0.28,0.20,0.10,0.07]),
-    "dispositivo_propio": np.random.choice([0,1], size=N_STUDENTS, p=[0.18,0.82]),
-    "internet_casa": np.random.choice([0,1], size=N_STUDENTS, p=[0.12,0.88]),
-})
-
-students = students.merge(
-    colonias_catalog[["colonia_residencia","marginacion_index"]],
-    on="colonia_residencia", how="left"
-)
+def generate_students(n, col_index, colonias_catalog, birthdates=True):
+    # birthdates=False skips faker (not used by the dropout model; param_sweep.py runs thousands of cohorts)
+    # Residence = random point inside a random colonia polygon; colonia and
+    # alcaldía both come from that polygon, so they never contradict each other
+    home_feat = np.random.randint(0, len(col_index), size=n)
+    home_lon, home_lat = col_index.sample_points(home_feat)
+
+    # Plantel + commute from the colonia-centroid × plantel time matrix
+    # (rows = colonia features, same order as col_index); nearer campuses are likelier
+    commute   = load_commute_matrix("colonias")
+    t_home    = commute.minutes[home_feat][:, commute.plantel_index(PLANTELES)]
+    w_plantel = np.exp(-t_home / 30.0)
+    w_plantel /= w_plantel.sum(axis=1, keepdims=True)
+    plantel_i = (np.random.rand(n, 1) > np.cumsum(w_plantel, axis=1)).sum(axis=1)
+    traslado  = t_home[np.arange(n), plantel_i] * np.random.lognormal(0.0, 0.15, n)
+
+    students = pd.DataFrame({
+        "student_id": range(1, n+1),
+        "sexo": np.random.choice(["M","F"], size=n),
+        "fecha_nacimiento": [fake.date_of_birth(minimum_age=17, maximum_age=30) for _ in range(n)] if birthdates else None,
+        "colonia_id": home_feat,
+        "colonia_residencia": col_index.colonia[home_feat],
+        "alcaldia": col_index.alcaldia[home_feat],
+        "lat": home_lat,
+        "lon": home_lon,
+        "plantel": np.array(PLANTELES)[plantel_i],
+        "ingreso_familiar": np.random.choice([3000,6000,9000,12000,15000,20000], size=n, p=[0.10,0.20,0.28,0.22,0.15,0.05]),
+        "personas_hogar": np.random.randint(1,7, size=n),
+        "horas_trabajo": np.random.choice([0,10,20,30,40], size=n, p=[0.48,0.20,0.17,0.10,0.05]),
+        "traslado_min": np.clip(np.round(traslado), 10, 150).astype(int),
+        "dispositivo_propio": np.random.choice([0,1], size=n, p=[0.18,0.82]),
+        "internet_casa": np.random.choice([0,1], size=n, p=[0.12,0.88]),
+    })
+
+    return students.merge(
+        colonias_catalog[["colonia_residencia","alcaldia","marginacion_index"]],
+        on=["colonia_residencia","alcaldia"], how="left"
+    )
+
 
 # -------------------------
 # Generate semesters with realistic dropout (can happen any term; stop after dropout)
 # -------------------------
-rows = []
-for _, st in students.iterrows():
-    dropped = False
-    for sem in range(1, SEMESTRES_MAX+1):
-        if dropped:
-            break
-
-        promedio   = float(np.clip(np.random.normal(8.0, 0.9), 5.0, 10.0))
-        asistencia = float(np.clip(np.random.normal(86.0, 9.5), 40.0, 100.0))
-        materias   = int(np.random.randint(4, 7))
-        aprobadas  = int(np.random.binomial(materias, 0.80))
-        reprobadas = materias - aprobadas
-        beca       = int(np.random.choice([0,1], p=[0.70,0.30]))
-        tutoria    = int(np.random.choice([0,1], p=[0.78,0.22]))
-
-        # stronger early-semester risk; later safer
-        sem_effect = {1:0.85, 2:0.60, 3:0.30, 4:0.10, 5:-0.10, 6:-0.30, 7:-0.55, 8:-0.80}.get(sem, -0.40)
-
-        # Logit score (tuned for ~8–10% global dropout; varied student risks)
-        z = (
-            -1.90                      # intercept baseline
-            + sem_effect               # early semesters riskier
-            - 0.95*(promedio - 8.0)    # strong protection by GPA
-            - 0.025*(asistencia - 86)  # modest protection by attendance
-            + 0.045*(st["horas_trabajo"])
-            + 0.020*(st["traslado_min"] - 45)
-            + 0.40*st["marginacion_index"]
-            - 0.40*beca                # supports reduce risk
-            - 0.30*tutoria
-        )
-
-        p_dropout = 1.0/(1.0 + np.exp(-z))
-        abandono  = int(np.random.binomial(1, p_dropout))
-
-        rows.append({
-            "id": len(rows)+1,
-            "student_id": int(st["student_id"]),
-            "semestre": sem,
-            "promedio": promedio,
-            "materias_inscritas": materias,
-            "materias_aprobadas": aprobadas,
-            "materias_reprobadas": reprobadas,
-            "asistencia_pct": asistencia,
-            "beca": beca,
-            "apoyo_tutoria": tutoria,
-            "abandono": abandono
-        })
-
-        if abandono == 1:
-            dropped = True
-
-inscripciones = pd.DataFrame(rows)
+def draw_semester(shape, rng=np.random):
+    """Per student-semester academic draws and supports (promedio, asistencia, beca, tutoría)."""
+    return {
+        "promedio":   np.clip(rng.normal(8.0, 0.9, shape), 5.0, 10.0),
+        "asistencia": np.clip(rng.normal(86.0, 9.5, shape), 40.0, 100.0),
+        "beca":       rng.choice([0,1], size=shape, p=[0.70,0.30]),
+        "tutoria":    rng.choice([0,1], size=shape, p=[0.78,0.22]),
+    }
+
+
+def dropout_z(sem_effect, promedio, asistencia, horas_trabajo, traslado_min,
+              marginacion_index, beca, tutoria, intercept=INTERCEPT, coefs=None):
+    """Logit score (tuned for ~8–10% global dropout; varied student risks); arrays broadcast."""
+    c = COEFS if coefs is None else {**COEFS, **coefs}
+    return (
+        intercept                  # intercept baseline
+        + sem_effect               # early semesters riskier
+        + c["promedio"]*(promedio - 8.0)
+        + c["asistencia_pct"]*(asistencia - 86)
+        + c["horas_trabajo"]*horas_trabajo
+        + c["traslado_min"]*(traslado_min - 45)
+        + c["marginacion_index"]*marginacion_index
+        + c["beca"]*beca
+        + c["apoyo_tutoria"]*tutoria
+    )
+
+
+def simulate_inscripciones(students, semestres_max=SEMESTRES_MAX, sem_effect=None, intercept=INTERCEPT,
+                           coefs=None):
+    """
+    All students × semesters drawn at once; rows after a student's dropout
+    semester are discarded, which is the same as stopping the trajectory.
+    sem_effect / intercept override SEM_EFFECT / INTERCEPT (e.g. calibrated values);
+    coefs overrides entries of COEFS.
+    """
+    n, S = len(students), semestres_max
+    sem = np.arange(1, S+1)
+
+    d          = draw_semester((n, S))
+    promedio, asistencia = d["promedio"], d["asistencia"]
+    beca, tutoria        = d["beca"], d["tutoria"]
+    materias   = np.random.randint(4, 7, (n, S))
+    aprobadas  = np.random.binomial(materias, 0.80)
+    sem_effect = np.array([(sem_effect or SEM_EFFECT).get(s, -0.40) for s in sem])
+
+    col = lambda c: students[c].to_numpy(dtype=float)[:, None]
+    z = dropout_z(sem_effect, promedio, asistencia, col("horas_trabajo"),
+                  col("traslado_min"), col("marginacion_index"), beca, tutoria, intercept, coefs)
+    p_dropout = 1.0/(1.0 + np.exp(-z))
+    abandono  = np.random.binomial(1, p_dropout)
+
+    # observed = no dropout in any earlier semester
+    observed = (np.cumsum(abandono, axis=1) - abandono) == 0
+    n_rows = int(observed.sum())
+
+    return pd.DataFrame({
+        "id": np.arange(1, n_rows+1),
+        "student_id": np.broadcast_to(students["student_id"].to_numpy()[:, None], (n, S))[observed],
+        "semestre": np.broadcast_to(sem, (n, S))[observed],
+        "promedio": promedio[observed],
+        "materias_inscritas": materias[observed],
+        "materias_aprobadas": aprobadas[observed],
+        "materias_reprobadas": (materias - aprobadas)[observed],
+        "asistencia_pct": asistencia[observed],
+        "beca": beca[observed],
+        "apoyo_tutoria": tutoria[observed],
+        "abandono": abandono[observed],
+    })
+
 
 # -------------------------
 # Save DB
 # -------------------------
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
-
-conn = sqlite3.connect(DB_PATH)
-students.to_sql("students_raw", conn, index=False)
-inscripciones.to_sql("inscripciones", conn, index=False)
-cur = conn.cursor()
-cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-tables = cur.fetchall()
-for table_ in tables:
-    cur.execute(f"SELECT * FROM {table_[0]} LIMIT 20")
-    columns = [description[0] for description in cur.description]
-    print(columns)
-    for row in cur.fetchall():
-        print("| " + " | ".join(map(str, row)) + " |")
-    
-    
-conn.close()
-
-print(f"✅ Created {DB_PATH} with {len(students)} students and {len(inscripciones)} inscripciones")
-print("Abandono por semestre (observado):")
-print(inscripciones.groupby("semestre")["abandono"].mean().round(3))
+def save_db(students, inscripciones, path=DB_PATH):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = connect(path, readonly=False)
+    enable_wal(conn)              # report/map jobs can read while a generator or ingest writes
+    students.to_sql("students_raw", conn, index=False)
+    inscripciones.to_sql("inscripciones", conn, index=False)
+    # colonia -> alcaldía / nearest plantel, so aggregations never redo the spatial join
+    load_colonia_lookup(conn, PLANTELES)
+    return conn
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else N_STUDENTS
+    with stage("load_colonias"):
+        col_index, colonias_catalog = load_colonias()
+    with stage("generate_students", rows=n):
+        students = generate_students(n, col_index, colonias_catalog)
+    with stage("simulate_inscripciones") as s:
+        inscripciones = simulate_inscripciones(students)
+        s.rows = len(inscripciones)
+    with stage("save_db", rows=len(students) + len(inscripciones)):
+        conn = save_db(students, inscripciones)
+    cur = conn.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    tables = cur.fetchall()
+    for table_ in tables:
+        cur.execute(f"SELECT * FROM {table_[0]} LIMIT 20")
+        columns = [description[0] for description in cur.description]
+        print(columns)
+        for row in cur.fetchall():
+            print("| " + " | ".join(map(str, row)) + " |")
+    conn.close()
+
+    print(f"✅ Created {DB_PATH} with {len(students)} students and {len(inscripciones)} inscripciones")
+    print("Abandono por semestre (observado):")
+    print(inscripciones.groupby("semestre")["abandono"].mean().round(3))
@@ -7,11 +7,10 @@ generate_final_report.py
 4. Save figures (PNG) into ./out_pipeline
 5. Save regression coefficients
 6. Calculate dropout probabilities
-7. Save student risk CSV ordered by probability
+7. Save student risk table ordered by probability (Parquet via export.py)
 8. Plot Top 10 students at risk
 """
 
-import sqlite3
 import pandas as pd
 import numpy as np
 import os
@@ -19,16 +18,17 @@ import matplotlib.pyplot as plt
 from statsmodels.discrete.discrete_model import Logit
 from statsmodels.tools import add_constant
 from sklearn.metrics import roc_curve, auc
+from export import write_table
+from db import get_connection, read_table
 
 DB_PATH = "unrc.db"
 OUT_DIR = "./out_pipeline"
 os.makedirs(OUT_DIR, exist_ok=True)
 
 # --- Load data ---
-conn = sqlite3.connect(DB_PATH)
-students = pd.read_sql("SELECT * FROM students_raw", conn)
-panel = pd.read_sql("SELECT * FROM inscripciones", conn)
-conn.close()
+conn = get_connection(DB_PATH)
+students = read_table(conn, "students_raw", ["student_id","horas_trabajo","traslado_min"])
+panel = read_table(conn, "inscripciones")
 
 # Derive abandono: dropout if student doesn't appear in next semester
 panel = panel.sort_values(["student_id","semestre"])
@@ -65,7 +65,7 @@ merged["abandono_prob"] = 1 / (1 + np.exp(-log_odds))
 
 student_risk = merged.groupby("student_id")["abandono_prob"].max().reset_index()
 student_risk = student_risk.sort_values("abandono_prob", ascending=False)
-student_risk.to_csv(os.path.join(OUT_DIR,"student_dropout_risk.csv"), index=False)
+write_table(student_risk, os.path.join(OUT_DIR,"student_dropout_risk"))
 
 # --- Figure 1: Dropout by semester ---
 plt.plot(agg_sem["semestre"], agg_sem["abandono_rate"], marker="o")
@@ -131,4 +131,4 @@ plt.close()
 students.head(10).to_csv(os.path.join(OUT_DIR,"sample_students.csv"), index=False)
 agg_sem.head(10).to_csv(os.path.join(OUT_DIR,"sample_agg_sem.csv"), index=False)
 
-print(f"\n✅ Analysis complete. Figures + risk CSV saved in {OUT_DIR}")
+print(f"\n✅ Analysis complete. Figures + risk table saved in {OUT_DIR}")
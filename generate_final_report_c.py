@@ -1,41 +1,40 @@
 # generate_final_report_c.py
-import os, sqlite3, requests, unicodedata
+import os
 import numpy as np
 import pandas as pd
-import geopandas as gpd
 import matplotlib.pyplot as plt
-import statsmodels.api as sm
 from sklearn.metrics import roc_curve, auc
-from docx import Document
-from docx.shared import Inches
-from generate_colonias import COLONIAS_FILE, COLONIAS_URL
+from assets import fetch
+from geo_layers import load_simplified
+from join_index import colonia_ids, feature_mean
+from geo_lookup import load_colonia_lookup, rollup
+from vector_export import export_layer
+from report_docx import render_png, build_executive_report
+from map_renderer import MapRenderer
+from risk_model import load_panel, fit_logit, predict, top_k
+from db import get_connection
+from instrument import stage
 OUT_DIR = "out_pipeline"
 os.makedirs(OUT_DIR, exist_ok=True)
 
 DB_PATH = "unrc.db"
+MAP_FIGSIZE, MAP_DPI = (10,10), 100  # maps: geometry detail is picked for this size
 
-# ---- Load DB
-conn = sqlite3.connect(DB_PATH)
-students = pd.read_sql("SELECT * FROM students_raw", conn)
-panel    = pd.read_sql("SELECT * FROM inscripciones", conn)
-conn.close()
-
-# ---- Merge predictors
-merged = panel.merge(
-    students[["student_id","sexo","colonia_residencia","alcaldia","horas_trabajo","traslado_min"]],
-    on="student_id", how="left"
-).copy()
+# ---- Load DB + merge predictors
+conn = get_connection(DB_PATH)   # read-only; a missing join index / colonia lookup is written through db.writer
+with stage("load_panel") as s:
+    merged = load_panel(conn)
+    s.rows = len(merged)
 
 # ---- Logistic model
-X = merged[["promedio","asistencia_pct","horas_trabajo","traslado_min"]].copy()
-X = sm.add_constant(X)
+with stage("fit_logit", rows=len(merged)):
+    logit = fit_logit(merged)
+with stage("predict", rows=len(merged)):
+    merged["abandono_prob"] = predict(logit, merged)
 y = merged["abandono"].astype(int)
 
-logit = sm.Logit(y, X).fit(disp=False)
-merged["abandono_prob"] = logit.predict(X)
-
 # ---- Save coefficients
-coefs = pd.DataFrame({"var": X.columns, "coef": logit.params.values})
+coefs = pd.DataFrame({"var": logit.params.index, "coef": logit.params.values})
 coefs.to_csv(os.path.join(OUT_DIR,"logit_params.csv"), index=False)
 
 # ---- Figure 1: Observed vs Predicted per semester
@@ -52,7 +51,8 @@ plt.legend()
 plt.grid(alpha=0.3)
 plt.tight_layout()
 f1 = os.path.join(OUT_DIR,"figura1_abandono_vs_predicho.png")
-plt.savefig(f1); plt.close()
+with stage("savefig", figure="figura1"):
+    png1 = render_png(path=f1)
 
 # ---- Figure 2: Coefficients
 coef_plot = coefs[coefs["var"]!="const"].sort_values("coef")
@@ -62,7 +62,8 @@ plt.title("Coeficientes (Regresión Logística)")
 plt.xlabel("Efecto en log-odds de abandono")
 plt.tight_layout()
 f2 = os.path.join(OUT_DIR,"figura2_coef_logistica.png")
-plt.savefig(f2); plt.close()
+with stage("savefig", figure="figura2"):
+    png2 = render_png(path=f2)
 
 # ---- Figure 3: ROC
 y_score = merged["abandono_prob"].values
@@ -78,25 +79,17 @@ plt.title("Curva ROC")
 plt.legend(loc="lower right")
 plt.tight_layout()
 f3 = os.path.join(OUT_DIR,"figura3_roc.png")
-plt.savefig(f3); plt.close()
+with stage("savefig", figure="figura3"):
+    png3 = render_png(path=f3)
 
 # ---- Top 10 risk students (last available semester per student)
-last_rows = merged.sort_values(["student_id","semestre"]).groupby("student_id").tail(1)
-top10 = last_rows.sort_values("abandono_prob", ascending=False).head(10)[
-    ["student_id","sexo","colonia_residencia","alcaldia",
-     "promedio","asistencia_pct","horas_trabajo","traslado_min","abandono_prob"]
-].copy()
-top10.to_csv(os.path.join(OUT_DIR,"top10_risk_students.csv"), index=False)
-
+with stage("top_k", rows=len(merged)):
+    top10 = top_k(merged, 10)
+    top10.to_csv(os.path.join(OUT_DIR,"top10_risk_students.csv"), index=False)
 
-
-# ---- least 10 risk students (last available semester per student)
-last_rows = merged.sort_values(["student_id","semestre"]).groupby("student_id").tail(1)
-least10 = last_rows.sort_values("abandono_prob").head(10)[
-    ["student_id","sexo","colonia_residencia","alcaldia",
-     "promedio","asistencia_pct","horas_trabajo","traslado_min","abandono_prob"]
-].copy()
-least10.to_csv(os.path.join(OUT_DIR,"least10_risk_students.csv"), index=False)
+    # ---- least 10 risk students (last available semester per student)
+    least10 = top_k(merged, 10, ascending=True)
+    least10.to_csv(os.path.join(OUT_DIR,"least10_risk_students.csv"), index=False)
 
 
 # Annotated bar chart
@@ -114,59 +107,42 @@ for bar, (_, row) in zip(bars, top10.iterrows()):
 
 plt.tight_layout()
 f4 = os.path.join(OUT_DIR,"figura4_top10_risk.png")
-plt.savefig(f4); plt.close()
+with stage("savefig", figure="figura4"):
+    png4 = render_png(path=f4)
 
 # ---- Figure 5: Colonias risk map
 
-if not os.path.exists(COLONIAS_FILE):
-    r = requests.get(COLONIAS_URL, timeout=90)
-    r.raise_for_status()
-    with open(COLONIAS_FILE, "wb") as f:
-        f.write(r.content)
-
-gdf_col = gpd.read_file(COLONIAS_FILE)
-
-def norm(s):
-    if pd.isna(s): return s
-    s = str(s)
-    s = unicodedata.normalize("NFKD", s).encode("ASCII","ignore").decode("utf-8")
-    return s.upper().strip()
+with stage("load_geometry"):
+    fetch(["colonias", "alcaldias"])   # both map layers, downloaded concurrently if missing
+    gdf_col = load_simplified("colonias", figsize=MAP_FIGSIZE, dpi=MAP_DPI)
 
-# Names normalization (join via colonia)
-risk_by_col = merged.groupby("colonia_residencia")["abandono_prob"].mean().reset_index()
-risk_by_col["key"] = risk_by_col["colonia_residencia"].map(norm)
+# Integer feature ids: stored colonia_id (name join index for older DBs), unmatched = -1
+with stage("join_features", rows=len(merged)):
+    col_ids = colonia_ids(conn, merged, gdf=gdf_col)
+    # alcaldía = the one the colonia polygon lies in (stored overlay), not a second name join
+    alc_ids = rollup(col_ids, load_colonia_lookup(conn)["alcaldia_id"])
+    gdf_col["abandono_prob"] = feature_mean(col_ids, merged["abandono_prob"], len(gdf_col))
 
-col_name = [c for c in gdf_col.columns if c.lower()=="colonia"]
-if not col_name:  # fallback some releases
-    col_name = [c for c in gdf_col.columns if c.lower() in ("nomgeo","nombre")]
-col_name = col_name[0]
-
-gdf_col["key"] = gdf_col[col_name].map(norm)
-gdf_col = gdf_col.merge(risk_by_col[["key","abandono_prob"]], on="key", how="left")
-gdf_col["abandono_prob"] = gdf_col["abandono_prob"].fillna(0.0)
-
-fig, ax = plt.subplots(figsize=(10,10))
-gdf_col.plot(column="abandono_prob", cmap="Reds", legend=True, ax=ax,
-             legend_kwds={'label': "Prob. abandono", 'orientation': "vertical"})
-ax.set_title("Riesgo promedio de abandono por colonia")
-ax.axis("off")
-plt.tight_layout()
+renderer = MapRenderer(gdf_col, figsize=MAP_FIGSIZE, dpi=MAP_DPI, linewidth=0)
 f5 = os.path.join(OUT_DIR,"figura5_colonias_riesgo.png")
-plt.savefig(f5); plt.close()
+with stage("savefig", figure="figura5"):
+    png5 = renderer.render(gdf_col["abandono_prob"], "Riesgo promedio de abandono por colonia",
+                           label="Prob. abandono", path=f5)
+renderer.close()
+
+# ---- Vector layers for dashboards: quantized TopoJSON, risk in feature properties
+with stage("export_topojson"):
+    topo_col = export_layer("colonias", {
+        "abandono_prob": gdf_col["abandono_prob"],
+        "abandono_obs":  feature_mean(col_ids, merged["abandono"], len(gdf_col)),
+    }, os.path.join(OUT_DIR, "colonias_riesgo.topojson"))
+    gdf_alc = load_simplified("alcaldias", figsize=MAP_FIGSIZE, dpi=MAP_DPI)
+    topo_alc = export_layer("alcaldias", {
+        "abandono_prob": feature_mean(alc_ids, merged["abandono_prob"], len(gdf_alc)),
+        "abandono_obs":  feature_mean(alc_ids, merged["abandono"], len(gdf_alc)),
+    }, os.path.join(OUT_DIR, "alcaldias_riesgo.topojson"))
 
 # ---- Figure 6: Alcaldías + planteles
-ALC_FILE = "limite-de-las-alcaldias.json"
-ALC_URL  = ("https://datos.cdmx.gob.mx/dataset/bae265a8-d1f6-4614-b399-4184bc93e027/"
-            "resource/deb5c583-84e2-4e07-a706-1b3a0dbc99b0/download/limite-de-las-alcaldas.json")
-
-
-if not os.path.exists(ALC_FILE):
-    r = requests.get(ALC_URL, timeout=90)
-    r.raise_for_status()
-    with open(ALC_FILE, "wb") as f:
-        f.write(r.content)
-
-gdf_alc = gpd.read_file(ALC_FILE)
 
 planteles = pd.DataFrame({
     "nombre": ["URC Norte","URC Centro","URC Sur"],
@@ -175,7 +151,7 @@ planteles = pd.DataFrame({
     "color": ["#c62828","#1565c0","#2e7d32"]
 })
 
-fig, ax = plt.subplots(figsize=(10,10))
+fig, ax = plt.subplots(figsize=MAP_FIGSIZE)
 gdf_alc.plot(ax=ax, color="#fafafa", edgecolor="gray")
 ax.scatter(planteles["lon"], planteles["lat"], c=planteles["color"], s=60, marker="o")
 for _, r in planteles.iterrows():
@@ -185,74 +161,26 @@ ax.set_title("Planteles URC en CDMX")
 ax.axis("off")
 plt.tight_layout()
 f6 = os.path.join(OUT_DIR,"figura6_alcaldias.png")
-plt.savefig(f6); plt.close()
-"""
-# ---- Build Executive Report DOCX (with embedded figures)
-doc = Document()
-doc.add_heading("URC – Informe Ejecutivo: Predicción del Abandono Escolar", 0)
-doc.add_paragraph("Proyecto prototípico (2025-2) – Ciencia de Datos para Negocios")
-doc.add_paragraph("Fecha: Septiembre 2025")
-doc.add_page_break()
-
-doc.add_heading("Resumen Ejecutivo", level=1)
-doc.add_paragraph(
-    "Se desarrolló un prototipo de sistema de alerta temprana contra el abandono escolar en la "
-    "Universidad Rosario Castellanos (URC) utilizando datos sintéticos realistas. El modelo logístico "
-    "muestra que el promedio y la asistencia reducen el riesgo, mientras que las horas de trabajo, el "
-    "tiempo de traslado y la marginación territorial lo incrementan. Las visualizaciones geográficas "
-    "permiten focalizar estrategias por colonia y plantel."
-)
-
-doc.add_heading("Introducción y Contexto", level=1)
-doc.add_paragraph(
-    "El abandono escolar en educación superior en México se concentra en los primeros semestres y responde a "
-    "una combinación de factores académicos, socioeconómicos y territoriales. En ausencia de microdatos públicos, "
-    "se simuló una cohorte de estudiantes de la URC asignados a colonias reales de la CDMX para evaluar patrones "
-    "de riesgo y proponer un flujo de trabajo replicable con datos institucionales."
-)
-
-doc.add_heading("Metodología", level=1)
-doc.add_paragraph(
-    "1) Datos sintéticos (N=1000) con variables académicas y socioeconómicas; 2) Trayectorias semestrales con "
-    "abandono posible en cualquier semestre, deteniendo la trayectoria al ocurrir; 3) Regresión logística con "
-    "predictores interpretables (promedio, asistencia, trabajo, traslado); 4) Riesgo promedio por colonia con "
-    "GeoJSON oficial; 5) Productos: figuras, CSV de alto riesgo y este informe."
-)
-
-doc.add_heading("Resultados", level=1)
-for fp, caption in [(f1,"Figura 1. Abandono observado vs predicho por semestre"),
-                    (f2,"Figura 2. Coeficientes del modelo logístico"),
-                    (f3,"Figura 3. Curva ROC del modelo"),
-                    (f4,"Figura 4. Top 10 estudiantes con mayor riesgo"),
-                    (f5,"Figura 5. Riesgo promedio por colonia"),
-                    (f6,"Figura 6. Planteles URC y límites de alcaldías")]:
-    if os.path.exists(fp):
-        doc.add_picture(fp, width=Inches(5.8))
-        p = doc.add_paragraph(caption)
-        p.alignment = 1
-
-doc.add_heading("Discusión", level=1)
-doc.add_paragraph(
-    "El patrón por semestre confirma mayor vulnerabilidad entre 1º y 3º. El promedio es el protector más fuerte; "
-    "las cargas laborales y traslados prolongados aumentan el riesgo. Los mapas revelan disparidades territoriales "
-    "alineadas con marginación urbana. Aun con datos sintéticos, el pipeline es transferible a datos reales."
-)
-
-doc.add_heading("Conclusiones y Recomendaciones", level=1)
-doc.add_paragraph(
-    "El prototipo demuestra que un modelo interpretable + mapas puede guiar becas, tutorías y apoyos de transporte. "
-    "Siguiente paso: entrenar con datos reales anonimizados, validar, y desplegar un tablero operativo con alertas "
-    "por estudiante y colonia."
-)
-
-doc.add_heading("Referencias (selección)", level=1)
-doc.add_paragraph(
-    "ANUIES; INEE; CONAPO; INEGI; literatura sobre retención universitaria (p.ej., Tinto)."
-)
-
-docx_path = os.path.join(OUT_DIR, "URC_informe_ejecutivo.docx")
-doc.save(docx_path)
-"""
+with stage("savefig", figure="figura6"):
+    png6 = render_png(path=f6, dpi=MAP_DPI)
+# ---- Executive Report DOCX (figures embedded from the in-memory PNGs above)
+results = {
+    "n_students": int(merged["student_id"].nunique()),
+    "n_rows": len(merged),
+    "auc": roc_auc,
+    "abandono_sem": merged.groupby("semestre")["abandono"].mean(),
+    "coefs": coefs,
+    "top10": top10[["student_id","alcaldia","promedio","asistencia_pct","abandono_prob"]].round(3),
+}
+with stage("build_docx"):
+    docx_path = build_executive_report(results, [
+        (png1, "Figura 1. Abandono observado vs predicho por semestre"),
+        (png2, "Figura 2. Coeficientes del modelo logístico"),
+        (png3, "Figura 3. Curva ROC del modelo"),
+        (png4, "Figura 4. Top 10 estudiantes con mayor riesgo"),
+        (png5, "Figura 5. Riesgo promedio por colonia"),
+        (png6, "Figura 6. Planteles URC y límites de alcaldías"),
+    ], os.path.join(OUT_DIR, "URC_informe_ejecutivo.docx"))
 print("\n✅ Done. Outputs in:", OUT_DIR)
 print(" -", os.path.basename(f1))
 print(" -", os.path.basename(f2))
@@ -260,5 +188,7 @@ print(" -", os.path.basename(f3))
 print(" -", os.path.basename(f4))
 print(" -", os.path.basename(f5))
 print(" -", os.path.basename(f6))
-#print(" - URC_informe_ejecutivo.docx")
+print(" - URC_informe_ejecutivo.docx")
 print(" - top10_risk_students.csv")
+print(" -", os.path.basename(topo_col))
+print(" -", os.path.basename(topo_alc))
@@ -1,20 +1,19 @@
 # generator_sqlite_unrc.py
 # Generador sintético con riesgo de abandono realista (URC)
 
-import sqlite3
 import pandas as pd
 import numpy as np
-import os
+import os, sys
 from faker import Faker
 from datetime import datetime
+from commute import load_commute_matrix
+from instrument import stage
+from db import connect, enable_wal
 
 np.random.seed(42)
 faker = Faker("es_MX")
 
 DB_PATH = "unrc.db"
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
-conn = sqlite3.connect(DB_PATH)
 
 # -----------------------------------
 # Parámetros
@@ -28,134 +27,152 @@ alcaldias = [
 ]
 planteles = ["Cuautepec","San Lorenzo Tezonco","Justo Sierra"]
 
-# Mapa simplificado de traslado (minutos)
-commute_map = {
-    "Cuautepec": {
-        "Gustavo A. Madero": (20,40),
-        "Azcapotzalco": (30,50),
-        "Cuauhtémoc": (45,70),
-        "Benito Juárez": (60,90)
-    },
-    "San Lorenzo Tezonco": {
-        "Iztapalapa": (20,40),
-        "Tláhuac": (25,45),
-        "Coyoacán": (50,70),
-        "Álvaro Obregón": (70,100)
-    },
-    "Justo Sierra": {
-        "Cuauhtémoc": (20,35),
-        "Benito Juárez": (25,40),
-        "Miguel Hidalgo": (35,55),
-        "Iztacalco": (40,60)
-    }
-}
-default_commute = (70,110)
+# Multiplicador temporal del riesgo por semestre
+SEM_MULT = {1:1.8, 2:1.5, 3:1.0, 4:1.0, 5:1.0, 6:0.7, 7:0.5, 8:0.3}
+
 
 # -----------------------------------
 # Generar estudiantes
 # -----------------------------------
-students = []
-for sid in range(1, n_students+1):
-    sexo = np.random.choice(["M","F"])
-    birthdate = faker.date_of_birth(minimum_age=18, maximum_age=30)
-    edad = datetime.today().year - birthdate.year
-
-    alc = np.random.choice(alcaldias)
-    plantel = np.random.choice(planteles)
-
-    # Tiempo de traslado
-    if plantel in commute_map and alc in commute_map[plantel]:
-        tmin, tmax = commute_map[plantel][alc]
-    else:
-        tmin, tmax = default_commute
-    traslado_min = np.random.randint(tmin, tmax+1)
-
-    ingreso = np.random.choice([5000, 8000, 12000, 20000, 30000],
-                               p=[.2,.3,.3,.15,.05])
-    personas = np.random.randint(2,6)
-    horas_trabajo = np.random.choice([0,10,20,30,40], p=[.5,.2,.15,.1,.05])
-    dispositivo = np.random.choice([0,1], p=[.2,.8])
-    internet = np.random.choice([0,1], p=[.15,.85])
-
-    students.append([
-        sid, sexo, birthdate.isoformat(), edad, alc, plantel,
-        ingreso, personas, horas_trabajo, dispositivo, internet, traslado_min
-    ])
-
-students_df = pd.DataFrame(students, columns=[
-    "student_id","sexo","fecha_nacimiento","edad","alcaldia_residencia","plantel",
-    "ingreso_familiar","personas_hogar","horas_trabajo",
-    "dispositivo_propio","internet_casa","traslado_min"
-])
-students_df.to_sql("students_raw", conn, index=False)
+def generate_students(n):
+    # Traslado (minutos): matriz centroide de alcaldía × plantel, calculada una vez
+    commute = load_commute_matrix("alcaldias")
+    alc_row = commute.origin_index(alcaldias)
+    plantel_col = commute.plantel_index(planteles)
+    # -1 (name not in the matrix) would silently index its last row / column
+    unknown = [n for n, i in zip(alcaldias + planteles, np.r_[alc_row, plantel_col]) if i < 0]
+    if unknown:
+        raise ValueError(f"not in the alcaldías commute matrix: {unknown}")
+
+    sexo = np.random.choice(["M","F"], size=n)
+    birthdate = [faker.date_of_birth(minimum_age=18, maximum_age=30) for _ in range(n)]
+    edad = datetime.today().year - np.array([b.year for b in birthdate])
+
+    a = np.random.randint(len(alcaldias), size=n)
+    p = np.random.randint(len(planteles), size=n)
+
+    # Tiempo de traslado: base de la matriz ± 15 %
+    base = commute.minutes[alc_row[a], plantel_col[p]]
+    traslado_min = np.round(base * np.random.uniform(0.85, 1.15, n)).astype(int)
+
+    return pd.DataFrame({
+        "student_id": np.arange(1, n+1),
+        "sexo": sexo,
+        "fecha_nacimiento": [b.isoformat() for b in birthdate],
+        "edad": edad,
+        "alcaldia_residencia": np.array(alcaldias)[a],
+        # matrix rows follow limite-de-las-alcaldias.json: the alcaldía feature id maps aggregate by
+        "alcaldia_id": alc_row[a],
+        "plantel": np.array(planteles)[p],
+        "ingreso_familiar": np.random.choice([5000, 8000, 12000, 20000, 30000], size=n,
+                                             p=[.2,.3,.3,.15,.05]),
+        "personas_hogar": np.random.randint(2,6, size=n),
+        "horas_trabajo": np.random.choice([0,10,20,30,40], size=n, p=[.5,.2,.15,.1,.05]),
+        "dispositivo_propio": np.random.choice([0,1], size=n, p=[.2,.8]),
+        "internet_casa": np.random.choice([0,1], size=n, p=[.15,.85]),
+        "traslado_min": traslado_min,
+    })
+
 
 # -----------------------------------
 # Generar inscripciones con abandono
 # -----------------------------------
-semesters = []
-for _, st in students_df.iterrows():
-    sid = st["student_id"]
-    abandonado = False
-
-    for sem in range(1,9):  # máx. 8 semestres
-        if abandonado:
-            break
-
-        promedio = np.clip(np.random.normal(8, 1), 5, 10)
-        materias = 5
-        aprobadas = np.random.binomial(materias, p=min(0.9, promedio/10))
-        reprobadas = materias - aprobadas
-        beca = np.random.choice([0,1], p=[0.7,0.3])
-        tutoria = np.random.choice([0,1], p=[0.6,0.4])
-        asistencia = np.clip(np.random.normal(85, 10), 50, 100)
-
-        # --- Riesgo de abandono ---
-        risk = 0.05  # base
-        # Académico
-        if promedio < 7: risk += 0.20
-        elif promedio < 8: risk += 0.10
-        if asistencia < 70: risk += 0.15
-        if reprobadas >= 2: risk += 0.10
-        if tutoria == 0: risk += 0.05
-        if beca == 1: risk -= 0.05
-        # Socioeconómico
-        if st["ingreso_familiar"] < 8000: risk += 0.10
-        if st["personas_hogar"] > 5: risk += 0.05
-        if st["internet_casa"] == 0: risk += 0.05
-        if st["dispositivo_propio"] == 0: risk += 0.05
-        # Laboral
-        if st["horas_trabajo"] > 20: risk += 0.10
-        elif st["horas_trabajo"] >= 10: risk += 0.05
-        # Geográfico
-        if st["traslado_min"] > 60: risk += 0.10
-        # Demográfico
-        if st["edad"] > 24: risk += 0.05
-        if st["sexo"] == "M": risk += 0.02
-        # Temporal (semestre)
-        if sem == 1: risk *= 1.8
-        elif sem == 2: risk *= 1.5
-        elif sem in [3,4,5]: risk *= 1.0
-        elif sem == 6: risk *= 0.7
-        elif sem == 7: risk *= 0.5
-        elif sem == 8: risk *= 0.3
-
-        risk = min(max(risk, 0.01), 0.95)
-        abandono = np.random.rand() < risk
-
-        semesters.append([
-            None, sid, sem, promedio, materias, aprobadas, reprobadas,
-            beca, tutoria, asistencia, 1 if abandono else 0
-        ])
-
-        if abandono:
-            abandonado = True
-
-inscripciones_df = pd.DataFrame(semesters, columns=[
-    "id","student_id","semestre","promedio","materias_inscritas",
-    "materias_aprobadas","materias_reprobadas","beca","apoyo_tutoria",
-    "asistencia_pct","abandono"
-])
-inscripciones_df.to_sql("inscripciones", conn, index=False)
-
-print(f"✅ Created {DB_PATH} with {len(students_df)} students and {len(inscripciones_df)} semester-rows.")
-conn.close()
+def draw_terms(n, S):
+    """Per student-semester academic draws and supports."""
+    promedio = np.clip(np.random.normal(8, 1, (n, S)), 5, 10)
+    materias = 5
+    aprobadas = np.random.binomial(materias, p=np.minimum(0.9, promedio/10))
+    return {
+        "promedio": promedio,
+        "materias": materias,
+        "aprobadas": aprobadas,
+        "reprobadas": materias - aprobadas,
+        "beca": np.random.choice([0,1], size=(n, S), p=[0.7,0.3]),
+        "tutoria": np.random.choice([0,1], size=(n, S), p=[0.6,0.4]),
+        "asistencia": np.clip(np.random.normal(85, 10, (n, S)), 50, 100),
+    }
+
+
+def base_risk(st, d):
+    """Additive rule risk before the per-semester multiplier (n × S)."""
+    col = lambda c: st[c].to_numpy()[:, None]
+    promedio, asistencia = d["promedio"], d["asistencia"]
+
+    risk = np.full(promedio.shape, 0.05)  # base
+    # Académico
+    risk += np.where(promedio < 7, 0.20, np.where(promedio < 8, 0.10, 0.0))
+    risk += 0.15*(asistencia < 70)
+    risk += 0.10*(d["reprobadas"] >= 2)
+    risk += 0.05*(d["tutoria"] == 0)
+    risk -= 0.05*(d["beca"] == 1)
+    # Socioeconómico
+    risk += 0.10*(col("ingreso_familiar") < 8000)
+    risk += 0.05*(col("personas_hogar") > 5)
+    risk += 0.05*(col("internet_casa") == 0)
+    risk += 0.05*(col("dispositivo_propio") == 0)
+    # Laboral
+    h = col("horas_trabajo")
+    risk += np.where(h > 20, 0.10, np.where(h >= 10, 0.05, 0.0))
+    # Geográfico
+    risk += 0.10*(col("traslado_min") > 60)
+    # Demográfico
+    risk += 0.05*(col("edad") > 24)
+    risk += 0.02*(col("sexo") == "M")
+    return risk
+
+
+def apply_sem_mult(risk, sem_mult=None):
+    """Temporal multiplier per semester column, clipped to [0.01, 0.95]."""
+    sem_mult = sem_mult or SEM_MULT
+    mult = np.array([sem_mult.get(s, 1.0) for s in range(1, risk.shape[1] + 1)])
+    return np.clip(risk * mult, 0.01, 0.95)
+
+
+def simulate_inscripciones(st, semestres_max=8, sem_mult=None):
+    """Todos los estudiantes × semestres a la vez; se descartan los semestres posteriores al abandono."""
+    n, S = len(st), semestres_max
+    sem = np.arange(1, S+1)
+    col = lambda c: st[c].to_numpy()[:, None]
+
+    d = draw_terms(n, S)
+    promedio, materias, aprobadas, reprobadas = d["promedio"], d["materias"], d["aprobadas"], d["reprobadas"]
+    beca, tutoria, asistencia = d["beca"], d["tutoria"], d["asistencia"]
+
+    # --- Riesgo de abandono (reglas × multiplicador temporal) ---
+    risk = apply_sem_mult(base_risk(st, d), sem_mult)
+    abandono = (np.random.rand(n, S) < risk).astype(int)
+
+    observed = (np.cumsum(abandono, axis=1) - abandono) == 0
+    return pd.DataFrame({
+        "id": None,
+        "student_id": np.broadcast_to(col("student_id"), (n, S))[observed],
+        "semestre": np.broadcast_to(sem, (n, S))[observed],
+        "promedio": promedio[observed],
+        "materias_inscritas": materias,
+        "materias_aprobadas": aprobadas[observed],
+        "materias_reprobadas": reprobadas[observed],
+        "beca": beca[observed],
+        "apoyo_tutoria": tutoria[observed],
+        "asistencia_pct": asistencia[observed],
+        "abandono": abandono[observed],
+    })
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else n_students
+    if os.path.exists(DB_PATH):
+        os.remove(DB_PATH)
+    conn = connect(DB_PATH, readonly=False)
+    enable_wal(conn)
+
+    with stage("generate_students", rows=n):
+        students_df = generate_students(n)
+    with stage("simulate_inscripciones") as s:
+        inscripciones_df = simulate_inscripciones(students_df)
+        s.rows = len(inscripciones_df)
+    with stage("to_sql", rows=len(students_df) + len(inscripciones_df)):
+        students_df.to_sql("students_raw", conn, index=False)
+        inscripciones_df.to_sql("inscripciones", conn, index=False)
+
+    print(f"✅ Created {DB_PATH} with {len(students_df)} students and {len(inscripciones_df)} semester-rows.")
+    conn.close()
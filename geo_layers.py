@@ -0,0 +1,118 @@
+# geo_layers.py
+"""
+Geometry layers (colonias, alcaldías) with precomputed simplified copies.
+
+Each layer is simplified once per tolerance with a coverage-preserving
+algorithm (shared borders are simplified together, so no gaps/slivers
+appear between neighbours) and cached in a GeoPackage, one table per level.
+Rendering code asks for a layer at a given figure size + DPI and gets the
+coarsest level whose error stays below a fraction of one output pixel.
+"""
+import os
+import shapely
+import geopandas as gpd
+
+from assets import asset_path
+
+CACHE_DIR = "geo_cache"
+LAYERS    = ["colonias", "alcaldias"]   # asset names in assets.ASSETS
+
+# Tolerances in degrees (0 = full resolution). At CDMX latitude
+# 0.00001° ≈ 1.1 m, so the levels go roughly 5 m, 20 m, 90 m, 330 m.
+SIMPLIFY_LEVELS = [0.0, 0.00005, 0.0002, 0.0008, 0.003]
+
+# Max simplification error allowed, as a fraction of one output pixel
+PIXEL_FRACTION = 0.5
+
+
+def _cache_path(name):
+    return os.path.join(CACHE_DIR, f"{name}_levels.gpkg")
+
+
+def _level_table(tol):
+    return f"tol_{tol:g}".replace(".", "_").replace("-", "m")
+
+
+def layer_path(name):
+    return asset_path(name)
+
+
+def load_layer(name):
+    """Full-resolution layer as read from its GeoJSON."""
+    return gpd.read_file(layer_path(name))
+
+
+def colonia_columns(gdf):
+    """(colonia name column, alcaldía column) of a colonias layer, whatever the release."""
+    cols = {c.lower(): c for c in gdf.columns}
+    col_colonia = next((cols[c] for c in ["colonia", "nomgeo", "nombre"] if c in cols), None)
+    col_alc     = next((cols[c] for c in ["alc", "alcaldia", "municipio", "delegacion"] if c in cols), None)
+    if col_colonia is None:
+        raise RuntimeError("Could not find the 'colonia' name column in GeoJSON.")
+    if col_alc is None:
+        raise RuntimeError("Could not find the 'alcaldia' column in GeoJSON.")
+    return col_colonia, col_alc
+
+
+def name_column(gdf, layer):
+    """Feature name column: colonia name for colonias, NOMGEO for alcaldías."""
+    if layer == "colonias":
+        return colonia_columns(gdf)[0]
+    return next(c for c in gdf.columns if c.upper() == "NOMGEO")
+
+
+def simplify_coverage(gdf, tol):
+    """Simplify all polygons together so shared edges stay identical."""
+    if tol <= 0:
+        return gdf
+    out = gdf.copy()
+    geoms = shapely.make_valid(out.geometry.values)
+    out["geometry"] = shapely.coverage_simplify(geoms, tol)
+    return out
+
+
+def build_levels(name, levels=SIMPLIFY_LEVELS, force=False):
+    """Write every simplification level of `name` to the cache; returns the cache path."""
+    src = layer_path(name)
+    path = _cache_path(name)
+    tables = [_level_table(t) for t in levels]
+
+    if not force and os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(src):
+        have = set(gpd.list_layers(path)["name"])
+        if all(t in have for t in tables):
+            return path
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    base = load_layer(name)
+    tmp = path.replace(".gpkg", ".tmp.gpkg")
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    for tol, table in zip(levels, tables):
+        simplify_coverage(base, tol).to_file(tmp, layer=table, driver="GPKG")
+    os.replace(tmp, path)
+    return path
+
+
+def pick_level(bounds, figsize=(10, 10), dpi=100, levels=SIMPLIFY_LEVELS):
+    """Coarsest tolerance whose error stays under PIXEL_FRACTION of a pixel."""
+    minx, miny, maxx, maxy = bounds
+    # the map is drawn with equal aspect, so the longer side sets the scale
+    deg_per_px = max((maxx - minx) / (figsize[0] * dpi),
+                     (maxy - miny) / (figsize[1] * dpi))
+    budget = deg_per_px * PIXEL_FRACTION
+    ok = [t for t in levels if t <= budget]
+    return max(ok) if ok else min(levels)
+
+
+def load_simplified(name, figsize=(10, 10), dpi=100, levels=SIMPLIFY_LEVELS):
+    """Layer `name` at the resolution that a figsize×dpi rendering can show."""
+    path = build_levels(name, levels)
+    # extent barely moves with simplification, so read it off the cheapest level
+    bounds = gpd.read_file(path, layer=_level_table(max(levels))).total_bounds
+    tol = pick_level(bounds, figsize, dpi, levels)
+    return gpd.read_file(path, layer=_level_table(tol))
+
+
+if __name__ == "__main__":
+    for layer in LAYERS:
+        print(f"✅ {layer}: {build_levels(layer, force=True)}")
@@ -0,0 +1,169 @@
+# geo_lookup.py
+"""
+Precomputed colonia -> alcaldía and colonia -> nearest-plantel lookup.
+
+The colonias catalog carries its own alcaldía attribute, but it is not the
+alcaldías layer: spellings differ and some polygons straddle a border. So
+each colonia polygon is assigned to the alcaldía polygon
+(limite-de-las-alcaldias.json) it overlaps most, measured in a metric CRS
+(UTM 14N). Candidate pairs come from an STRtree query, and all pair
+intersections are computed in one vectorized shapely call. A colonia that
+touches no alcaldía falls back to the nearest one. The nearest plantel
+(catchment) is the column minimum of the cached commute matrix.
+
+The result is one row per colonia feature id (same ids as join_index /
+spatial_index / commute), stored in unrc.db as geo_colonia_lookup. It is
+rebuilt only when either layer or the campus list changes. Aggregating to
+alcaldía or catchment is then a take on integer arrays:
+
+    lk = load_colonia_lookup(conn)
+    alc_ids = rollup(col_ids, lk["alcaldia_id"])      # -1 stays -1
+
+    python geo_lookup.py               # build + dropout by alcaldía / catchment
+"""
+import os, json, argparse
+import numpy as np
+import pandas as pd
+import shapely
+
+from geo_layers import layer_path, load_layer, colonia_columns, name_column
+from commute import load_commute_matrix
+from join_index import fold_names
+from db import writer
+
+DB_PATH   = "unrc.db"
+PLANTELES = ["URC Norte","URC Centro","URC Sur"]   # campuses with a catchment (generate_colonias)
+TABLE     = "geo_colonia_lookup"
+META      = "geo_lookup_meta"
+METRIC_CRS = 32614                                   # UTM 14N
+
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {META} (
+    name TEXT PRIMARY KEY,
+    meta TEXT NOT NULL
+);
+"""
+
+
+def overlay_alcaldia(gdf_col, gdf_alc):
+    """(alcaldía feature id, overlapped share of the colonia area) per colonia."""
+    col = np.asarray(gdf_col.to_crs(METRIC_CRS).geometry.values)
+    alc = np.asarray(gdf_alc.to_crs(METRIC_CRS).geometry.values)
+    col, alc = shapely.make_valid(col), shapely.make_valid(alc)
+
+    tree = shapely.STRtree(alc)
+    ci, ai = tree.query(col, predicate="intersects")
+    area = shapely.area(shapely.intersection(col[ci], alc[ai]))
+
+    # largest overlap per colonia: sort by (colonia, -area), keep the first of each
+    order = np.lexsort((-area, ci))
+    first = order[np.r_[True, ci[order][1:] != ci[order][:-1]]] if len(ci) else order
+    alc_id = np.full(len(col), -1, dtype=np.int64)
+    share = np.zeros(len(col))
+    alc_id[ci[first]] = ai[first]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share[ci[first]] = area[first] / shapely.area(col[ci[first]])
+
+    miss = np.flatnonzero(alc_id < 0)
+    if len(miss):                                    # outside every alcaldía: nearest one
+        mi, ni = tree.query_nearest(col[miss], return_distance=False)
+        alc_id[miss[mi]] = ni
+    return alc_id, np.nan_to_num(share)
+
+
+def build_colonia_lookup(gdf_col=None, gdf_alc=None, planteles=PLANTELES):
+    if gdf_col is None:
+        gdf_col = load_layer("colonias")
+    if gdf_alc is None:
+        gdf_alc = load_layer("alcaldias")
+    col_colonia, col_alc = colonia_columns(gdf_col)
+    alc_id, share = overlay_alcaldia(gdf_col, gdf_alc)
+    alc_names = gdf_alc[name_column(gdf_alc, "alcaldias")].astype(str).to_numpy()
+
+    commute = load_commute_matrix("colonias")
+    minutes = commute.minutes[:, commute.plantel_index(planteles)]
+    plantel_id = minutes.argmin(axis=1)
+
+    return pd.DataFrame({
+        "feature_id": np.arange(len(gdf_col)),
+        "colonia": gdf_col[col_colonia].astype(str).to_numpy(),
+        "alcaldia_attr": gdf_col[col_alc].astype(str).to_numpy(),
+        "alcaldia_id": alc_id,
+        "alcaldia": alc_names[alc_id],
+        "overlap": share.round(4),
+        "plantel_id": plantel_id,
+        "plantel": np.asarray(planteles, dtype=object)[plantel_id],
+        "plantel_min": minutes[np.arange(len(minutes)), plantel_id].round(1),
+    })
+
+
+def _meta(planteles):
+    return json.dumps({"colonias": os.path.getmtime(layer_path("colonias")),
+                       "alcaldias": os.path.getmtime(layer_path("alcaldias")),
+                       "planteles": list(planteles)}, sort_keys=True)
+
+
+def load_colonia_lookup(conn, planteles=PLANTELES, gdf_col=None, gdf_alc=None, rebuild=False):
+    """
+    The stored lookup (built once, rebuilt when a layer or the campus list changes).
+    `conn` may be read-only: only a (re)build goes through db.writer(conn).
+    """
+    meta = _meta(planteles)
+    row = None
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (META,)).fetchone():
+        row = conn.execute(f"SELECT meta FROM {META} WHERE name=?", (TABLE,)).fetchone()
+    if not rebuild and row and row[0] == meta:
+        return pd.read_sql(f"SELECT * FROM {TABLE} ORDER BY feature_id", conn)
+
+    lookup = build_colonia_lookup(gdf_col, gdf_alc, planteles)
+    w = writer(conn)
+    w.executescript(DDL)
+    lookup.to_sql(TABLE, w, index=False, if_exists="replace")
+    w.execute(f"INSERT OR REPLACE INTO {META} VALUES (?,?)", (TABLE, meta))
+    w.commit()
+    return lookup
+
+
+def rollup(col_ids, codes):
+    """Map colonia feature ids to `codes` (e.g. lookup['alcaldia_id']); -1 stays -1."""
+    col_ids = np.asarray(col_ids)
+    codes = np.asarray(codes)
+    return np.where(col_ids >= 0, codes[np.maximum(col_ids, 0)], -1)
+
+
+def group_rate(ids, values, labels):
+    """n and mean of `values` per integer group id, labelled."""
+    ok = ids >= 0
+    n = np.bincount(ids[ok], minlength=len(labels))
+    s = np.bincount(ids[ok], weights=np.asarray(values, dtype=float)[ok], minlength=len(labels))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({"grupo": labels, "n": n, "tasa_abandono": s / n})
+
+
+if __name__ == "__main__":
+    from join_index import colonia_ids
+    from db import get_connection
+    from small_area import student_outcomes
+    from instrument import stage
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--rebuild", action="store_true")
+    args = ap.parse_args()
+
+    conn = get_connection(args.db, readonly=False)
+    with stage("colonia_lookup") as s:
+        lk = load_colonia_lookup(conn, rebuild=args.rebuild)
+        s.rows = len(lk)
+    differs = int((fold_names(lk["alcaldia_attr"]) != fold_names(lk["alcaldia"])).sum())
+    print(f"✅ {TABLE}: {len(lk):,} colonias, median overlap {lk['overlap'].median():.2f}, "
+          f"{differs} assigned to another alcaldía than their catalog attribute")
+
+    students = student_outcomes(conn)
+    col_ids = colonia_ids(conn, students)
+    alc_labels = (lk.groupby("alcaldia_id")["alcaldia"].first()
+                  .reindex(range(lk["alcaldia_id"].max() + 1), fill_value="").to_numpy())
+    print(group_rate(rollup(col_ids, lk["alcaldia_id"]), students["abandono"], alc_labels)
+          .query("n > 0").round(3).to_string(index=False))
+    print(group_rate(rollup(col_ids, lk["plantel_id"]), students["abandono"], np.array(PLANTELES))
+          .round(3).to_string(index=False))
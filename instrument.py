@@ -0,0 +1,191 @@
+# instrument.py
+"""
+Per-stage timing and memory instrumentation for the scripts.
+
+    from instrument import stage
+
+    with stage("read_sql") as s:
+        df = pd.read_sql(...)
+        s.rows = len(df)
+
+    @stage("fit_logit")          # rows = len(result) when it has one
+    def fit(...): ...
+
+Each stage records wall and CPU time and a row count, plus peak traced
+memory (tracemalloc, above the memory held when the stage started) when
+URC_TRACEMALLOC=1. Stages may nest; the parent is kept in the record. One
+JSON line per stage is appended to <out_dir>/run_log.jsonl and a summary
+table is printed when the script exits.
+
+Environment:
+    URC_INSTRUMENT=0   disable (stage() becomes a no-op)
+    URC_TRACEMALLOC=1  trace peak memory per stage (off by default: tracemalloc
+                       makes allocation-heavy pandas code several times slower)
+    URC_PROFILE=1      sampling profiler: top frames per stage in the record
+"""
+import os, sys, json, time, uuid, atexit, functools, threading, tracemalloc
+from collections import Counter
+from contextlib import ContextDecorator
+from datetime import datetime
+
+OUT_DIR  = "out_pipeline"
+LOG_NAME = "run_log.jsonl"
+
+ENABLED   = os.environ.get("URC_INSTRUMENT", "1") != "0"
+TRACE_MEM = os.environ.get("URC_TRACEMALLOC", "0") == "1"
+PROFILE   = os.environ.get("URC_PROFILE", "0") == "1"
+PROFILE_INTERVAL = 0.005   # s between samples
+PROFILE_TOP = 8
+
+_run = {"id": uuid.uuid4().hex[:12], "script": os.path.basename(sys.argv[0] or "python"),
+        "out_dir": OUT_DIR, "records": [], "stack": [], "seq": 0, "atexit": False}
+
+
+def configure(out_dir=None, script=None, profile=None, trace_memory=None):
+    """Override output dir / script name / profiler before the first stage."""
+    global PROFILE, TRACE_MEM
+    if out_dir is not None:
+        _run["out_dir"] = out_dir
+    if script is not None:
+        _run["script"] = script
+    if profile is not None:
+        PROFILE = profile
+    if trace_memory is not None:
+        TRACE_MEM = trace_memory
+
+
+# -------------------------
+# Sampling profiler
+# -------------------------
+class _Sampler:
+    """Samples the instrumented thread's stack; counts the innermost repo-level frame."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id, self.interval = thread_id, interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            leaf = None
+            while frame is not None:
+                code = frame.f_code
+                key = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                leaf = leaf or key
+                fn = code.co_filename
+                if not ("site-packages" in fn or "/lib/python" in fn or fn.startswith("<frozen")):
+                    # first frame in our own code: where the time is attributed
+                    self.counts[key if key == leaf else f"{key} → {leaf}"] += 1
+                    break
+                frame = frame.f_back
+
+    def start(self):
+        self._t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._t.join()
+        total = sum(self.counts.values()) or 1
+        return [[k, round(v / total, 3)] for k, v in self.counts.most_common(PROFILE_TOP)]
+
+
+# -------------------------
+# Stages
+# -------------------------
+class stage(ContextDecorator):
+    """Context manager / decorator recording one stage."""
+
+    def __init__(self, name, rows=None, **extra):
+        self.name, self.rows, self.extra = name, rows, extra
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(self.name, self.rows, **self.extra) as s:
+                out = fn(*args, **kwargs)
+                if s.rows is None and hasattr(out, "__len__"):
+                    s.rows = len(out)
+                return out
+        return wrapper
+
+    def __enter__(self):
+        if not ENABLED:
+            return self
+        if not _run["atexit"]:
+            atexit.register(summary)
+            _run["atexit"] = True
+        if TRACE_MEM and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        stack = _run["stack"]
+        self.parent = stack[-1] if stack else None
+        if tracemalloc.is_tracing():
+            cur, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:       # keep the parent's peak before resetting it
+                self.parent._peak = max(self.parent._peak, peak)
+            tracemalloc.reset_peak()
+            self._mem0, self._peak = cur, cur
+        self._sampler = _Sampler(threading.get_ident()).start() if PROFILE else None
+        self.seq, self.depth = _run["seq"], len(stack)
+        _run["seq"] += 1
+        stack.append(self)
+        self._wall0, self._cpu0 = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not ENABLED:
+            return False
+        wall = time.perf_counter() - self._wall0
+        cpu = time.process_time() - self._cpu0
+        _run["stack"].pop()
+        rec = {"run_id": _run["id"], "script": _run["script"], "stage": self.name,
+               "seq": self.seq, "depth": self.depth,
+               "parent": self.parent.name if self.parent else None,
+               "ts": datetime.now().isoformat(timespec="seconds"),
+               "wall_s": round(wall, 4), "cpu_s": round(cpu, 4),
+               "peak_mb": None, "rows": self.rows,
+               "ok": exc_type is None, **self.extra}
+        self.label = " ".join([self.name, *map(str, self.extra.values())])
+        if tracemalloc.is_tracing() and hasattr(self, "_mem0"):
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            rec["peak_mb"] = round((self._peak - self._mem0) / 2**20, 2)
+            if self.parent is not None:
+                self.parent._peak = max(self.parent._peak, self._peak)
+        if self.rows:
+            rec["rows_per_s"] = round(self.rows / wall, 1) if wall > 0 else None
+        if self._sampler is not None:
+            rec["profile"] = self._sampler.stop()
+        _run["records"].append({**rec, "label": self.label})
+        _write(rec)
+        return False
+
+
+def _write(rec):
+    try:
+        os.makedirs(_run["out_dir"], exist_ok=True)
+        with open(os.path.join(_run["out_dir"], LOG_NAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, default=str) + "\n")
+    except OSError as e:
+        print(f"⚠️ run log not written: {e}")
+
+
+def summary(file=None):
+    """Table of this run's stages (nested stages indented)."""
+    recs = _run["records"]
+    if not recs:
+        return
+    file = file or sys.stdout
+    total = sum(r["wall_s"] for r in recs if r["parent"] is None) or 1.0
+    print(f"\n⏱️  {_run['script']} · run {_run['id']}", file=file)
+    print(f"{'stage':<32}{'wall s':>9}{'cpu s':>9}{'peak MB':>10}{'rows':>12}{'%':>6}", file=file)
+    for r in sorted(recs, key=lambda r: r["seq"]):    # start order: parent before children
+        name = "  " * r["depth"] + r["label"]
+        peak = "" if r["peak_mb"] is None else f"{r['peak_mb']:.1f}"
+        rows = "" if not r["rows"] else f"{r['rows']:,}"
+        pct = f"{100*r['wall_s']/total:.0f}" if r["parent"] is None else ""
+        flag = "" if r["ok"] else "  ✗"
+        print(f"{name[:32]:<32}{r['wall_s']:>9.2f}{r['cpu_s']:>9.2f}{peak:>10}{rows:>12}{pct:>6}{flag}", file=file)
+        for frame, share in r.get("profile") or []:
+            print(f"{'':<6}{share:>5.0%}  {frame}", file=file)
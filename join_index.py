@@ -0,0 +1,200 @@
+# join_index.py
+"""
+Persisted join index: DB colonia/alcaldía strings -> integer feature id.
+
+The index lives in unrc.db (table geo_join_index), one row per distinct DB
+name. Names are folded (NFKD -> ASCII, upper, collapsed spaces) with
+vectorized pandas string ops, only for names not seen before. Names with no
+matching polygon are kept with feature_id = -1 so they can be listed
+instead of silently becoming 0.0 on a map.
+
+The index is written through db.writer(conn), so a read-only job only
+opens a writer when it meets new names or a changed layer.
+
+Once built, joining a column of millions of rows is a factorize + take.
+DBs written by generate_colonias.py already carry students_raw.colonia_id
+(the polygon the student's home point was drawn in); colonia_ids() uses it
+as is and only falls back to the name join for DBs without it. Names alone
+cannot tell apart colonias that repeat within an alcaldía: the fallback
+sends those to the first matching polygon.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from geo_layers import layer_path, load_layer, colonia_columns, name_column
+from db import writer
+
+UNMATCHED = -1
+
+DDL = """
+CREATE TABLE IF NOT EXISTS geo_join_index (
+    layer      TEXT NOT NULL,
+    nombre     TEXT NOT NULL,
+    alcaldia   TEXT NOT NULL DEFAULT '',
+    clave      TEXT NOT NULL,
+    feature_id INTEGER NOT NULL,
+    PRIMARY KEY (layer, nombre, alcaldia)
+);
+CREATE TABLE IF NOT EXISTS geo_join_meta (
+    layer      TEXT PRIMARY KEY,
+    n_features INTEGER NOT NULL,
+    source_mtime REAL NOT NULL
+);
+"""
+
+
+def fold_names(s):
+    """Accent/case/space-insensitive key for a Series of names."""
+    return (pd.Series(s, dtype="string")
+            .str.normalize("NFKD")
+            .str.encode("ascii", "ignore").str.decode("ascii")
+            .str.upper()
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip()
+            .fillna(""))
+
+
+def _feature_keys(layer, gdf):
+    """(name key, alcaldía key) of every feature in layer order."""
+    if layer == "colonias":
+        col_colonia, col_alc = colonia_columns(gdf)
+        return fold_names(gdf[col_colonia]).to_numpy(), fold_names(gdf[col_alc]).to_numpy()
+    return fold_names(gdf[name_column(gdf, layer)]).to_numpy(), np.full(len(gdf), "", dtype=object)
+
+
+def _match(layer, names, alcaldias, gdf):
+    """feature id for each (name, alcaldía) pair; pair match first, name-only second."""
+    feat_name, feat_alc = _feature_keys(layer, gdf)
+    feat = pd.DataFrame({"clave": feat_name, "alc": feat_alc,
+                         "feature_id": np.arange(len(gdf))})
+    by_pair = feat.drop_duplicates(["clave", "alc"]).set_index(["clave", "alc"])["feature_id"]
+    by_name = feat.drop_duplicates("clave").set_index("clave")["feature_id"]
+
+    clave = fold_names(names).to_numpy()
+    alc = fold_names(alcaldias).to_numpy()
+    ids = by_pair.reindex(pd.MultiIndex.from_arrays([clave, alc])).to_numpy(dtype=float, copy=True)
+    miss = np.isnan(ids)
+    ids[miss] = by_name.reindex(clave[miss]).to_numpy()
+    ids = np.where(np.isnan(ids), UNMATCHED, ids).astype(np.int64)
+    ids[clave == ""] = UNMATCHED
+    return clave, ids
+
+
+def _ensure_tables(conn):
+    n = conn.execute("SELECT COUNT(*) FROM sqlite_master "
+                     "WHERE name IN ('geo_join_index', 'geo_join_meta')").fetchone()[0]
+    if n < 2:
+        writer(conn).executescript(DDL)
+
+
+def _check_layer(conn, layer, gdf):
+    """Drop the layer's index if its GeoJSON changed since it was built."""
+    mtime = os.path.getmtime(layer_path(layer))
+    row = conn.execute("SELECT n_features, source_mtime FROM geo_join_meta WHERE layer=?",
+                       (layer,)).fetchone()
+    if row == (len(gdf), mtime):
+        return
+    with writer(conn) as w:
+        w.execute("DELETE FROM geo_join_index WHERE layer=?", (layer,))
+        w.execute("INSERT OR REPLACE INTO geo_join_meta VALUES (?,?,?)", (layer, len(gdf), mtime))
+
+
+def load_join_index(conn, layer):
+    _ensure_tables(conn)
+    return pd.read_sql("SELECT nombre, alcaldia, clave, feature_id FROM geo_join_index WHERE layer=?",
+                       conn, params=(layer,))
+
+
+def _factorize(values):
+    codes, uniq = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    return codes, pd.Index(uniq, dtype=object).fillna("").astype(str)
+
+
+def _factorize_pairs(layer, names, alcaldias):
+    """(codes per row, distinct (nombre, alcaldia) frame) using integer factorization only."""
+    name_codes, name_uniq = _factorize(names)
+    if layer == "colonias" and alcaldias is not None:
+        alc_codes, alc_uniq = _factorize(alcaldias)
+    else:
+        alc_codes, alc_uniq = np.zeros(len(name_codes), dtype=np.int64), pd.Index([""])
+    codes, pair_uniq = pd.factorize(name_codes.astype(np.int64) * len(alc_uniq) + alc_codes)
+    distinct = pd.DataFrame({
+        "nombre": np.asarray(name_uniq, dtype=object)[pair_uniq // len(alc_uniq)],
+        "alcaldia": np.asarray(alc_uniq, dtype=object)[pair_uniq % len(alc_uniq)],
+    })
+    return codes, distinct
+
+
+def update_join_index(conn, layer, names, alcaldias=None, gdf=None, _distinct=None):
+    """
+    Add any (name, alcaldía) pairs not yet indexed; return the full index of `layer`.
+    `gdf` is only loaded/folded when there is something new to match.
+    """
+    _ensure_tables(conn)
+    if gdf is not None:
+        _check_layer(conn, layer, gdf)
+    new = _distinct if _distinct is not None else _factorize_pairs(layer, names, alcaldias)[1]
+
+    index = load_join_index(conn, layer)
+    known = pd.MultiIndex.from_frame(index[["nombre", "alcaldia"]])
+    new = new[~pd.MultiIndex.from_frame(new).isin(known)]
+    if new.empty:
+        return index
+
+    if gdf is None:
+        gdf = load_layer(layer)
+        _check_layer(conn, layer, gdf)
+        index = load_join_index(conn, layer)   # may have been reset above
+        known = pd.MultiIndex.from_frame(index[["nombre", "alcaldia"]])
+        new = new[~pd.MultiIndex.from_frame(new).isin(known)]
+
+    clave, ids = _match(layer, new["nombre"], new["alcaldia"], gdf)
+    new = new.assign(layer=layer, clave=clave, feature_id=ids)
+    with writer(conn) as w:
+        w.executemany(
+            "INSERT OR REPLACE INTO geo_join_index (layer, nombre, alcaldia, clave, feature_id) "
+            "VALUES (?,?,?,?,?)",
+            new[["layer", "nombre", "alcaldia", "clave", "feature_id"]].itertuples(index=False, name=None))
+
+    n_miss = int((ids == UNMATCHED).sum())
+    if n_miss:
+        print(f"⚠️ {n_miss} {layer} names without a matching feature (see unmatched_names)")
+    return load_join_index(conn, layer)
+
+
+def feature_ids(conn, layer, names, alcaldias=None, gdf=None):
+    """Integer feature id per row of `names` (UNMATCHED where there is none)."""
+    # factorize rows once; all string work below is on the distinct pairs
+    codes, distinct = _factorize_pairs(layer, names, alcaldias)
+    index = update_join_index(conn, layer, None, gdf=gdf, _distinct=distinct)
+    lut = index.set_index(["nombre", "alcaldia"])["feature_id"]
+    ids = lut.reindex(pd.MultiIndex.from_frame(distinct)).fillna(UNMATCHED)
+    return ids.to_numpy(dtype=np.int64)[codes]
+
+
+def colonia_ids(conn, students, gdf=None):
+    """
+    Colonia feature id per row of `students`: its colonia_id column when present,
+    else the name join on (colonia_residencia, alcaldia).
+    """
+    if "colonia_id" in students and students["colonia_id"].notna().any():
+        ids = students["colonia_id"].fillna(UNMATCHED).to_numpy(dtype=np.int64)
+        if gdf is None or ids.max() < len(gdf):
+            return ids
+        print("⚠️ colonia_id beyond the colonias layer (layer changed since generation): joining by name")
+    return feature_ids(conn, "colonias", students["colonia_residencia"], students["alcaldia"], gdf=gdf)
+
+
+def unmatched_names(conn, layer):
+    return pd.read_sql("SELECT nombre, alcaldia, clave FROM geo_join_index "
+                       "WHERE layer=? AND feature_id=?", conn, params=(layer, UNMATCHED))
+
+
+def feature_mean(ids, values, n_features):
+    """Mean of `values` per feature id (NaN where a feature has no rows)."""
+    ok = ids >= 0
+    sums = np.bincount(ids[ok], weights=np.asarray(values, dtype=float)[ok], minlength=n_features)
+    cnts = np.bincount(ids[ok], minlength=n_features)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(cnts > 0, sums / cnts, np.nan)
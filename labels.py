@@ -0,0 +1,37 @@
+# labels.py
+"""
+Dropout / stop-out labels derived from observed enrolment (the t+1 rule).
+
+For each student-semester t: dropout_event=1 if there is no record at t+1,
+the student never reappears later (no record > t+1) and has not graduated
+(reached the last semester seen in the panel).
+"""
+
+
+def derive_events(panel, id_col="id_estudiante", target_max=None):
+    """
+    Adds max_sem, semestre_next, next_exists, reappears_later, graduated, dropout_event.
+    target_max: last semester of the programme; defaults to the last one in `panel`
+    (pass the global value when `panel` is only a shard of the students).
+    """
+    max_sem_by_student = panel.groupby(id_col)["semestre"].max().rename("max_sem")
+    panel = panel.merge(max_sem_by_student, on=id_col, how="left")
+
+    panel["semestre_next"] = panel["semestre"] + 1
+    # next_active flag: does (id, semestre+1) exist?
+    key_df = panel[[id_col,"semestre"]].drop_duplicates()
+    key_df["exists"] = 1
+    panel = panel.merge(key_df.rename(columns={"semestre":"semestre_next", "exists":"next_exists"}),
+                        on=[id_col,"semestre_next"], how="left")
+    panel["next_exists"] = panel["next_exists"].fillna(0).astype(int)
+
+    # reappears_later: any record at a semester > t+1, i.e. the last one is
+    panel["reappears_later"] = (panel["max_sem"] > panel["semestre"] + 1).astype(int)
+
+    # Graduation: if max_sem == target max (assume 8), mark as graduated; they are not dropouts at last semester
+    if target_max is None:
+        target_max = int(panel["semestre"].max())  # if generator used 8, this will be 8
+    panel["graduated"] = (panel["max_sem"] >= target_max).astype(int)
+
+    panel["dropout_event"] = ((panel["next_exists"]==0) & (panel["reappears_later"]==0) & (panel["graduated"]==0)).astype(int)
+    return panel
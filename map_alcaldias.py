@@ -1,7 +1,6 @@
 # map_alcaldias.py
 # Choropleth of dropout by alcaldía + URC campuses
 
-import sqlite3
 import pandas as pd
 import geopandas as gpd
 import matplotlib.pyplot as plt
@@ -11,21 +10,15 @@ DB_PATH = "unrc.db"
 OUT_DIR = "./out_pipeline"
 os.makedirs(OUT_DIR, exist_ok=True)
 
-import requests
+from assets import asset_path
+from instrument import stage
+from db import get_connection, read_table, table_columns
+from join_index import feature_mean
+from geo_lookup import TABLE as LOOKUP_TABLE, rollup
+from labels import derive_events
 
-# File paths
-BASE_DIR = os.path.dirname(__file__)
-GEOJSON_FILE = os.path.join(BASE_DIR, "limite-de-las-alcaldas.json")
-
-# Download if not present
-if not os.path.exists(GEOJSON_FILE):
-    url = "https://datos.cdmx.gob.mx/dataset/bae265a8-d1f6-4614-b399-4184bc93e027/resource/deb5c583-84e2-4e07-a706-1b3a0dbc99b0/download/limite-de-las-alcaldas.json"
-    print(f"⬇️ Downloading GeoJSON from {url} ...")
-    r = requests.get(url)
-    r.raise_for_status()
-    with open(GEOJSON_FILE, "wb") as f:
-        f.write(r.content)
-    print(f"✅ Saved to {GEOJSON_FILE}")
+# File path (repo copy / mirror / cache; downloaded only if none has it)
+GEOJSON_FILE = asset_path("alcaldias")
 
 
 # --- Use uploaded file ---
@@ -33,32 +26,49 @@ if not os.path.exists(GEOJSON_FILE):
 
 
 # --- Load DB ---
-conn = sqlite3.connect(DB_PATH)
-students = pd.read_sql("SELECT * FROM students_raw", conn)
-panel = pd.read_sql("SELECT * FROM inscripciones", conn)
-conn.close()
-
-# Derive abandono: last semester < 8 → dropout
-panel = panel.sort_values(["student_id", "semestre"])
-panel["abandono"] = 0
-for sid, group in panel.groupby("student_id"):
-    max_sem = group["semestre"].max()
-    if max_sem < 8:
-        panel.loc[(panel["student_id"] == sid) &
-                  (panel["semestre"] == max_sem), "abandono"] = 1
-
-# Merge with alcaldía
-merged = panel.merge(students[["student_id", "alcaldia_residencia"]],
-                     on="student_id", how="left")
-dropout_map = merged.groupby("alcaldia_residencia")["abandono"].mean().reset_index()
+with stage("read_sql") as s:
+    conn = get_connection(DB_PATH)
+    students = read_table(conn, "students_raw", ["student_id", "alcaldia_id", "colonia_id", "alcaldia_residencia"],
+                          optional=["alcaldia_id", "colonia_id", "alcaldia_residencia"])
+    # alcaldías-layer feature id per student: stored by generator_sqlite_unrc, or the colonia
+    # rolled up through geo_colonia_lookup (generate_colonias); None = join by name below
+    alc_ids = None
+    if "alcaldia_id" in students:
+        alc_ids = students["alcaldia_id"].fillna(-1).to_numpy(dtype="int64")
+    elif "colonia_id" in students and table_columns(conn, LOOKUP_TABLE):
+        lookup = read_table(conn, LOOKUP_TABLE, ["alcaldia_id"], order_by="feature_id")
+        alc_ids = rollup(students["colonia_id"].fillna(-1).to_numpy(dtype="int64"), lookup["alcaldia_id"])
+    panel = read_table(conn, "inscripciones", ["student_id", "semestre"])
+    s.rows = len(panel)
+
+# Derive abandono: last semester < 8 → dropout (the shared t+1 rule, graduation at 8)
+with stage("derive_abandono", rows=len(panel)):
+    panel = panel.sort_values(["student_id", "semestre"])
+    panel["abandono"] = derive_events(panel, id_col="student_id", target_max=8)["dropout_event"].to_numpy()
 
 # --- Load GeoJSON ---
-gdf = gpd.read_file(GEOJSON_FILE)
-
-# CDMX official file: alcaldía names under 'nomgeo'
-merge_key = "NOMGEO"
-gdf = gdf.merge(dropout_map, left_on=merge_key,
-                right_on="alcaldia_residencia", how="left")
+with stage("read_file"):
+    gdf = gpd.read_file(GEOJSON_FILE)
+
+if alc_ids is not None:
+    # integer feature ids (same order as the GeoJSON): a bincount, no name matching
+    students["feature_id"] = alc_ids
+    merged = panel.merge(students[["student_id", "feature_id"]], on="student_id", how="left")
+    gdf["abandono"] = feature_mean(merged["feature_id"].fillna(-1).to_numpy(dtype="int64"),
+                                   merged["abandono"], len(gdf))
+else:
+    if "alcaldia_residencia" not in students:
+        raise SystemExit("⚠️ students_raw has no alcaldia_id, colonia_id + geo_colonia_lookup "
+                         "or alcaldia_residencia to place students in an alcaldía")
+    # Merge with alcaldía
+    merged = panel.merge(students[["student_id", "alcaldia_residencia"]],
+                         on="student_id", how="left")
+    dropout_map = merged.groupby("alcaldia_residencia")["abandono"].mean().reset_index()
+
+    # CDMX official file: alcaldía names under 'nomgeo'
+    merge_key = "NOMGEO"
+    gdf = gdf.merge(dropout_map, left_on=merge_key,
+                    right_on="alcaldia_residencia", how="left")
 
 # --- Plot choropleth ---
 fig, ax = plt.subplots(1, 1, figsize=(10, 8))
@@ -84,7 +94,8 @@ for _, row in campuses.iterrows():
             fontsize=8, ha="left", va="bottom")
 
 plt.legend()
-plt.savefig(os.path.join(OUT_DIR, "figura6_alcaldias.png"), dpi=200)
+with stage("savefig"):
+    plt.savefig(os.path.join(OUT_DIR, "figura6_alcaldias.png"), dpi=200)
 plt.close()
 
 print("✅ Saved map with URC campuses at out_pipeline/figura6_alcaldias.png")
@@ -58,51 +58,21 @@ print("✅ Saved:", os.path.join(OUT_DIR,"map_colonias_abandono.png"))
 
 
 # map_colonias.py
-import os, sqlite3, requests, unicodedata
+import os
 import pandas as pd
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from generate_colonias import COLONIAS_FILE, COLONIAS_URL, DB_PATH
-from generate_final_report_c import OUT_DIR
-
-os.makedirs(OUT_DIR, exist_ok=True)
+from generate_colonias import DB_PATH
+from db import get_connection, read_table
+from geo_layers import load_simplified
+from join_index import colonia_ids, feature_mean
+from geo_lookup import load_colonia_lookup
+from small_area import student_outcomes, smooth_features
+from map_renderer import MapRenderer
+from instrument import stage
 
+OUT_DIR = "out_pipeline"   # same as generate_final_report_c
 
-# Download colonias file if missing
-if not os.path.exists(COLONIAS_FILE):
-    r = requests.get(COLONIAS_URL, timeout=90)
-    r.raise_for_status()
-    with open(COLONIAS_FILE, "wb") as f:
-        f.write(r.content)
-
-gdf_col = gpd.read_file(COLONIAS_FILE)
-
-def norm(s):
-    if pd.isna(s): return s
-    s = str(s)
-    s = unicodedata.normalize("NFKD", s).encode("ASCII","ignore").decode("utf-8")
-    return s.upper().strip()
-
-# --- Load DB + compute risk by colonia ---
-conn = sqlite3.connect(DB_PATH)
-students = pd.read_sql("SELECT * FROM students_raw", conn)
-panel    = pd.read_sql("SELECT * FROM inscripciones", conn)
-conn.close()
-
-merged = panel.merge(students[["student_id","colonia_residencia"]],
-                     on="student_id", how="left")
-risk_by_col = merged.groupby("colonia_residencia")["abandono"].mean().reset_index()
-risk_by_col["key"] = risk_by_col["colonia_residencia"].map(norm)
-
-# Match colonias column name
-col_name = [c for c in gdf_col.columns if c.lower()=="colonia"]
-if not col_name:
-    col_name = [c for c in gdf_col.columns if c.lower() in ("nomgeo","nombre")]
-col_name = col_name[0]
-
-gdf_col["key"] = gdf_col[col_name].map(norm)
-gdf_col = gdf_col.merge(risk_by_col[["key","abandono"]], on="key", how="left")
-gdf_col["abandono"] = gdf_col["abandono"].fillna(0.0)
+FIGSIZE, DPI = (12,12), 150
+TOP_K = 20
 
 # --- Define planteles (URC campuses) ---
 planteles = pd.DataFrame({
@@ -112,28 +82,80 @@ planteles = pd.DataFrame({
     "color": ["blue","green","purple"]
 })
 
-# --- Plot map ---
-fig, ax = plt.subplots(figsize=(12,12))
-
-# Choropleth of colonias
-gdf_col.plot(column="abandono", cmap="Reds", legend=True, ax=ax,
-             legend_kwds={"label":"Tasa de abandono", "orientation":"vertical"},
-             linewidth=0.1, edgecolor="gray")
-
-# Overlay planteles
-for _, row in planteles.iterrows():
-    ax.scatter(row["lon"], row["lat"], c=row["color"], s=80, marker="o", edgecolor="black")
-    ax.text(row["lon"], row["lat"]+0.01, row["nombre"],
-            fontsize=9, ha="center", va="bottom",
-            bbox=dict(boxstyle="round,pad=0.2", fc="white", alpha=0.7))
-
-ax.set_title("Abandono observado por colonia y planteles URC en CDMX", fontsize=14)
-ax.axis("off")
-
-plt.tight_layout()
-outpath = os.path.join(OUT_DIR,"map_colonias_abandono_planteles.png")
-plt.savefig(outpath, dpi=150)
-plt.close()
-
-print("✅ Saved:", outpath)
 
+def colonia_dropout(conn, gdf_col):
+    """Observed dropout rate per colonia feature (NaN where nobody lives)."""
+    students = read_table(conn, "students_raw", ["student_id","colonia_id","colonia_residencia","alcaldia"],
+                          optional=["colonia_id"])
+    panel    = read_table(conn, "inscripciones", ["student_id","abandono"])
+
+    # stored colonia_id, or colonia name -> feature id through the join index (unmatched = -1)
+    students["feature_id"] = colonia_ids(conn, students, gdf=gdf_col)
+    merged = panel.merge(students[["student_id","feature_id"]],
+                         on="student_id", how="left")
+    # NaN where no student lives there: shown as "sin datos", not as 0% dropout
+    return feature_mean(merged["feature_id"].to_numpy(), merged["abandono"], len(gdf_col))
+
+
+def colonia_dropout_eb(conn, gdf_col):
+    """Student dropout per colonia feature, shrunk toward the alcaldía (small_area.py)."""
+    students = student_outcomes(conn)
+    ids = colonia_ids(conn, students, gdf=gdf_col)
+    lookup = load_colonia_lookup(conn)        # parent = alcaldía polygon each colonia lies in
+    eb = smooth_features(ids, students["abandono"], len(gdf_col), lookup["alcaldia_id"].to_numpy())
+    eb.insert(0, "colonia", lookup["colonia"].to_numpy())
+    eb.insert(1, "alcaldia", lookup["alcaldia"].to_numpy())
+    return eb
+
+
+def plot_colonias_map(gdf_col, values, outpath, figsize=FIGSIZE, dpi=DPI,
+                      title="Abandono observado por colonia y planteles URC en CDMX",
+                      label="Tasa de abandono", renderer=None):
+    """One map; pass a MapRenderer to reuse its geometry across several maps."""
+    own = renderer is None
+    if own:
+        renderer = MapRenderer(gdf_col, figsize=figsize, dpi=dpi, planteles=planteles)
+    renderer.render(values, title, label=label, path=outpath)
+    if own:
+        renderer.close()
+    return outpath
+
+
+if __name__ == "__main__":
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    # Simplified to what a FIGSIZE×DPI render can actually show
+    with stage("load_simplified") as s:
+        gdf_col = load_simplified("colonias", figsize=FIGSIZE, dpi=DPI)
+        s.rows = len(gdf_col)
+
+    # --- Load DB + compute risk by colonia ---
+    with stage("colonia_dropout"):
+        conn = get_connection(DB_PATH)   # read-only; join index / lookup open a writer only if stale
+        abandono = colonia_dropout(conn, gdf_col)
+    with stage("colonia_dropout_eb"):
+        eb = colonia_dropout_eb(conn, gdf_col)
+
+    # polygons, planteles and colorbar drawn once; each map only swaps the colors
+    with stage("build_renderer", rows=len(gdf_col)):
+        renderer = MapRenderer(gdf_col, figsize=FIGSIZE, dpi=DPI, planteles=planteles)
+
+    with stage("plot_savefig", rows=len(gdf_col)):
+        outpath = plot_colonias_map(gdf_col, abandono,
+                                    os.path.join(OUT_DIR,"map_colonias_abandono_planteles.png"),
+                                    renderer=renderer)
+    print("✅ Saved:", outpath)
+
+    # Smoothed estimates: every colonia gets a value, small ones lean on their alcaldía
+    with stage("plot_savefig", rows=len(gdf_col), figure="eb"):
+        outpath = plot_colonias_map(gdf_col, eb["tasa_eb"].to_numpy(),
+                                    os.path.join(OUT_DIR,"map_colonias_abandono_eb.png"),
+                                    title="Abandono estimado por colonia (Bayes empírico) y planteles URC",
+                                    label="Abandono estimado (estudiantes)", renderer=renderer)
+    renderer.close()
+    print("✅ Saved:", outpath)
+
+    top = eb[eb["n"] > 0].sort_values("tasa_eb", ascending=False).head(TOP_K)
+    path = os.path.join(OUT_DIR, f"top{TOP_K}_colonias_eb.csv")
+    top.to_csv(path, index=False)
+    print("✅ Saved:", path)
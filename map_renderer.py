@@ -0,0 +1,189 @@
+# map_renderer.py
+"""
+One geometry draw, many choropleths.
+
+gdf.plot() rebuilds every polygon path, the collection, the colorbar and
+the campus markers on each call. MapRenderer does that once per layer:
+
+  * polygon rings -> one matplotlib Path per feature (shapely get_parts /
+    get_rings / get_coordinates, no per-ring Python loop), in a single
+    PathCollection
+  * campus markers + labels, axis limits, aspect, colorbar
+
+Each map then only swaps the collection's color array, the colour limits,
+the title and the colorbar label before savefig, so the per-map cost is
+little more than rasterization. series() writes a set of maps (per
+semester, plantel, scenario…). animate() writes the same frames as an
+animated GIF.
+
+    r = MapRenderer(gdf_col, figsize=(10,10), dpi=100, planteles=planteles)
+    r.render(values, "Riesgo por colonia", label="Prob. abandono", path="mapa.png")
+    r.series({"sem1": (v1, "Semestre 1"), ...}, out_dir)
+    r.animate([(v1, "Semestre 1"), ...], "abandono_semestres.gif")
+
+    python map_renderer.py                # per-semester colonia maps + GIF
+"""
+import io, os, argparse
+import numpy as np
+import shapely
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection
+
+OUT_DIR = "out_pipeline"
+DB_PATH = "unrc.db"
+FIGSIZE, DPI = (10,10), 100
+
+
+def feature_paths(geoms):
+    """One compound Path (all rings of all parts) per geometry, in order."""
+    geoms = np.asarray(geoms)
+    parts, part_of = shapely.get_parts(geoms, return_index=True)
+    rings, ring_of = shapely.get_rings(parts, return_index=True)
+    xy, coord_of = shapely.get_coordinates(rings, return_index=True)
+
+    codes = np.full(len(xy), Path.LINETO, dtype=Path.code_type)
+    starts = np.r_[0, np.flatnonzero(np.diff(coord_of)) + 1] if len(xy) else np.array([], dtype=int)
+    codes[starts] = Path.MOVETO
+    codes[np.r_[starts[1:] - 1, len(xy) - 1] if len(xy) else starts] = Path.CLOSEPOLY
+
+    feat = part_of[ring_of[coord_of]]                       # geometry of every vertex
+    bounds = np.searchsorted(feat, np.arange(len(geoms) + 1))
+    return [Path(xy[a:b], codes[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+class MapRenderer:
+    def __init__(self, gdf, figsize=FIGSIZE, dpi=DPI, cmap="Reds", planteles=None,
+                 edgecolor="gray", linewidth=0.1, missing_color="#eeeeee", label=""):
+        self.dpi = dpi
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        cmap = matplotlib.colormaps[cmap].copy()
+        cmap.set_bad(missing_color)                         # NaN -> "sin datos"
+        self.coll = PathCollection(feature_paths(gdf.geometry.values), cmap=cmap,
+                                   edgecolor=edgecolor, linewidth=linewidth)
+        self.coll.set_array(np.ma.masked_all(len(gdf)))
+        self.ax.add_collection(self.coll, autolim=True)
+
+        minx, miny, maxx, maxy = gdf.total_bounds
+        self.ax.set_xlim(minx, maxx)
+        self.ax.set_ylim(miny, maxy)
+        self.ax.set_aspect(1 / np.cos(np.deg2rad((miny + maxy) / 2)))   # as geopandas does for lon/lat
+
+        if planteles is not None:
+            self.ax.scatter(planteles["lon"], planteles["lat"], c=planteles["color"], s=80,
+                            marker="o", edgecolor="black", zorder=3)
+            for _, row in planteles.iterrows():
+                self.ax.text(row["lon"], row["lat"]+0.01, row["nombre"], fontsize=9, ha="center",
+                             va="bottom", zorder=4,
+                             bbox=dict(boxstyle="round,pad=0.2", fc="white", alpha=0.7))
+        self.cbar = self.fig.colorbar(self.coll, ax=self.ax, shrink=0.7, label=label)
+        self.title = self.ax.set_title("Ág", fontsize=14)   # reserve a title line in the layout
+        self.ax.axis("off")
+        self.fig.tight_layout()
+        self.title.set_text("")
+
+    def update(self, values, title="", label=None, vmin=None, vmax=None):
+        v = np.ma.masked_invalid(np.asarray(values, dtype=float))
+        self.coll.set_array(v)
+        lo = vmin if vmin is not None else (v.min() if v.count() else 0.0)
+        hi = vmax if vmax is not None else (v.max() if v.count() else 1.0)
+        self.coll.set_clim(lo, hi if hi > lo else lo + 1e-9)
+        self.title.set_text(title)
+        if label is not None:
+            self.cbar.set_label(label)
+
+    def render(self, values, title="", label=None, path=None, vmin=None, vmax=None):
+        """Swap colors/title and render to an in-memory PNG (also written to `path`)."""
+        self.update(values, title, label, vmin, vmax)
+        buf = io.BytesIO()
+        self.fig.savefig(buf, format="png", dpi=self.dpi)
+        if path:
+            with open(path, "wb") as f:
+                f.write(buf.getbuffer())
+        buf.seek(0)
+        return buf
+
+    def _shared(self, values):
+        allv = np.concatenate([np.asarray(v, dtype=float).ravel() for v in values])
+        allv = allv[np.isfinite(allv)]
+        return (allv.min(), allv.max()) if len(allv) else (0.0, 1.0)
+
+    def series(self, maps, out_dir, prefix="mapa", label=None, shared_scale=True):
+        """maps: {name: (values, title)} -> one PNG each, on a common scale by default."""
+        lim = self._shared([v for v, _ in maps.values()]) if shared_scale else (None, None)
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for name, (values, title) in maps.items():
+            path = os.path.join(out_dir, f"{prefix}_{name}.png")
+            self.render(values, title, label, path, *lim)
+            paths.append(path)
+        return paths
+
+    def animate(self, frames, path, fps=1, label=None, shared_scale=True):
+        """frames: [(values, title), …] -> animated GIF on a common colour scale."""
+        from matplotlib.animation import FuncAnimation, PillowWriter
+        lim = self._shared([v for v, _ in frames]) if shared_scale else (None, None)
+
+        def draw(i):
+            self.update(frames[i][0], frames[i][1], label, *lim)
+            return (self.coll, self.title)
+
+        anim = FuncAnimation(self.fig, draw, frames=len(frames), blit=False)
+        anim.save(path, writer=PillowWriter(fps=fps), dpi=self.dpi)
+        return path
+
+    def close(self):
+        plt.close(self.fig)
+
+
+def semester_feature_means(ids, semestre, values, n_features):
+    """{semestre: mean of `values` per feature} from one bincount over (semestre, feature)."""
+    sems = np.unique(semestre)
+    s_idx = np.searchsorted(sems, semestre)
+    ok = ids >= 0
+    cell = s_idx[ok] * n_features + ids[ok]
+    size = len(sems) * n_features
+    sums = np.bincount(cell, weights=np.asarray(values, dtype=float)[ok], minlength=size)
+    cnts = np.bincount(cell, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(cnts > 0, sums / cnts, np.nan).reshape(len(sems), n_features)
+    return dict(zip(sems.tolist(), means))
+
+
+if __name__ == "__main__":
+    import time
+    from geo_layers import load_simplified
+    from join_index import colonia_ids
+    from risk_model import load_panel
+    from db import get_connection
+    from map_colonias import planteles
+    from instrument import stage
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--fps", type=float, default=1.0)
+    ap.add_argument("--no-gif", action="store_true")
+    args = ap.parse_args()
+
+    with stage("load_geometry") as s:
+        gdf_col = load_simplified("colonias", figsize=FIGSIZE, dpi=DPI)
+        s.rows = len(gdf_col)
+    conn = get_connection(args.db)    # read-only; the name join opens a writer only for new names
+    merged = load_panel(conn)
+    ids = colonia_ids(conn, merged, gdf=gdf_col)
+    by_sem = semester_feature_means(ids, merged["semestre"].to_numpy(), merged["abandono"], len(gdf_col))
+
+    with stage("build_renderer", rows=len(gdf_col)):
+        renderer = MapRenderer(gdf_col, planteles=planteles, label="Tasa de abandono")
+    frames = {f"sem{s}": (v, f"Abandono por colonia — semestre {s}") for s, v in by_sem.items()}
+    t0 = time.perf_counter()
+    with stage("render_series", rows=len(frames)):
+        paths = renderer.series(frames, os.path.join(OUT_DIR, "mapas_semestre"), prefix="colonias")
+    print(f"✅ {len(paths)} maps in {time.perf_counter()-t0:.2f}s → {os.path.dirname(paths[0])}")
+    if not args.no_gif:
+        with stage("render_gif", rows=len(frames)):
+            gif = renderer.animate(list(frames.values()), os.path.join(OUT_DIR, "abandono_semestres.gif"),
+                                   fps=args.fps)
+        print("✅ Saved:", gif)
+    renderer.close()
@@ -0,0 +1,224 @@
+# param_sweep.py
+"""
+Parameter-recovery / sensitivity sweep for the generate_colonias.py logit.
+
+generate_colonias.py draws dropout from known coefficients (COEFS,
+INTERCEPT, SEM_EFFECT). This harness checks how well a logit fitted on the
+simulated panel recovers them as the sample size, the dropout rate, the
+true parameters and the fitted specification change. The grid is
+
+    n_students × PARAM_SETS × dropout rate × seed
+
+and every configuration runs in memory in a worker process. It calls the
+real generate_students + simulate_inscripciones and then fits every spec in
+SPECS on the same panel, so the specs are compared on paired data. There is
+no DB and no figure. The colonias layer is loaded once per worker. A
+dropout rate is reached by moving only the intercept: calibration.py solves
+it on a pilot cohort for each (set, rate) before the pool starts.
+
+SPECS:
+    completo         all COEFS columns + semester dummies (the true model)
+    sin_marginacion  completo without marginacion_index (omitted variable)
+    reporte          risk_model.PREDICTORS, what generate_final_report_c.py fits
+
+The logit is plain Newton–Raphson (IRLS) on the design matrix, as in
+partitioned.py, without statsmodels. Outputs in out_pipeline/:
+    param_sweep_runs.csv     one row per run × spec × coefficient
+    param_sweep_summary.csv  bias, RMSE, 95% CI coverage and AUC per cell
+
+    python param_sweep.py --n 500,2000,5000 --seeds 100 --workers 8
+    python param_sweep.py --sets base --rates gen --n 1000,4000,16000 --seeds 50
+"""
+import os, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import expit
+from scipy.stats import rankdata
+
+import generate_colonias as gc
+from risk_model import PREDICTORS
+from instrument import stage
+
+OUT_DIR = "out_pipeline"
+CATALOG_SEED = 0             # same colonia catalog (marginación draw) in every worker and the pilot
+N_PILOT = 20_000
+
+# overrides of generate_colonias.COEFS
+PARAM_SETS = {
+    "base": {},
+    "marginacion_fuerte": {"marginacion_index": 0.80},
+    "promedio_debil": {"promedio": -0.45, "asistencia_pct": -0.05},
+}
+
+SPECS = {
+    "completo": list(gc.COEFS),
+    "sin_marginacion": [c for c in gc.COEFS if c != "marginacion_index"],
+    "reporte": PREDICTORS,
+}
+SEM_DUMMIES = {"completo", "sin_marginacion"}
+
+_colonias = None
+
+
+# -------------------------
+# One configuration (worker)
+# -------------------------
+def _init_worker():
+    global _colonias
+    np.random.seed(CATALOG_SEED)
+    _colonias = gc.load_colonias(verbose=False)
+
+
+def auc(y, score):
+    """ROC AUC from ranks (Mann–Whitney); same value as sklearn's roc_auc_score, without its checks."""
+    pos = y == 1
+    n1, n0 = pos.sum(), (~pos).sum()
+    return (rankdata(score)[pos].sum() - n1 * (n1 + 1) / 2) / (n1 * n0)
+
+
+def fit_logit_irls(X, y, tol=1e-8, max_iter=35):
+    """(beta, standard errors, converged) by Newton–Raphson."""
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        p = expit(X @ beta)
+        H = X.T @ (X * (p * (1 - p))[:, None])
+        step = np.linalg.solve(H, X.T @ (y - p))
+        beta = beta + step
+        if np.max(np.abs(step)) < tol:
+            break
+    else:
+        return beta, np.full(len(beta), np.nan), False
+    p = expit(X @ beta)
+    H = X.T @ (X * (p * (1 - p))[:, None])
+    return beta, np.sqrt(np.diag(np.linalg.inv(H))), True
+
+
+def simulate_panel(n, seed, intercept, coefs):
+    """inscripciones + student covariates, plus the true dropout probability per row."""
+    if _colonias is None:
+        _init_worker()
+    np.random.seed(seed)
+    students = gc.generate_students(n, *_colonias, birthdates=False)
+    ins = gc.simulate_inscripciones(students, intercept=intercept, coefs=coefs)
+    st = students.iloc[ins["student_id"].to_numpy() - 1]          # student_id = 1..n in order
+    for c in ("horas_trabajo", "traslado_min", "marginacion_index"):
+        ins[c] = st[c].to_numpy(dtype=float)
+    sem_effect = ins["semestre"].map(gc.SEM_EFFECT).fillna(-0.40).to_numpy()
+    z = gc.dropout_z(sem_effect, ins["promedio"].to_numpy(), ins["asistencia_pct"].to_numpy(),
+                     ins["horas_trabajo"].to_numpy(), ins["traslado_min"].to_numpy(),
+                     ins["marginacion_index"].to_numpy(), ins["beca"].to_numpy(),
+                     ins["apoyo_tutoria"].to_numpy(), intercept, coefs)
+    return ins, expit(z)
+
+
+def run_config(cfg):
+    """Fit every spec on one simulated panel; one record per spec × coefficient."""
+    ins, p_true = simulate_panel(cfg["n_students"], cfg["seed"], cfg["intercept"], PARAM_SETS[cfg["param_set"]])
+    y = ins["abandono"].to_numpy(dtype=float)
+    truth = {**gc.COEFS, **PARAM_SETS[cfg["param_set"]]}
+    dummies = pd.get_dummies(ins["semestre"], prefix="sem", drop_first=True, dtype=float).to_numpy()
+    base = {**cfg, "rows": len(ins), "tasa": y.mean(), "auc_verdadero": auc(y, p_true)}
+
+    records = []
+    for spec, cols in SPECS.items():
+        X = np.column_stack([np.ones(len(ins)), ins[cols].to_numpy(dtype=float)]
+                            + ([dummies] if spec in SEM_DUMMIES else []))
+        beta, se, ok = fit_logit_irls(X, y)
+        auc_fit = auc(y, X @ beta)
+        for j, c in enumerate(cols, start=1):
+            records.append({**base, "spec": spec, "var": c, "true": truth[c], "est": beta[j],
+                            "se": se[j], "auc": auc_fit, "converged": ok})
+    return records
+
+
+# -------------------------
+# Grid + summary
+# -------------------------
+def solve_intercepts(param_sets, rates):
+    """{(set, rate): intercept}; rate None keeps generate_colonias.INTERCEPT."""
+    from calibration import colonias_draws, solve_intercept
+    out = {}
+    effects = np.array([gc.SEM_EFFECT.get(s, -0.40) for s in range(1, gc.SEMESTRES_MAX + 1)])
+    for name in param_sets:
+        z0 = None
+        for rate in rates:
+            if rate is None:
+                out[name, rate] = gc.INTERCEPT
+                continue
+            if z0 is None:
+                z0, _ = colonias_draws(N_PILOT, CATALOG_SEED, coefs=PARAM_SETS[name])
+            out[name, rate] = solve_intercept(z0, effects, rate)
+    return out
+
+
+def build_grid(ns, param_sets, rates, seeds, seed0=0):
+    intercepts = solve_intercepts(param_sets, rates)
+    # seed r is shared by every cell (common random numbers across n / set / rate)
+    return [{"n_students": n, "param_set": name, "rate": "gen" if rate is None else rate,
+             "intercept": intercepts[name, rate], "seed": seed0 + r}
+            for name in param_sets for rate in rates for n in ns for r in range(seeds)]
+
+
+def run_sweep(grid, workers=None):
+    chunk = max(1, len(grid) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        return pd.DataFrame([r for recs in pool.map(run_config, grid, chunksize=chunk) for r in recs])
+
+
+def summarize(runs):
+    """Bias / RMSE / 95% CI coverage per (set, rate, n, spec, coefficient), with mean AUC."""
+    err = runs["est"] - runs["true"]
+    z = 1.959964
+    runs = runs.assign(err=err, sq=err**2, cubre=(err.abs() <= z * runs["se"]).astype(float))
+    keys = ["param_set", "rate", "n_students", "spec", "var"]
+    out = runs.groupby(keys, sort=False).agg(
+        true=("true", "first"), est=("est", "mean"), bias=("err", "mean"), mse=("sq", "mean"),
+        cobertura95=("cubre", "mean"), auc=("auc", "mean"), auc_verdadero=("auc_verdadero", "mean"),
+        tasa=("tasa", "mean"), runs=("seed", "nunique"))
+    out["rmse"] = np.sqrt(out.pop("mse"))
+    out["bias_rel"] = out["bias"] / out["true"].where(out["true"] != 0)
+    return out.reset_index()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--n", default="500,2000,5000", help="student counts, comma-separated")
+    ap.add_argument("--sets", default=",".join(PARAM_SETS), help=f"of {list(PARAM_SETS)}")
+    ap.add_argument("--rates", default="gen,0.09",
+                    help="global dropout rates over student-semester rows; gen = generator intercept")
+    ap.add_argument("--seeds", type=int, default=100, help="replications per cell")
+    ap.add_argument("--seed", type=int, default=0, help="first seed")
+    ap.add_argument("--workers", type=int, default=None)
+    args = ap.parse_args()
+
+    sets = args.sets.split(",")
+    unknown = [s for s in sets if s not in PARAM_SETS]
+    if unknown:
+        raise SystemExit(f"⚠️ unknown parameter set(s) {unknown}; choose from {list(PARAM_SETS)}")
+    rates = [None if r == "gen" else float(r) for r in args.rates.split(",")]
+    ns = [int(n) for n in args.n.split(",")]
+
+    with stage("solve_intercepts"):
+        grid = build_grid(ns, sets, rates, args.seeds, args.seed)
+    t0 = time.perf_counter()
+    with stage("sweep", rows=len(grid)):
+        runs = run_sweep(grid, args.workers)
+    dt = time.perf_counter() - t0
+    print(f"{len(grid):,} runs ({len(SPECS)} specs each) in {dt:.1f}s, {len(grid)/dt:.1f} runs/s")
+    if not runs["converged"].all():
+        print(f"⚠️ {int((~runs['converged']).sum())} fits did not converge")
+
+    summary = summarize(runs)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    runs.to_csv(os.path.join(OUT_DIR, "param_sweep_runs.csv"), index=False)
+    summary.to_csv(os.path.join(OUT_DIR, "param_sweep_summary.csv"), index=False)
+
+    for (name, rate), cell in summary.groupby(["param_set", "rate"], sort=False):
+        print(f"\n== {name}, tasa {rate} (observada {cell['tasa'].mean():.3f}) — bias / RMSE")
+        print(cell.pivot_table(index=["spec", "var"], columns="n_students", values=["bias", "rmse"],
+                               sort=False).round(3).to_string())
+        print(cell.groupby(["spec", "n_students"])[["auc", "auc_verdadero"]].mean()
+                  .unstack("n_students").round(3).to_string())
+    print("\n✅ Saved:", os.path.join(OUT_DIR, "param_sweep_summary.csv"))
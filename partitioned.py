@@ -0,0 +1,207 @@
+# partitioned.py
+"""
+Partition-parallel execution of pipeline_aggregate_analyze.py.
+
+Everything the pipeline derives per student (commute, merges, max_sem,
+next_exists / reappears_later, graduation) only looks at that student's
+rows. So the students are split into N shards by id range. Each worker
+process reads its shard from SQLite with a range query (indexed), derives
+the panel and returns only:
+
+  * per-semester sums (n, dropout, promedio, asistencia) and student counts
+  * its panel exports, written as part files (concatenated in shard order)
+  * its design matrix, saved as .npy for the logit
+
+The logit is fitted by Newton–Raphson (IRLS) on sufficient statistics.
+Each iteration, every shard returns X'WX, X'(y - p) and its
+log-likelihood at the current coefficients, reading its design matrix
+memory-mapped in blocks. Only k×k matrices travel back, and no process
+holds more than one shard.
+
+    python pipeline_aggregate_analyze.py --shards 16 --workers 4
+    python pipeline_aggregate_analyze.py --shards 16 --create-indexes   # once per DB: id indexes
+"""
+import os, shutil, tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from commute import load_commute_matrix
+from labels import derive_events
+from export import write_table, concat_tables
+from db import get_connection, read_table
+
+ID = "id_estudiante"
+STUDENT_COLS = [ID,"sexo","fecha_nacimiento","alcaldia_residencia","plantel","ingreso_familiar",
+                "personas_hogar","trabaja_horas","dispositivo_propio","internet_casa","traslado_minutos"]
+PREDICTORS = ["promedio_semestre","asistencia_pct","ingreso_familiar","traslado_minutos","beca","trabaja_horas"]
+DERIVED = ["traslado_minutos"]   # computed from the commute matrix after the read
+STORED_COLS = [c for c in STUDENT_COLS if c not in DERIVED]
+EXPORTS = ["panel_raw", "panel_with_events"]
+BLOCK_ROWS = 500_000         # rows of X per block inside a worker
+
+_commute = None
+
+
+def shard_bounds(conn, shards):
+    """[lo, hi) id ranges with about the same number of students each."""
+    ids = np.sort(read_table(conn, "students_raw", [ID])[ID].to_numpy())
+    cuts = np.unique(ids[np.linspace(0, len(ids), shards + 1)[:-1].astype(int)])
+    return list(zip(cuts.tolist(), cuts[1:].tolist() + [int(ids[-1]) + 1]))
+
+
+INDEXES = {"ix_students_raw_id": ("students_raw", [ID]),
+           "ix_inscripciones_id": ("inscripciones", [ID, "semestre"])}
+
+
+def missing_indexes(conn):
+    have = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    return [name for name in INDEXES if name not in have]
+
+
+def ensure_indexes(db_path):
+    """Create the shard-range indexes (explicit opt-in: the analysis itself only reads)."""
+    conn = get_connection(db_path, readonly=False)
+    for name, (table, cols) in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(cols)})")
+    conn.commit()
+
+
+# -------------------------
+# Map: one shard
+# -------------------------
+def _derive_shard(db_path, k, lo, hi, target_max, seed, work_dir):
+    global _commute
+    conn = get_connection(db_path)               # read-only, reused by every shard this worker runs
+    in_shard = {ID: ((">=", lo), ("<", hi))}
+    stu = read_table(conn, "students_raw", STORED_COLS, where=in_shard)
+    ins = read_table(conn, "inscripciones", where=in_shard)
+
+    # commute: same rule as the single-process run, one RNG stream per shard
+    rng = np.random.default_rng(seed)
+    if _commute is None:
+        _commute = load_commute_matrix("alcaldias")
+    base_min = _commute.lookup(_commute.origin_index(stu["alcaldia_residencia"]),
+                               _commute.plantel_index(stu["plantel"]))
+    base_min = np.where(np.isnan(base_min), rng.uniform(40, 70, len(stu)), base_min)
+    stu["traslado_minutos"] = base_min * rng.uniform(0.85, 1.15, len(stu))
+
+    panel = ins.merge(stu[STUDENT_COLS], on=ID, how="left")
+    parts = {"panel_raw": write_table(panel, os.path.join(work_dir, f"panel_raw_{k:05d}"))}
+    panel = derive_events(panel, ID, target_max=target_max)
+    parts["panel_with_events"] = write_table(panel, os.path.join(work_dir, f"panel_with_events_{k:05d}"))
+
+    agg = panel.groupby("semestre").agg(
+        n=("dropout_event","size"), sum_abandono=("dropout_event","sum"),
+        sum_promedio=("promedio_semestre","sum"), n_promedio=("promedio_semestre","count"),
+        sum_asistencia=("asistencia_pct","sum"), n_asistencia=("asistencia_pct","count"))
+    per_student = panel.groupby(ID)["dropout_event"].max()
+
+    X = np.column_stack([np.ones(len(panel))] + [panel[c].to_numpy(dtype=float) for c in PREDICTORS])
+    x_path = os.path.join(work_dir, f"X_{k:05d}.npy")
+    np.save(x_path, X)
+    np.save(os.path.join(work_dir, f"y_{k:05d}.npy"), panel["dropout_event"].to_numpy(dtype=float))
+    return {"k": k, "agg": agg, "students": len(per_student), "dropouts": int(per_student.sum()),
+            "rows": len(panel), "parts": parts, "x": x_path}
+
+
+def _irls_stats(x_path, beta):
+    """X'WX, X'(y - p) and log-likelihood of one shard at `beta`."""
+    X = np.load(x_path, mmap_mode="r")
+    y = np.load(x_path.replace("X_", "y_"), mmap_mode="r")
+    k = X.shape[1]
+    H, g, ll = np.zeros((k, k)), np.zeros(k), 0.0
+    for s in range(0, len(X), BLOCK_ROWS):
+        xb, yb = np.asarray(X[s:s+BLOCK_ROWS]), np.asarray(y[s:s+BLOCK_ROWS])
+        eta = xb @ beta
+        p = 1.0 / (1.0 + np.exp(-eta))
+        H += xb.T @ (xb * (p * (1 - p))[:, None])
+        g += xb.T @ (yb - p)
+        ll += float((yb * eta - np.logaddexp(0, eta)).sum())
+    return H, g, ll
+
+
+# -------------------------
+# Reduce
+# -------------------------
+class IRLSResult:
+    """The pieces of a statsmodels Logit result the pipeline uses."""
+
+    def __init__(self, names, beta, H, llf, nobs, iterations, converged):
+        cov = np.linalg.inv(H)
+        self.params = pd.Series(beta, index=names)
+        self.bse = pd.Series(np.sqrt(np.diag(cov)), index=names)
+        self.tvalues = self.params / self.bse
+        self.pvalues = pd.Series(2 * stats.norm.sf(np.abs(self.tvalues)), index=names)
+        self.llf, self.nobs, self.iterations, self.converged = llf, nobs, iterations, converged
+
+    def summary_text(self, shards):
+        z = stats.norm.ppf(0.975)
+        table = pd.DataFrame({"Coef.": self.params, "Std.Err.": self.bse, "z": self.tvalues,
+                              "P>|z|": self.pvalues,
+                              "[0.025": self.params - z * self.bse, "0.975]": self.params + z * self.bse})
+        return (f"Logit (IRLS over {shards} shards)\n"
+                f"No. Observations: {self.nobs}\nLog-Likelihood: {self.llf:.4f}\n"
+                f"Iterations: {self.iterations}  Converged: {self.converged}\n\n"
+                + table.round(4).to_string() + "\n")
+
+
+def fit_irls(pool, x_paths, k, tol=1e-8, max_iter=35):
+    beta, llf = np.zeros(k), -np.inf
+    for it in range(1, max_iter + 1):
+        H, g, ll = np.zeros((k, k)), np.zeros(k), 0.0
+        for Hs, gs, lls in pool.map(_irls_stats, x_paths, [beta] * len(x_paths)):
+            H += Hs; g += gs; ll += lls
+        step = np.linalg.solve(H, g)
+        beta = beta + step
+        if np.max(np.abs(step)) < tol or abs(ll - llf) < tol:
+            return beta, H, ll, it, True
+        llf = ll
+    return beta, H, ll, max_iter, False
+
+
+def run_partitioned(db_path, out_dir, shards=8, workers=None, seed=0, create_indexes=False):
+    """
+    Runs the per-student derivation on `shards` id ranges and reduces.
+    Returns (agg_sem, logit, cum_dropout, per_sem) with agg_sem as in the single-process run.
+    create_indexes: add the id indexes first (the only write; off by default).
+    """
+    if create_indexes:
+        ensure_indexes(db_path)
+    conn = get_connection(db_path)
+    missing = missing_indexes(conn)
+    if missing:
+        print(f"⚠️ no index {missing}: every shard scans the tables (run once with --create-indexes)")
+    bounds = shard_bounds(conn, shards)
+    target_max = int(conn.execute("SELECT MAX(semestre) FROM inscripciones").fetchone()[0])
+    conn.close()
+
+    work_dir = tempfile.mkdtemp(prefix="urc_shards_", dir=out_dir)
+    seeds = np.random.SeedSequence(seed).spawn(len(bounds))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_derive_shard, db_path, k, lo, hi, target_max, s, work_dir)
+                       for k, ((lo, hi), s) in enumerate(zip(bounds, seeds))]
+            results = sorted((f.result() for f in futures), key=lambda r: r["k"])
+
+            names = ["const"] + PREDICTORS
+            beta, H, llf, it, ok = fit_irls(pool, [r["x"] for r in results], len(names))
+        logit = IRLSResult(names, beta, H, llf, sum(r["rows"] for r in results), it, ok)
+
+        for name in EXPORTS:
+            concat_tables([r["parts"][name] for r in results], os.path.join(out_dir, name))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    tot = pd.concat([r["agg"] for r in results]).groupby(level=0).sum()
+    agg_sem = pd.DataFrame({
+        "semestre": tot.index,
+        "abandono_sem": tot["sum_abandono"] / tot["n"],
+        "promedio_sem": tot["sum_promedio"] / tot["n_promedio"],
+        "asistencia_sem": tot["sum_asistencia"] / tot["n_asistencia"],
+    }).reset_index(drop=True)
+    cum_dropout = sum(r["dropouts"] for r in results) / sum(r["students"] for r in results)
+    per_sem = (tot["sum_abandono"] / tot["n"]).round(3).to_dict()
+    return agg_sem, logit, cum_dropout, per_sem
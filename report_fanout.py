@@ -0,0 +1,199 @@
+# report_fanout.py
+"""
+Early-warning report per plantel / alcaldía from a single scored panel.
+
+The panel is loaded and the logit fitted once. The numeric columns needed by
+the slice reports (plus one integer code per fan-out dimension) are copied
+into a shared-memory block. Each slice (figures, top-K CSV, DOCX) is built
+in a process pool; workers attach to the block by name, so the panel is
+never pickled per task.
+
+    python report_fanout.py --by plantel --by alcaldia --workers 8
+"""
+import os, re, argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from sklearn.metrics import roc_auc_score
+
+from risk_model import load_panel, fit_logit, predict, top_k
+from db import get_connection
+from report_docx import render_png, ReportBuilder
+from instrument import stage
+
+DB_PATH = "unrc.db"
+OUT_DIR = "out_pipeline"
+FANOUT_DIR = os.path.join(OUT_DIR, "slices")
+
+NUM_COLS = ["student_id","semestre","abandono","abandono_prob",
+            "promedio","asistencia_pct","horas_trabajo","traslado_min"]
+CAT_COLS = ["sexo","colonia_residencia","alcaldia","plantel"]
+
+
+def _slug(s):
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(s)).strip("_") or "sin_valor"
+
+
+# -------------------------
+# Shared panel
+# -------------------------
+class SharedPanel:
+    """Scored panel as one float64 block in shared memory + small category tables."""
+
+    def __init__(self, merged):
+        self.num_cols = [c for c in NUM_COLS if c in merged.columns]
+        self.cat_cols = [c for c in CAT_COLS if c in merged.columns]
+        self.categories = {}
+        cols = [merged[c].to_numpy(dtype=float) for c in self.num_cols]
+        for c in self.cat_cols:
+            codes, uniq = pd.factorize(merged[c])
+            self.categories[c] = list(uniq)
+            cols.append(codes.astype(float))
+        data = np.column_stack(cols)
+
+        self.shape = data.shape
+        self.shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)[:] = data
+
+    @property
+    def spec(self):
+        """What a worker needs to attach (cheap to pickle)."""
+        return {"name": self.shm.name, "shape": self.shape,
+                "num_cols": self.num_cols, "cat_cols": self.cat_cols,
+                "categories": self.categories}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach(spec, dim, code):
+    """Rows of slice `dim == code` as a DataFrame (only the slice is copied)."""
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    try:
+        arr = np.ndarray(spec["shape"], dtype=np.float64, buffer=shm.buf)
+        cols = spec["num_cols"] + spec["cat_cols"]
+        rows = arr[arr[:, cols.index(dim)] == code]
+    finally:
+        shm.close()
+    df = pd.DataFrame(rows, columns=cols)
+    for c in ("student_id","semestre","abandono"):
+        if c in df:
+            df[c] = df[c].astype(int)
+    for c in spec["cat_cols"]:
+        cats = np.asarray(spec["categories"][c], dtype=object)
+        codes = df[c].to_numpy(dtype=int)
+        df[c] = np.where(codes >= 0, cats[np.clip(codes, 0, None)], None)
+    return df
+
+
+# -------------------------
+# One slice
+# -------------------------
+def _slice_report(spec, dim, code, label, out_dir, k):
+    df = _attach(spec, dim, code)
+    os.makedirs(out_dir, exist_ok=True)
+
+    obs = df.groupby("semestre")["abandono"].mean()*100
+    pred = df.groupby("semestre")["abandono_prob"].mean()*100
+    plt.figure(figsize=(8,5))
+    plt.plot(obs.index, obs.values, "o-", label="Observado (%)")
+    plt.plot(pred.index, pred.values, "s--", label="Predicho (%)")
+    plt.xlabel("Semestre")
+    plt.ylabel("Tasa de abandono (%)")
+    plt.title(f"Abandono observado vs predicho – {label}")
+    plt.legend()
+    plt.grid(alpha=0.3)
+    plt.tight_layout()
+    png1 = render_png(path=os.path.join(out_dir, "abandono_vs_predicho.png"))
+
+    top = top_k(df, k)
+    top.to_csv(os.path.join(out_dir, f"top{k}_risk_students.csv"), index=False)
+    plt.figure(figsize=(10,6))
+    bars = plt.barh(top["student_id"].astype(str), top["abandono_prob"].values*100)
+    plt.gca().invert_yaxis()
+    plt.xlabel("Probabilidad de abandono (%)")
+    plt.title(f"Top {k} estudiantes con mayor riesgo – {label}")
+    for bar, (_, row) in zip(bars, top.iterrows()):
+        txt = f"Prom:{row['promedio']:.1f} | Asist:{row['asistencia_pct']:.0f}% | Trab:{int(row['horas_trabajo'])}h | Trasl:{int(row['traslado_min'])}m"
+        plt.text(bar.get_width()+1, bar.get_y()+bar.get_height()/2, txt, va="center", fontsize=8)
+    plt.tight_layout()
+    png2 = render_png(path=os.path.join(out_dir, f"top{k}_risk.png"))
+
+    n_students = int(df["student_id"].nunique())
+    rate = df.groupby("student_id")["abandono"].max().mean()
+    auc = roc_auc_score(df["abandono"], df["abandono_prob"]) if df["abandono"].nunique() == 2 else float("nan")
+
+    rb = ReportBuilder(f"URC – Alerta temprana: {label}",
+                       f"Reporte por {dim} generado a partir del modelo institucional")
+    rb.heading("Resumen").paragraph(
+        f"{n_students:,} estudiantes ({len(df):,} registros semestrales). "
+        f"Abandono acumulado observado: {rate:.1%}. "
+        f"Probabilidad media estimada por semestre: {df['abandono_prob'].mean():.1%}. "
+        + (f"AUC del modelo en este grupo: {auc:.2f}." if np.isfinite(auc) else "")
+    )
+    rb.heading("Resultados")
+    rb.figure(png1, "Figura 1. Abandono observado vs predicho por semestre")
+    rb.figure(png2, f"Figura 2. Top {k} estudiantes con mayor riesgo")
+    rb.table(top[["student_id","promedio","asistencia_pct","abandono_prob"]].round(3))
+    rb.save(os.path.join(out_dir, "informe.docx"))
+
+    return {"dimension": dim, "valor": label, "n_estudiantes": n_students,
+            "n_registros": len(df), "abandono_obs": rate,
+            "abandono_prob_media": df["abandono_prob"].mean(), "auc": auc, "dir": out_dir}
+
+
+# -------------------------
+# Fan-out
+# -------------------------
+def fan_out(merged, dims=("plantel",), workers=None, k=10, out_dir=FANOUT_DIR):
+    """One report per value of each dimension in `dims`; returns the summary table."""
+    panel = SharedPanel(merged)
+    try:
+        spec = panel.spec
+        jobs = []
+        for dim in dims:
+            if dim not in panel.cat_cols:
+                print(f"⚠️ {dim} not in panel, skipped")
+                continue
+            for code, label in enumerate(spec["categories"][dim]):
+                jobs.append((spec, dim, code, label,
+                             os.path.join(out_dir, dim, _slug(label)), k))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_slice_report, *job) for job in jobs]
+            rows = [f.result() for f in futures]
+    finally:
+        panel.close()
+
+    summary = pd.DataFrame(rows)
+    os.makedirs(out_dir, exist_ok=True)
+    summary.to_csv(os.path.join(out_dir, "resumen_slices.csv"), index=False)
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--by", action="append", choices=["plantel","alcaldia"],
+                    help="fan-out dimension (repeatable; default plantel)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--top-k", type=int, default=10)
+    args = ap.parse_args()
+
+    # ---- Load + score once
+    with stage("load_panel") as s:
+        merged = load_panel(get_connection(args.db))
+        s.rows = len(merged)
+    with stage("fit_predict", rows=len(merged)):
+        merged["abandono_prob"] = predict(fit_logit(merged), merged)
+
+    with stage("fan_out") as s:
+        summary = fan_out(merged, args.by or ["plantel"], args.workers, args.top_k)
+        s.rows = len(summary)
+    print(summary[["dimension","valor","n_estudiantes","abandono_obs","auc"]].to_string(index=False))
+    print(f"\n✅ {len(summary)} slice reports in {FANOUT_DIR}")
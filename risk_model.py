@@ -0,0 +1,60 @@
+# risk_model.py
+"""
+Dropout-risk model shared by the report scripts: load the student×semester
+panel, fit the logit, score rows, pick top-K students.
+"""
+import statsmodels.api as sm
+
+from db import read_table
+
+PREDICTORS = ["promedio","asistencia_pct","horas_trabajo","traslado_min"]
+
+STUDENT_COLS = ["student_id","sexo","colonia_id","colonia_residencia","alcaldia","plantel",
+                "horas_trabajo","traslado_min","marginacion_index"]
+
+# schema-dependent: generate_colonias has colonia_*/alcaldia/marginacion_index,
+# generator_sqlite_unrc.py has alcaldia_residencia instead
+OPTIONAL_COLS = ["colonia_id","colonia_residencia","alcaldia","marginacion_index","alcaldia_residencia"]
+
+TOPK_COLS = ["student_id","sexo","colonia_residencia","alcaldia",
+             "promedio","asistencia_pct","horas_trabajo","traslado_min","abandono_prob"]
+
+
+def load_panel(conn):
+    """inscripciones + the student columns the model/report use."""
+    # only the student columns the model/report use; generator_sqlite_unrc.py
+    # names it alcaldia_residencia
+    students = read_table(conn, "students_raw", STUDENT_COLS + ["alcaldia_residencia"],
+                          optional=OPTIONAL_COLS)
+    students = students.rename(columns={"alcaldia_residencia": "alcaldia"})
+    panel    = read_table(conn, "inscripciones")
+    return panel.merge(students, on="student_id", how="left")
+
+
+def design(merged, predictors=PREDICTORS):
+    return sm.add_constant(merged[predictors], has_constant="add")
+
+
+def fit_logit(merged, predictors=PREDICTORS):
+    y = merged["abandono"].astype(int)
+    return sm.Logit(y, design(merged, predictors)).fit(disp=False)
+
+
+def predict(logit, merged):
+    """abandono_prob for every row of `merged` under a fitted logit."""
+    predictors = [c for c in logit.params.index if c != "const"]
+    return logit.predict(design(merged, predictors))
+
+
+def last_rows(merged):
+    """Last available semester per student."""
+    return merged.sort_values(["student_id","semestre"]).groupby("student_id").tail(1)
+
+
+def top_k(merged, k=10, ascending=False, cols=TOPK_COLS):
+    """k highest (or lowest) risk students on their last semester."""
+    last = last_rows(merged)
+    cols = [c for c in cols if c in last.columns]
+    if ascending:
+        return last.nsmallest(k, "abandono_prob")[cols].copy()
+    return last.nlargest(k, "abandono_prob")[cols].copy()
@@ -0,0 +1,208 @@
+# session_features.py
+"""
+Early-warning features from the session-level Asistencia / Evaluaciones sheets.
+
+gen_asist_eval1.py writes one workbook per subject and group
+(asistencia_calificaciones/<Materia>_<GrupoN>.xlsx) with 17 attendance
+sessions and 10 evaluations per student. Every workbook is stacked into two
+arrays:
+
+    attendance   students × subjects × sessions      (1 present, 0 absent)
+    evaluations  students × subjects × evaluations
+
+NaN marks a subject the student is not enrolled in, or a session or
+evaluation that has not happened yet. All features come from whole-array
+operations on those arrays, with no per-student loop:
+
+    asist_media / asist_min            attendance rate, mean / lowest subject
+    asist_reciente_media / _min        attendance over the last k sessions held
+    racha_ausencias_max / _actual      longest / current run of absences
+    calif_media / calif_min            evaluation mean, mean / lowest subject
+    pendiente_calif / _min             least-squares grade slope per evaluation
+    evals_reprobadas                   evaluations below PASSING_GRADE
+    materias_reprobando                subjects with a mean below PASSING_GRADE
+
+Features are joined to the student×semester panel by matrícula
+(MATRICULA_START + student_id - 1, the numbering gen_asist_eval1 uses).
+
+    python session_features.py --dir asistencia_calificaciones --k 4
+    python session_features.py --store asistencia_store      # array_store.py memmaps
+"""
+import os, glob, argparse, warnings
+import numpy as np
+import pandas as pd
+
+from instrument import stage
+
+DATA_DIR = "asistencia_calificaciones"
+OUT_DIR = "out_pipeline"
+DB_PATH = "unrc.db"
+SUBJECTS = ["Calculo_Integral", "Bases_de_Datos", "Contabilidad_Financiera",
+            "Estructuras_de_Datos", "Pensamiento_Complejo", "Probabilidad"]
+MATRICULA_START = 264_421_500     # gen_asist_eval1.generate_matriculas
+ROLLING_K = 4
+PASSING_GRADE = 6
+
+
+# -------------------------
+# 3-D arrays
+# -------------------------
+class SessionCube:
+    """attendance (N×J×T) and evaluations (N×J×E) for N matrículas and J subjects."""
+
+    def __init__(self, matriculas, subjects, attendance, evaluations):
+        self.matriculas = np.asarray(matriculas)
+        self.subjects = list(subjects)
+        self.attendance = attendance
+        self.evaluations = evaluations
+
+    @property
+    def sessions_held(self):
+        return int((~np.isnan(self.attendance)).any(axis=(0, 1)).sum())
+
+    @classmethod
+    def from_workbooks(cls, directory=DATA_DIR):
+        files = sorted(glob.glob(os.path.join(directory, "*.xlsx")))
+        if not files:
+            raise FileNotFoundError(f"no workbooks in {directory}/ (run gen_asist_eval1.create_groups)")
+        mats, subj, att, ev = [], [], [], []
+        for f in files:
+            subject = os.path.splitext(os.path.basename(f))[0].rsplit("_", 1)[0]   # <Materia>_<GrupoN>
+            sheets = pd.read_excel(f, sheet_name=["Asistencia", "Evaluaciones"])
+            a = sheets["Asistencia"].set_index("Matricula").drop(columns="Nombre")
+            e = sheets["Evaluaciones"].set_index("Matricula").drop(columns="Nombre").reindex(a.index)
+            mats.append(a.index.to_numpy())
+            subj += [subject] * len(a)
+            att.append(a.to_numpy(dtype=float))
+            ev.append(e.to_numpy(dtype=float))
+        return cls.from_rows(np.concatenate(mats), subj, _stack_ragged(att), _stack_ragged(ev))
+
+    @classmethod
+    def from_store(cls, path):
+        """Cube from an array_store.py directory (int8 memmaps, -1 -> NaN)."""
+        from array_store import ArrayStore
+        return ArrayStore(path).to_cube()
+
+    @classmethod
+    def from_rows(cls, matriculas, subjects, att_rows, eval_rows):
+        """One (matrícula, subject) per row -> dense cube; a repeated pair keeps its last row."""
+        rows, mats = pd.factorize(pd.Series(matriculas), sort=True)
+        cols, subj = pd.factorize(pd.Series(subjects), sort=False)
+        dup = pd.Series(rows * len(subj) + cols).duplicated(keep="last").to_numpy()
+        if dup.any():
+            warnings.warn(f"{int(dup.sum())} repeated matrícula/subject rows; keeping the last")
+        N, J = len(mats), len(subj)
+        att = np.full((N, J, att_rows.shape[1]), np.nan)
+        ev = np.full((N, J, eval_rows.shape[1]), np.nan)
+        att[rows[~dup], cols[~dup]] = att_rows[~dup]
+        ev[rows[~dup], cols[~dup]] = eval_rows[~dup]
+        return cls(mats.to_numpy(), list(subj), att, ev)
+
+
+def _stack_ragged(blocks):
+    """Concatenate row blocks, padding shorter ones with NaN columns."""
+    width = max(b.shape[1] for b in blocks)
+    return np.concatenate([np.pad(b, ((0, 0), (0, width - b.shape[1])), constant_values=np.nan)
+                           for b in blocks])
+
+
+# -------------------------
+# Features
+# -------------------------
+def absence_streaks(absent):
+    """Longest and current run of True along the last axis."""
+    c = np.cumsum(absent, axis=-1, dtype=np.int32)
+    reset = np.maximum.accumulate(np.where(absent, 0, c), axis=-1)
+    run = c - reset
+    return run.max(axis=-1), run[..., -1]
+
+
+def grade_slope(y):
+    """OLS slope of y on its position along the last axis, ignoring NaN (NaN if < 2 points)."""
+    m = ~np.isnan(y)
+    x = np.arange(y.shape[-1], dtype=float)
+    n = m.sum(-1)
+    xm = (m * x).sum(-1) / n
+    ym = np.nansum(y, -1) / n
+    dx = np.where(m, x - xm[..., None], 0.0)
+    sxx = (dx * dx).sum(-1)
+    return np.where(sxx > 0, (dx * np.nan_to_num(y - ym[..., None])).sum(-1) / np.where(sxx > 0, sxx, 1), np.nan)
+
+
+@stage("session_features")
+def session_features(cube, k=ROLLING_K, passing=PASSING_GRADE):
+    """One row per matrícula with the early-warning features."""
+    T = cube.sessions_held
+    att = cube.attendance[..., :T]
+    ev = cube.evaluations
+    enrolled = ~np.isnan(att).all(-1)                       # N×J
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN slices -> NaN
+        rate = np.nanmean(att, -1)
+        recent = np.nanmean(att[..., max(T - k, 0):], -1)
+        longest, current = absence_streaks(att == 0)
+        grade = np.nanmean(ev, -1)
+        slope = grade_slope(ev)
+        fails = (ev < passing).sum(-1)
+        out = pd.DataFrame({
+            "matricula": cube.matriculas,
+            "n_materias": enrolled.sum(1),
+            "asist_media": np.nanmean(rate, 1),
+            "asist_min": np.nanmin(rate, 1),
+            "asist_reciente_media": np.nanmean(recent, 1),
+            "asist_reciente_min": np.nanmin(recent, 1),
+            "racha_ausencias_max": np.where(enrolled, longest, 0).max(1),
+            "racha_ausencias_actual": np.where(enrolled, current, 0).max(1),
+            "calif_media": np.nanmean(grade, 1),
+            "calif_min": np.nanmin(grade, 1),
+            "pendiente_calif": np.nanmean(slope, 1),
+            "pendiente_calif_min": np.nanmin(slope, 1),
+            "evals_reprobadas": fails.sum(1),
+            "materias_reprobando": (grade < passing).sum(1),
+        })
+    return out
+
+
+def join_panel(merged, feats, semestre=None):
+    """Left-join features onto the panel by matrícula (only on `semestre` rows if given)."""
+    merged = merged.copy()
+    if "matricula" not in merged.columns:
+        merged["matricula"] = MATRICULA_START + merged["student_id"] - 1
+    cols = [c for c in feats.columns if c != "matricula"]
+    if semestre is None:
+        return merged.merge(feats, on="matricula", how="left")
+    at = merged["semestre"] == semestre
+    joined = merged[at].merge(feats, on="matricula", how="left")
+    joined.index = merged.index[at]
+    return pd.concat([merged, joined[cols]], axis=1)
+
+
+if __name__ == "__main__":
+    from risk_model import load_panel
+    from db import get_connection
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--dir", default=DATA_DIR)
+    ap.add_argument("--store", help="array_store.py directory instead of the xlsx workbooks")
+    ap.add_argument("--k", type=int, default=ROLLING_K, help="sessions in the rolling attendance window")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--semestre", type=int, default=None, help="panel term the sheets belong to")
+    args = ap.parse_args()
+
+    with stage("load_store" if args.store else "load_workbooks") as s:
+        cube = SessionCube.from_store(args.store) if args.store else SessionCube.from_workbooks(args.dir)
+        s.rows = int((~np.isnan(cube.attendance)).sum())
+    print(f"{len(cube.matriculas):,} students × {len(cube.subjects)} subjects × {cube.sessions_held} sessions")
+    feats = session_features(cube, k=args.k)
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    path = os.path.join(OUT_DIR, "session_features.csv")
+    feats.to_csv(path, index=False)
+    print(feats.describe().T[["mean","min","max"]].round(3).to_string())
+    print("✅ Saved:", path)
+
+    if os.path.exists(args.db):
+        merged = join_panel(load_panel(get_connection(args.db)), feats, args.semestre)
+        hit = merged["n_materias"].notna()
+        print(f"Joined to panel: {merged.loc[hit, 'student_id'].nunique():,} students, {int(hit.sum()):,} rows")
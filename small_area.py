@@ -0,0 +1,155 @@
+# small_area.py
+"""
+Empirical-Bayes (beta-binomial) smoothing of colonia dropout rates.
+
+With ~1,000 students over ~1,800 colonias most colonias hold 0–2 students,
+so the raw rate is 0 %, 50 % or 100 % noise. Each colonia i in alcaldía g
+is treated as y_i dropouts among n_i students, y_i ~ Binomial(n_i, p_i),
+p_i ~ Beta(a_g, b_g). The prior for each alcaldía comes from moments
+(Marshall 1991):
+
+    m_g   = sum(y) / sum(n)                                 alcaldía rate
+    s2_g  = sum(n_i (r_i - m_g)^2) / sum(n)                 weighted spread of the raw rates
+    tau2  = s2_g - m_g (1 - m_g) / nbar_g                   between-colonia variance
+    a_g + b_g = m_g (1 - m_g) / tau2 - 1
+
+The posterior mean (y_i + a_g) / (n_i + a_g + b_g) pulls each colonia toward
+its alcaldía in proportion to how few students it has. A colonia with no
+students gets the alcaldía rate. Alcaldías with fewer than MIN_AREAS
+populated colonias, or no excess variance, use the citywide tau2. The
+alcaldía rates m_g are themselves shrunk toward the city rate by the same
+step one level up, so an alcaldía with a handful of students does not set
+an extreme prior.
+
+Everything is bincounts over group codes (one pass over students, one over
+areas), so millions of students and every colonia cost the same handful
+of array operations. The unit is the student (dropped out in any
+semester), so counts are binomial.
+
+    python small_area.py                   # writes out_pipeline/colonias_eb.csv
+"""
+import os, argparse
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from db import get_connection, table_columns
+
+DB_PATH = "unrc.db"
+OUT_DIR = "out_pipeline"
+MIN_AREAS = 5          # populated colonias needed for an alcaldía-specific tau2
+INTERVAL = 0.90        # posterior credible interval
+_EPS = 1e-6
+
+
+def student_outcomes(conn):
+    """One row per student: alcaldía, colonia and whether they ever dropped out."""
+    cols = table_columns(conn, "students_raw")
+    alc = "alcaldia" if "alcaldia" in cols else "alcaldia_residencia"
+    col_id = "s.colonia_id, " if "colonia_id" in cols else ""
+    return pd.read_sql(f"""
+SELECT s.student_id, s.{alc} AS alcaldia, {col_id}s.colonia_residencia,
+       COALESCE(d.abandono, 0) AS abandono
+FROM students_raw s
+LEFT JOIN (SELECT student_id, MAX(abandono) AS abandono
+           FROM inscripciones GROUP BY student_id) d USING (student_id)
+""", conn)
+
+
+def _moments(y, n, codes, n_groups):
+    """Pooled rate and between-area variance per group (areas with n > 0)."""
+    has = n > 0
+    N = np.bincount(codes[has], weights=n[has], minlength=n_groups)
+    Y = np.bincount(codes[has], weights=y[has], minlength=n_groups)
+    k = np.bincount(codes[has], minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m = Y / N
+        r = np.where(has, y / np.where(has, n, 1), 0.0)
+        s2 = np.bincount(codes[has], weights=n[has] * (r[has] - m[codes[has]])**2, minlength=n_groups) / N
+        tau2 = s2 - m * (1 - m) / (N / k)
+    return m, tau2, k, Y, N
+
+
+def eb_shrink(y, n, parent, min_areas=MIN_AREAS, interval=INTERVAL):
+    """
+    Beta-binomial EB estimates for areas with y events among n units.
+    parent: integer group per area (-1 = no group: citywide prior).
+    Returns a DataFrame aligned with the inputs.
+    """
+    y, n = np.asarray(y, dtype=float), np.asarray(n, dtype=float)
+    parent = np.asarray(parent)
+    G = int(parent.max()) + 1 if len(parent) else 0
+
+    m0, t0, *_ = _moments(y, n, np.zeros(len(y), dtype=np.int64), 1)
+    m0, t0 = np.clip(m0[0], _EPS, 1 - _EPS), t0[0]
+    if not np.isfinite(t0) or t0 <= 0:
+        t0 = _EPS * m0 * (1 - m0)                    # no excess variance: (almost) full pooling
+
+    m, tau2, k, Yg, Ng = _moments(y, n, np.maximum(parent, 0), max(G, 1))
+    own = (k >= min_areas) & np.isfinite(tau2) & (tau2 > 0)
+    # the alcaldía rates lean on the city rate the same way (few students -> city rate)
+    _, tc, *_ = _moments(Yg, Ng, np.zeros(len(Ng), dtype=np.int64), 1)
+    tc = tc[0] if np.isfinite(tc[0]) and tc[0] > 0 else _EPS * m0 * (1 - m0)
+    abg = m0 * (1 - m0) / min(tc, 0.99 * m0 * (1 - m0)) - 1
+    m = np.clip((Yg + m0 * abg) / (Ng + abg), _EPS, 1 - _EPS)
+    tau2 = np.where(own, tau2, t0)
+    tau2 = np.minimum(tau2, 0.99 * m * (1 - m))        # keeps a + b > 0
+
+    mi = np.where(parent >= 0, m[np.maximum(parent, 0)], m0)
+    ti = np.where(parent >= 0, tau2[np.maximum(parent, 0)], min(t0, 0.99 * m0 * (1 - m0)))
+    ab = mi * (1 - mi) / ti - 1
+    a, b = mi * ab, (1 - mi) * ab
+
+    post_a, post_b = a + y, b + n - y
+    with np.errstate(invalid="ignore", divide="ignore"):
+        raw = np.where(n > 0, y / np.where(n > 0, n, 1), np.nan)
+    q = (1 - interval) / 2
+    return pd.DataFrame({
+        "n": n.astype(int), "abandonos": y.astype(int),
+        "tasa_observada": raw,
+        "tasa_prior": mi,
+        "peso": n / (n + ab),                        # weight on the raw rate
+        "tasa_eb": post_a / (post_a + post_b),
+        "eb_lo": stats.beta.ppf(q, post_a, post_b),
+        "eb_hi": stats.beta.ppf(1 - q, post_a, post_b),
+    })
+
+
+def smooth_colonias(students, area=("alcaldia", "colonia_residencia"), parent="alcaldia"):
+    """Counts per colonia (one groupby) + EB shrinkage toward the alcaldía."""
+    counts = (students.groupby(list(area), dropna=False, sort=True)["abandono"]
+              .agg(["size", "sum"]).reset_index())
+    codes, _ = pd.factorize(counts[parent], sort=True)
+    eb = eb_shrink(counts["sum"].to_numpy(), counts["size"].to_numpy(), codes)
+    return pd.concat([counts[list(area)], eb], axis=1)
+
+
+def smooth_features(ids, dropped, n_features, feature_parent):
+    """
+    EB rates per map feature: ids = feature id per student (-1 unmatched),
+    feature_parent = alcaldía code per feature. Features without students get
+    their alcaldía rate.
+    """
+    ok = ids >= 0
+    n = np.bincount(ids[ok], minlength=n_features)
+    y = np.bincount(ids[ok], weights=np.asarray(dropped, dtype=float)[ok], minlength=n_features)
+    return eb_shrink(y, n, feature_parent)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args()
+
+    students = student_outcomes(get_connection(args.db))
+    eb = smooth_colonias(students)
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    path = os.path.join(OUT_DIR, "colonias_eb.csv")
+    eb.to_csv(path, index=False)
+    print(f"{len(students):,} students, {len(eb):,} colonias "
+          f"(median {eb['n'].median():.0f} students; raw rate sd {eb['tasa_observada'].std():.3f}, "
+          f"EB sd {eb['tasa_eb'].std():.3f})")
+    print(eb.sort_values("tasa_eb", ascending=False).head(args.top).round(3).to_string(index=False))
+    print("✅ Saved:", path)
@@ -0,0 +1,86 @@
+# spatial_index.py
+"""
+STRtree over the colonia polygons.
+
+- sample_points(): random residence points inside given colonias, drawn for
+  all students at once (rejection sampling inside each polygon's bbox).
+- locate(): bulk point-in-polygon for lon/lat arrays; returns colonia and
+  alcaldía of every point without scanning the polygons one by one.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+
+from geo_layers import load_layer, colonia_columns
+
+LOOKUP_CHUNK = 1_000_000   # points per STRtree query (bounds peak memory)
+
+
+class ColoniaIndex:
+    def __init__(self, gdf=None, col_colonia=None, col_alc=None):
+        if gdf is None:
+            gdf = load_layer("colonias")
+        if col_colonia is None or col_alc is None:
+            col_colonia, col_alc = colonia_columns(gdf)
+        if gdf.crs is not None and not gdf.crs.is_geographic:
+            gdf = gdf.to_crs(4326)
+
+        self.geoms    = np.asarray(gdf.geometry.values)
+        self.colonia  = gdf[col_colonia].to_numpy()
+        self.alcaldia = gdf[col_alc].to_numpy()
+        self.bounds   = shapely.bounds(self.geoms)
+        self.tree     = shapely.STRtree(self.geoms)
+
+    def __len__(self):
+        return len(self.geoms)
+
+    def sample_points(self, feature_idx, rng=np.random, max_rounds=50):
+        """One uniform random (lon, lat) inside each feature of `feature_idx`."""
+        feature_idx = np.asarray(feature_idx, dtype=np.int64)
+        lon = np.empty(len(feature_idx))
+        lat = np.empty(len(feature_idx))
+
+        todo = np.arange(len(feature_idx))
+        for _ in range(max_rounds):
+            if todo.size == 0:
+                break
+            f = feature_idx[todo]
+            b = self.bounds[f]
+            x = rng.uniform(b[:, 0], b[:, 2])
+            y = rng.uniform(b[:, 1], b[:, 3])
+            inside = shapely.contains_xy(self.geoms[f], x, y)
+            lon[todo[inside]] = x[inside]
+            lat[todo[inside]] = y[inside]
+            todo = todo[~inside]
+
+        # slivers that keep rejecting: fall back to a point guaranteed inside
+        if todo.size:
+            pts = shapely.point_on_surface(self.geoms[feature_idx[todo]])
+            lon[todo] = shapely.get_x(pts)
+            lat[todo] = shapely.get_y(pts)
+        return lon, lat
+
+    def lookup(self, lon, lat):
+        """Feature index containing each point (-1 when outside every colonia)."""
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        out = np.full(len(lon), -1, dtype=np.int64)
+        for start in range(0, len(lon), LOOKUP_CHUNK):
+            stop = start + LOOKUP_CHUNK
+            pts = shapely.points(lon[start:stop], lat[start:stop])
+            # "intersects" so points lying exactly on a border still match
+            pt_i, feat_i = self.tree.query(pts, predicate="intersects")
+            out[start + pt_i] = feat_i
+        return out
+
+    def locate(self, lon, lat):
+        """colonia / alcaldía for every point, in one call."""
+        idx = self.lookup(lon, lat)
+        hit = idx >= 0
+        colonia  = np.full(len(idx), None, dtype=object)
+        alcaldia = np.full(len(idx), None, dtype=object)
+        colonia[hit]  = self.colonia[idx[hit]]
+        alcaldia[hit] = self.alcaldia[idx[hit]]
+        return pd.DataFrame({"feature_id": idx,
+                             "colonia_residencia": colonia,
+                             "alcaldia": alcaldia})
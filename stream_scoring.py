@@ -0,0 +1,262 @@
+# stream_scoring.py
+"""
+Incremental early-warning scores, one class session at a time.
+
+StreamScorer keeps compact per-student × per-subject state in arrays:
+
+    seen, present        sessions recorded / attended            int16
+    recent, ring         attendance in the last k sessions       int16, int8 ring buffer
+    streak               current run of absences                 int16
+    grade_sum, grade_n   running evaluation mean                 float32, int16
+    fails                evaluations below PASSING_GRADE         int16
+
+An event updates one (student, subject) cell in O(1). The student's risk is
+then recomputed from that student's row only (a handful of subjects), never
+from history. The score uses the same feature names as session_features.py
+(asist_reciente_media, racha_ausencias_actual, calif_media, materias_reprobando),
+so score_frame() on the batch features gives the same number as the stream
+at the same point in the term. Weights follow the generator's dropout model:
+-0.025 per attendance point and -0.95 per grade point.
+
+An alert is emitted when a student's risk rises through the threshold. It
+re-arms once the risk falls HYSTERESIS below the threshold.
+
+Events are dicts / JSON lines:
+    {"matricula": 264421512, "materia": "Probabilidad", "tipo": "asistencia", "valor": 0}
+    {"matricula": 264421512, "materia": "Probabilidad", "tipo": "evaluacion", "valor": 6}
+
+    python stream_scoring.py --replay asistencia_calificaciones     # re-play the sheets
+    python stream_scoring.py --follow eventos.jsonl                 # tail an appended file
+"""
+import os, json, time, argparse
+import numpy as np
+import pandas as pd
+
+from session_features import SUBJECTS, ROLLING_K, PASSING_GRADE, SessionCube
+
+OUT_DIR = "out_pipeline"
+THRESHOLD = 0.5
+HYSTERESIS = 0.05
+
+WEIGHTS = {"const": -1.90, "asist_reciente_media": -2.5, "racha_ausencias_actual": 0.15,
+           "calif_media": -0.95, "materias_reprobando": 0.40}
+CENTER = {"asist_reciente_media": 0.86, "calif_media": 8.0}
+NEUTRAL = dict(CENTER)      # value used before a student has any record
+
+
+def score_frame(feats, weights=WEIGHTS):
+    """Risk for batch feature rows (session_features output); missing features count as neutral."""
+    z = np.full(len(feats), weights["const"])
+    for f, w in weights.items():
+        if f != "const":
+            x = feats[f].fillna(NEUTRAL.get(f, 0.0)).to_numpy(dtype=float)
+            z += w * (x - CENTER.get(f, 0.0))
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+class StreamScorer:
+    def __init__(self, matriculas=(), subjects=SUBJECTS, k=ROLLING_K, threshold=THRESHOLD,
+                 passing=PASSING_GRADE, weights=WEIGHTS):
+        self.k, self.threshold, self.passing, self.w = k, threshold, passing, weights
+        self.row, self.col = {}, {}
+        self.matriculas, self.subjects = [], []
+        self._alloc(max(len(matriculas), 16), max(len(subjects), 1))
+        for m in matriculas:
+            self._row(m)
+        for s in subjects:
+            self._col(s)
+
+    # ---- state arrays -------------------------------------------------
+    def _alloc(self, n, j):
+        old = getattr(self, "seen", None)
+        shapes = {"seen": np.int16, "present": np.int16, "recent": np.int16, "streak": np.int16,
+                  "grade_sum": np.float32, "grade_n": np.int16, "fails": np.int16}
+        for name, dt in shapes.items():
+            a = np.zeros((n, j), dtype=dt)
+            if old is not None:
+                prev = getattr(self, name)
+                a[:prev.shape[0], :prev.shape[1]] = prev
+            setattr(self, name, a)
+        ring = np.zeros((n, j, self.k), dtype=np.int8)
+        risk = np.zeros(n)
+        alerted = np.zeros(n, dtype=bool)
+        if old is not None:
+            ring[:self.ring.shape[0], :self.ring.shape[1]] = self.ring
+            risk[:len(self.risk)] = self.risk
+            alerted[:len(self.alerted)] = self.alerted
+        self.ring, self.risk, self.alerted = ring, risk, alerted
+
+    def _row(self, m):
+        i = self.row.get(m)
+        if i is None:
+            i = self.row[m] = len(self.matriculas)
+            self.matriculas.append(m)
+            if i >= self.seen.shape[0]:           # amortized O(1): double the capacity
+                self._alloc(2 * self.seen.shape[0], self.seen.shape[1])
+        return i
+
+    def _col(self, s):
+        j = self.col.get(s)
+        if j is None:
+            j = self.col[s] = len(self.subjects)
+            self.subjects.append(s)
+            if j >= self.seen.shape[1]:
+                self._alloc(self.seen.shape[0], 2 * self.seen.shape[1])
+        return j
+
+    # ---- updates ------------------------------------------------------
+    def attendance(self, i, j, present):
+        present = int(bool(present))
+        pos = self.seen[i, j] % self.k
+        self.recent[i, j] += present - self.ring[i, j, pos]
+        self.ring[i, j, pos] = present
+        self.seen[i, j] += 1
+        self.present[i, j] += present
+        self.streak[i, j] = 0 if present else self.streak[i, j] + 1
+
+    def evaluation(self, i, j, grade):
+        self.grade_sum[i, j] += grade
+        self.grade_n[i, j] += 1
+        self.fails[i, j] += grade < self.passing
+
+    def features(self, i):
+        """Student-level features from row i only (same definitions as session_features)."""
+        seen, gn = self.seen[i], self.grade_n[i]
+        on, graded = seen > 0, gn > 0
+        grade = self.grade_sum[i][graded] / gn[graded]
+        return {
+            "asist_reciente_media": float((self.recent[i][on] / np.minimum(seen[on], self.k)).mean())
+                                    if on.any() else np.nan,
+            "racha_ausencias_actual": int(self.streak[i].max()),
+            "calif_media": float(grade.mean()) if graded.any() else np.nan,
+            "materias_reprobando": int((grade < self.passing).sum()),
+        }
+
+    def score(self, i):
+        x = self.features(i)
+        z = self.w["const"]
+        for f, w in self.w.items():
+            if f != "const":
+                v = x[f] if not np.isnan(x[f]) else NEUTRAL.get(f, 0.0)
+                z += w * (v - CENTER.get(f, 0.0))
+        return 1.0 / (1.0 + np.exp(-z)), x
+
+    def update(self, event):
+        """Apply one event; returns an alert dict when the student crosses the threshold."""
+        i, j = self._row(event["matricula"]), self._col(event["materia"])
+        if event["tipo"] == "asistencia":
+            self.attendance(i, j, event["valor"])
+        elif event["tipo"] == "evaluacion":
+            self.evaluation(i, j, float(event["valor"]))
+        else:
+            raise ValueError(f"unknown event tipo {event['tipo']!r}")
+        p, x = self.score(i)
+        self.risk[i] = p
+        if not self.alerted[i] and p >= self.threshold:
+            self.alerted[i] = True
+            return {"matricula": event["matricula"], "materia": event["materia"],
+                    "sesion": int(self.seen[i, j]), "riesgo": round(float(p), 4), **x}
+        if self.alerted[i] and p < self.threshold - HYSTERESIS:
+            self.alerted[i] = False
+        return None
+
+    def consume(self, events, on_alert=None):
+        n = 0
+        for ev in events:
+            alert = self.update(ev)
+            n += 1
+            if alert is not None and on_alert is not None:
+                on_alert(alert)
+        return n
+
+    def snapshot(self):
+        n = len(self.matriculas)
+        return pd.DataFrame({"matricula": self.matriculas, "riesgo": self.risk[:n], "alerta": self.alerted[:n]})
+
+
+# -------------------------
+# Event sources
+# -------------------------
+def replay(cube):
+    """Events from a SessionCube in time order: session t for every student, with evaluations spread over the term."""
+    N, J, T = cube.attendance.shape
+    E = cube.evaluations.shape[2]
+    due = np.ceil((np.arange(E) + 1) * T / E).astype(int) - 1      # session after which evaluation e lands
+    for t in range(T):
+        ii, jj = np.nonzero(~np.isnan(cube.attendance[:, :, t]))
+        for i, j in zip(ii.tolist(), jj.tolist()):
+            yield {"matricula": cube.matriculas[i].item(), "materia": cube.subjects[j],
+                   "tipo": "asistencia", "valor": int(cube.attendance[i, j, t])}
+        for e in np.nonzero(due == t)[0]:
+            ii, jj = np.nonzero(~np.isnan(cube.evaluations[:, :, e]))
+            for i, j in zip(ii.tolist(), jj.tolist()):
+                yield {"matricula": cube.matriculas[i].item(), "materia": cube.subjects[j],
+                       "tipo": "evaluacion", "valor": float(cube.evaluations[i, j, e])}
+
+
+def follow(path, poll=0.5, idle_timeout=None):
+    """Tail an appended JSON-lines file (stops after idle_timeout seconds without new lines)."""
+    idle = 0.0
+    with open(path, encoding="utf-8") as f:
+        while True:
+            line = f.readline()
+            if line.endswith("\n"):
+                idle = 0.0
+                if line.strip():
+                    yield json.loads(line)
+                continue
+            f.seek(f.tell() - len(line))            # partial line: wait for the writer
+            if idle_timeout is not None and idle >= idle_timeout:
+                return
+            time.sleep(poll)
+            idle += poll
+
+
+def from_queue(q, sentinel=None):
+    """Events from a queue.Queue until `sentinel` is received."""
+    while True:
+        ev = q.get()
+        if ev is sentinel:
+            return
+        yield ev
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--replay", metavar="DIR", help="replay gen_asist_eval1 workbooks session by session")
+    src.add_argument("--follow", metavar="FILE", help="tail a JSON-lines event file")
+    ap.add_argument("--threshold", type=float, default=THRESHOLD)
+    ap.add_argument("--k", type=int, default=ROLLING_K)
+    ap.add_argument("--idle-timeout", type=float, default=None, help="stop following after N idle seconds")
+    args = ap.parse_args()
+
+    os.makedirs(OUT_DIR, exist_ok=True)
+    alerts_path = os.path.join(OUT_DIR, "alertas.jsonl")
+    out = open(alerts_path, "a", encoding="utf-8")
+
+    def on_alert(a):
+        print(f"⚠️  {a['matricula']} ({a['materia']}, sesión {a['sesion']}): riesgo {a['riesgo']:.2f}")
+        out.write(json.dumps(a, ensure_ascii=False) + "\n")
+        out.flush()
+
+    if args.replay:
+        cube = SessionCube.from_workbooks(args.replay)
+        scorer = StreamScorer(cube.matriculas.tolist(), cube.subjects, k=args.k, threshold=args.threshold)
+        events = replay(cube)
+    else:
+        scorer = StreamScorer(k=args.k, threshold=args.threshold)
+        events = follow(args.follow, idle_timeout=args.idle_timeout)
+
+    t0 = time.perf_counter()
+    try:
+        n = scorer.consume(events, on_alert)
+    except KeyboardInterrupt:
+        n = None
+    out.close()
+    dt = time.perf_counter() - t0
+    snap = scorer.snapshot()
+    snap.to_csv(os.path.join(OUT_DIR, "riesgo_stream.csv"), index=False)
+    if n:
+        print(f"{n:,} events in {dt:.2f}s ({n/dt:,.0f}/s); {int(snap['alerta'].sum())} students on alert")
+    print("✅ Saved:", alerts_path)
@@ -0,0 +1,168 @@
+# vector_export.py
+"""
+Compact vector export of risk choropleths (TopoJSON) for dashboards.
+
+- Geometry comes from the simplified levels in geo_layers, picked for a
+  typical web map size.
+- Coordinates are quantized to an integer grid (QUANTIZATION steps per axis)
+  and arcs are delta-encoded.
+- Borders shared by two polygons are stored once (topology): rings are cut
+  at junctions and each arc is referenced by index (~index when reversed).
+- Risk values ride along in each feature's properties, so the browser needs
+  one small file per layer instead of the GeoJSON plus a separate table.
+"""
+import os, json, gzip
+import numpy as np
+import shapely
+
+from geo_layers import load_simplified, name_column
+
+QUANTIZATION = 10_000
+WEB_FIGSIZE, WEB_DPI = (10, 10), 150   # detail level of a ~1500 px map
+
+
+class _Topology:
+    def __init__(self, bounds, q):
+        x0, y0, x1, y1 = bounds
+        self.x0, self.y0 = x0, y0
+        self.kx = (x1 - x0) / (q - 1) if x1 > x0 else 1.0
+        self.ky = (y1 - y0) / (q - 1) if y1 > y0 else 1.0
+        self.arcs = []
+        self._arc_ids = {}
+
+    def quantize(self, coords):
+        """Ring coords -> list of int points, no consecutive repeats, not closed."""
+        q = np.column_stack([np.round((coords[:, 0] - self.x0) / self.kx),
+                             np.round((coords[:, 1] - self.y0) / self.ky)]).astype(np.int64)
+        keep = np.ones(len(q), dtype=bool)
+        keep[1:] = np.any(q[1:] != q[:-1], axis=1)
+        q = q[keep]
+        if len(q) > 1 and (q[0] == q[-1]).all():
+            q = q[:-1]
+        return [tuple(p) for p in q.tolist()]
+
+    def arc_index(self, pts):
+        key = tuple(pts)
+        if key in self._arc_ids:
+            return self._arc_ids[key]
+        rkey = key[::-1]
+        if rkey in self._arc_ids:
+            return ~self._arc_ids[rkey]
+        self._arc_ids[key] = len(self.arcs)
+        self.arcs.append(pts)
+        return len(self.arcs) - 1
+
+    def encoded_arcs(self):
+        out = []
+        for pts in self.arcs:
+            a = np.asarray(pts, dtype=np.int64)
+            a[1:] = np.diff(a, axis=0)
+            out.append(a.tolist())
+        return out
+
+
+def _junctions(rings):
+    """Points whose neighbours differ between rings (where shared borders start/end)."""
+    seen, junctions = {}, set()
+    for ring in rings:
+        n = len(ring)
+        for i, p in enumerate(ring):
+            nb = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            prev = seen.setdefault(p, nb)
+            if prev != nb:
+                junctions.add(p)
+    return junctions
+
+
+def _ring_arcs(topo, ring, junctions):
+    cuts = [i for i, p in enumerate(ring) if p in junctions]
+    if not cuts:
+        # closed ring shared with nobody (or shared whole): canonical start
+        s = ring.index(min(ring))
+        r = ring[s:] + ring[:s]
+        return [topo.arc_index(r + [r[0]])]
+    r = ring[cuts[0]:] + ring[:cuts[0]]
+    cuts = [c - cuts[0] for c in cuts] + [len(ring)]
+    r = r + [r[0]]
+    return [topo.arc_index(r[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def _polygons(geom):
+    if geom is None or geom.is_empty:
+        return []
+    if geom.geom_type == "Polygon":
+        return [geom]
+    if geom.geom_type == "MultiPolygon":
+        return list(geom.geoms)
+    return [g for g in getattr(geom, "geoms", []) if g.geom_type == "Polygon"]
+
+
+def to_topojson(gdf, name, properties=(), quantization=QUANTIZATION, digits=4):
+    """TopoJSON dict with one GeometryCollection `name`; `properties` columns embedded."""
+    if gdf.crs is not None and not gdf.crs.is_geographic:
+        gdf = gdf.to_crs(4326)
+    topo = _Topology(gdf.total_bounds, quantization)
+
+    # quantize every ring first: junctions must be found on the final grid
+    shapes = []
+    for geom in gdf.geometry.values:
+        polys = []
+        for poly in _polygons(geom):
+            ext = topo.quantize(shapely.get_coordinates(poly.exterior))
+            if len(ext) < 3:       # collapsed below the grid size
+                continue
+            holes = [topo.quantize(shapely.get_coordinates(r)) for r in poly.interiors]
+            polys.append([ext] + [h for h in holes if len(h) >= 3])
+        shapes.append(polys)
+
+    junctions = _junctions(r for polys in shapes for rings in polys for r in rings)
+
+    geometries = []
+    props = gdf[list(properties)].to_dict("records") if properties else [{}] * len(gdf)
+    for fid, (polys, p) in enumerate(zip(shapes, props)):
+        p = {k: (round(float(v), digits) if isinstance(v, (float, np.floating)) and np.isfinite(v)
+                 else None if isinstance(v, (float, np.floating))
+                 else v.item() if isinstance(v, np.generic) else v)
+             for k, v in p.items()}
+        arcs = [[_ring_arcs(topo, r, junctions) for r in rings] for rings in polys]
+        if not arcs:
+            geometries.append({"type": None, "id": fid, "properties": p})
+        elif len(arcs) == 1:
+            geometries.append({"type": "Polygon", "id": fid, "arcs": arcs[0], "properties": p})
+        else:
+            geometries.append({"type": "MultiPolygon", "id": fid, "arcs": arcs, "properties": p})
+
+    return {
+        "type": "Topology",
+        "bbox": [float(v) for v in gdf.total_bounds],
+        "transform": {"scale": [topo.kx, topo.ky], "translate": [topo.x0, topo.y0]},
+        "objects": {name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": topo.encoded_arcs(),
+    }
+
+
+def write_topojson(path, topology, compress=False):
+    """Minified TopoJSON; `compress` also writes a pre-gzipped copy for static hosting."""
+    data = json.dumps(topology, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    tmp = path + ".part"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    if compress:
+        with gzip.open(path + ".gz", "wb", compresslevel=9) as f:
+            f.write(data)
+    return path
+
+
+def export_layer(layer, values, path, quantization=QUANTIZATION, compress=False):
+    """
+    Export `layer` with per-feature `values` ({prop: array aligned to features})
+    as TopoJSON at web resolution.
+    """
+    gdf = load_simplified(layer, figsize=WEB_FIGSIZE, dpi=WEB_DPI)
+    keep = [name_column(gdf, layer)]
+    gdf = gdf[keep + ["geometry"]].copy()
+    for k, v in values.items():
+        gdf[k] = np.asarray(v)
+    topo = to_topojson(gdf, layer, properties=keep + list(values), quantization=quantization)
+    return write_topojson(path, topo, compress=compress)